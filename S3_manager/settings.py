@@ -144,6 +144,117 @@ if os.environ.get('USE_S3', 'False') == 'True':
     AWS_S3_ADDRESSING_STYLE = 'virtual'
     AWS_S3_SIGNATURE_VERSION = 's3v4'
 
+# Настройки общего пула клиентов S3 (s3app.s3_client)
+S3_MAX_POOL_CONNECTIONS = int(os.environ.get('S3_MAX_POOL_CONNECTIONS', 50))  # Максимум HTTP-соединений в пуле
+S3_CONNECT_TIMEOUT = 5  # Таймаут установки соединения (секунды)
+S3_READ_TIMEOUT = 60  # Таймаут чтения ответа (секунды)
+S3_TCP_KEEPALIVE = True  # Keep-alive для TCP-соединений
+S3_MAX_RETRY_ATTEMPTS = 3  # Количество попыток запроса при временных ошибках
+
+# Режим пагинации в браузере файлов:
+# 'cursor' - из S3 читается только текущая страница (навигация по курсору),
+# 'full' - полный листинг папки с постраничным выводом через Paginator
+S3_BROWSER_PAGINATION = 'cursor'
+
+# Кэш листингов директорий (s3app.listing_cache). Работает только с общим кэш-бэкендом
+# (CACHES ниже): с кэшем в памяти процесса другие процессы не видят сброс записей
+S3_LISTING_CACHE_ENABLED = True
+S3_LISTING_CACHE_TIMEOUT = 60  # Время жизни записи (секунды)
+S3_LISTING_CACHE_MAX_ITEMS = 5000  # Папки с большим количеством элементов не кэшируются
+
+# Кэш прав доступа пользователей (s3app.permissions), сбрасывается при изменении прав.
+# Используется только с общим кэш-бэкендом (CACHES ниже), иначе права читаются раз за запрос
+S3_PERMISSION_CACHE_TIMEOUT = 300  # Время жизни записи (секунды)
+
+# Локальный индекс метаданных объектов (s3app.object_index).
+# Перед включением постройте индекс командой: python manage.py build_s3_index
+S3_OBJECT_INDEX_ENABLED = os.environ.get('S3_OBJECT_INDEX_ENABLED', 'False') == 'True'
+
+# Дерево папок для автозаполнения путей (s3app.folder_tree).
+# Обновляется операциями с папками; по истечении срока строится заново.
+S3_FOLDER_TREE_CACHE_TIMEOUT = 3600  # Время жизни дерева (секунды)
+# С кэшем в памяти процесса изменения папок из других процессов (воркеры веб-сервера,
+# воркер фоновых задач) не видны, поэтому дерево живет не дольше этого срока
+S3_FOLDER_TREE_LOCAL_CACHE_TIMEOUT = 60
+# Источник для построения дерева без индекса:
+# 'listing' - один листинг бакета без разделителя (выгоднее при небольшом числе объектов),
+# 'discovery' - параллельный обход папок (выгоднее при большом числе объектов на папку)
+S3_FOLDER_TREE_SOURCE = os.environ.get('S3_FOLDER_TREE_SOURCE', 'listing')
+S3_FOLDER_DISCOVERY_CONCURRENCY = 8  # Одновременных листингов при обходе папок
+S3_FOLDER_DISCOVERY_MAX_DEPTH = None  # Ограничение глубины обхода (None - без ограничения)
+
+# Массовое удаление объектов (s3app.bulk_ops): пачки DeleteObjects по 1000 ключей
+S3_DELETE_CONCURRENCY = 4  # Одновременно отправляемых пачек
+# Копирование папок на стороне сервера (перенос, корзина, восстановление)
+S3_COPY_CONCURRENCY = int(os.environ.get('S3_COPY_CONCURRENCY', 8))  # Одновременных копирований
+# Объекты больше порога копируются по частям (UploadPartCopy); одиночный CopyObject ограничен 5 ГБ
+S3_MULTIPART_COPY_THRESHOLD = 1024 ** 3  # 1 ГБ
+S3_MULTIPART_COPY_PART_SIZE = 256 * 1024 ** 2  # 256 МБ
+S3_MULTIPART_COPY_CONCURRENCY = 4  # Одновременно копируемых частей одного объекта
+
+# Фоновые задачи (s3app.jobs): перемещение/удаление папок и операции с корзиной
+# выполняются воркером: python manage.py run_s3_worker
+# Воркер - отдельный процесс, поэтому для согласованности кэшей (листинги, дерево папок,
+# права) CACHES должен указывать на общий кэш-бэкенд (см. DJANGO_CACHE_BACKEND ниже).
+S3_BACKGROUND_JOBS_ENABLED = os.environ.get('S3_BACKGROUND_JOBS_ENABLED', 'False') == 'True'
+S3_JOB_WORKER_CONCURRENCY = int(os.environ.get('S3_JOB_WORKER_CONCURRENCY', 2))  # Одновременных задач на воркер
+S3_JOB_POLL_INTERVAL = 2.0  # Интервал опроса очереди (секунды)
+S3_JOB_PROGRESS_INTERVAL = 1.0  # Как часто сохранять прогресс задачи (секунды)
+S3_JOB_HEARTBEAT_INTERVAL = 30  # Как часто выполняемая задача отмечает, что воркер жив (секунды)
+# Задачи без отметок дольше этого срока возвращаются в очередь (для воркеров этого хоста -
+# сразу после завершения их процесса); должен быть заметно больше S3_JOB_HEARTBEAT_INTERVAL
+S3_JOB_STALE_TIMEOUT = 600
+
+# Поток прогресса массовых операций (NDJSON, s3app.progress)
+S3_PROGRESS_STREAM_INTERVAL = 0.5  # Как часто отправлять клиенту снимок прогресса (секунды)
+S3_PROGRESS_HEARTBEAT_INTERVAL = 15  # Пустое событие, если прогресс не менялся (защита от таймаутов прокси)
+# Поток прогресса фоновой задачи занимает воркер веб-сервера: через этот срок (секунды)
+# он закрывается, и браузер дальше опрашивает состояние задачи
+S3_PROGRESS_STREAM_MAX_DURATION = 60
+
+# Журнал переноса папок (s3app.journal): прерванные операции продолжаются с контрольной точки
+# при повторном запуске или командой: python manage.py resume_s3_operations
+S3_JOURNAL_CHECKPOINT_INTERVAL = 2.0  # Как часто сохранять контрольную точку (секунды)
+S3_JOURNAL_HEARTBEAT_INTERVAL = 30  # Как часто выполняемая операция отмечает, что она активна (секунды)
+S3_JOURNAL_STALE_TIMEOUT = 300  # Операция без отметок активности дольше этого срока считается прерванной
+S3_JOURNAL_RESUME_WINDOW = 7 * 24 * 3600  # Более старые прерванные операции не продолжаются
+
+# Скачивание нескольких файлов архивом (s3app.zip_stream): архив отдается потоком,
+# объекты читаются из S3 блоками этого размера
+S3_ARCHIVE_CHUNK_SIZE = 1024 * 1024  # 1 МБ
+# Следующие файлы архива загружаются заранее, пока текущий пишется в архив
+S3_ARCHIVE_PREFETCH_CONCURRENCY = int(os.environ.get('S3_ARCHIVE_PREFETCH_CONCURRENCY', 4))  # Файлов одновременно
+S3_ARCHIVE_PREFETCH_MEMORY = 8 * 1024 * 1024  # Буфер файла в памяти; больше - во временном файле на диске
+S3_ARCHIVE_PREFETCH_MAX_OBJECT_SIZE = 256 * 1024 ** 2  # Файлы больше не загружаются заранее, а читаются потоком
+# Сжатие: 'fast' (deflate 1), 'balanced' (deflate 6) или 'max' (deflate 9); уже сжатые форматы
+# не сжимаются, файлы неизвестного типа с энтропией начала выше порога (бит на байт) - тоже
+S3_ARCHIVE_COMPRESSION_PRESET = os.environ.get('S3_ARCHIVE_COMPRESSION_PRESET', 'balanced')
+S3_ARCHIVE_ENTROPY_THRESHOLD = 7.5
+# Кэш готовых архивов (s3app.archive_cache): архивы сохраняются в __cache/archives/,
+# повторный запрос того же набора неизмененных файлов перенаправляется на готовый архив
+S3_ARCHIVE_CACHE_ENABLED = os.environ.get('S3_ARCHIVE_CACHE_ENABLED', 'False') == 'True'
+S3_ARCHIVE_CACHE_MAX_SIZE = 10 * 1024 ** 3  # 10 ГБ; сверх - удаляются давно не использованные архивы
+S3_ARCHIVE_CACHE_MAX_ENTRY_SIZE = 2 * 1024 ** 3  # Архивы больше не кэшируются
+S3_ARCHIVE_CACHE_TTL = 7 * 24 * 3600  # Архивы без обращений дольше этого срока удаляются
+S3_ARCHIVE_CACHE_PART_SIZE = 8 * 1024 ** 2  # Части загрузки архива в кэш (не меньше 5 МБ)
+S3_ARCHIVE_CACHE_LOOKUP_MAX_MEMBERS = 100  # Больше выбранных файлов - архив в кэше не ищется и не сохраняется
+S3_ARCHIVE_CACHE_FOLDER_MAX_AGE = 3600  # Архив папки выдается из кэша без проверки файлов не дольше (сек)
+
+# Корзина: 'copy' - объекты копируются в __trash/<id>/ и удаляются из исходной папки;
+# 'versioning' - на бакете с включенным версионированием удаление создает маркер удаления,
+# данные не копируются (s3app.versioned_trash). Без версионирования используется 'copy'.
+S3_TRASH_BACKEND = os.environ.get('S3_TRASH_BACKEND', 'copy')
+
+# Кэш Django. По умолчанию - локальная память процесса; при нескольких процессах
+# (несколько воркеров веб-сервера, воркер фоновых задач) укажите общий бэкенд,
+# например django.core.cache.backends.filebased.FileBasedCache или Redis.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('DJANGO_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('DJANGO_CACHE_LOCATION', ''),
+    }
+}
+
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 
 # Login & Logout URLs
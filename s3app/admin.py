@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import UserPermission, S3ActionLog, TrashItem
+from .models import UserPermission, S3ActionLog, TrashItem, BackgroundJob, OperationJournal, ArchiveCacheEntry
 
 
 @admin.register(UserPermission)
@@ -26,11 +26,51 @@ class S3ActionLogAdmin(admin.ModelAdmin):
 
 @admin.register(TrashItem)
 class TrashItemAdmin(admin.ModelAdmin):
-    list_display = ('object_type', 'original_path', 'deleted_by', 'deleted_at', 'expires_at', 'days_left')
-    list_filter = ('object_type', 'deleted_at', 'expires_at')
+    list_display = ('object_type', 'original_path', 'object_count', 'deleted_by', 'deleted_at', 'expires_at', 'days_left')
+    list_filter = ('object_type', 'backend', 'deleted_at', 'expires_at')
     search_fields = ('original_path', 'trash_path', 'deleted_by__username')
-    readonly_fields = ('original_path', 'trash_path', 'object_type', 'deleted_by', 'deleted_at', 'original_size', 'expires_at')
+    readonly_fields = ('original_path', 'trash_path', 'object_type', 'deleted_by', 'deleted_at', 'original_size', 'expires_at',
+                       'backend', 'versions', 'object_count')
     date_hierarchy = 'deleted_at'
 
     def has_add_permission(self, request):
-        return False
\ No newline at end of file
+        return False
+
+
+@admin.register(BackgroundJob)
+class BackgroundJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'job_type', 'status', 'user', 'created_at', 'started_at', 'finished_at')
+    list_filter = ('job_type', 'status', 'created_at')
+    search_fields = ('user__username', 'error')
+    readonly_fields = ('job_type', 'params', 'user', 'status', 'progress', 'result', 'error', 'worker',
+                       'created_at', 'started_at', 'finished_at', 'heartbeat_at')
+    date_hierarchy = 'created_at'
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(OperationJournal)
+class OperationJournalAdmin(admin.ModelAdmin):
+    list_display = ('id', 'operation', 'status', 'source_prefix', 'destination_prefix', 'copied_count', 'updated_at')
+    list_filter = ('operation', 'status', 'created_at')
+    search_fields = ('source_prefix', 'destination_prefix', 'user__username')
+    readonly_fields = ('operation', 'user', 'source_prefix', 'destination_prefix', 'params', 'status', 'checkpoint',
+                       'copied_count', 'copied_bytes', 'multipart_copies', 'error', 'created_at', 'updated_at', 'heartbeat_at',
+                       'finished_at')
+    date_hierarchy = 'created_at'
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(ArchiveCacheEntry)
+class ArchiveCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ('object_key', 'member_count', 'size', 'hit_count', 'created_at', 'last_accessed_at')
+    search_fields = ('object_key', 'fingerprint', 'paths')
+    readonly_fields = ('fingerprint', 'scope', 'object_key', 'size', 'member_count', 'paths', 'hit_count',
+                       'created_at', 'last_accessed_at')
+    date_hierarchy = 'created_at'
+
+    def has_add_permission(self, request):
+        return False
@@ -5,3 +5,9 @@ class S3AppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 's3app'
     verbose_name = 'S3 Менеджер'
+
+    def ready(self):
+        # Регистрация обработчиков сигналов
+        from . import signals  # noqa: F401
+        # Регистрация системных проверок
+        from . import shared_cache  # noqa: F401
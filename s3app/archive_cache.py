@@ -0,0 +1,311 @@
+"""
+Кэш готовых ZIP-архивов (модель ArchiveCacheEntry).
+
+Архив, который отдается клиенту потоком, одновременно загружается в бакет
+(multipart upload) в папку __cache/archives/. Ключ содержимого (Fingerprint)
+составляется по ходу записи архива из имен, ключей и ETag файлов и пресета
+сжатия; запись кэша сохраняется под ним после завершения потока, поэтому
+изменение любого файла дает новый ключ.
+
+До начала ответа архив ищется в кэше только там, где это дешево:
+- выбранные файлы - по ключу содержимого, если файлов не больше
+  S3_ARCHIVE_CACHE_LOOKUP_MAX_MEMBERS (ETag запрашиваются head_object);
+- папка - по области архива (scope: папки и пресет) без листинга, если архив
+  создан не раньше S3_ARCHIVE_CACHE_FOLDER_MAX_AGE секунд назад. Изменения
+  через приложение удаляют такие архивы сразу (invalidate_paths), изменения
+  в бакете в обход приложения учитываются по истечении этого срока.
+
+Размер кэша ограничен: давно не использованные архивы удаляются (LRU) при
+превышении S3_ARCHIVE_CACHE_MAX_SIZE и по истечении S3_ARCHIVE_CACHE_TTL.
+"""
+import datetime
+import functools
+import hashlib
+import logging
+import operator
+import uuid
+
+from botocore.exceptions import ClientError
+from django.conf import settings
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+from django.utils.http import content_disposition_header
+
+from . import bulk_ops, listing_cache
+from .models import ArchiveCacheEntry
+
+logger = logging.getLogger(__name__)
+
+CACHE_PREFIX = '__cache/archives/'
+
+
+def is_enabled():
+    return getattr(settings, 'S3_ARCHIVE_CACHE_ENABLED', False)
+
+
+def _max_size():
+    return getattr(settings, 'S3_ARCHIVE_CACHE_MAX_SIZE', 10 * 1024 ** 3)
+
+
+def _max_entry_size():
+    return getattr(settings, 'S3_ARCHIVE_CACHE_MAX_ENTRY_SIZE', 2 * 1024 ** 3)
+
+
+def _ttl():
+    return getattr(settings, 'S3_ARCHIVE_CACHE_TTL', 7 * 24 * 3600)
+
+
+def lookup_max_members():
+    return getattr(settings, 'S3_ARCHIVE_CACHE_LOOKUP_MAX_MEMBERS', 100)
+
+
+def _folder_max_age():
+    return getattr(settings, 'S3_ARCHIVE_CACHE_FOLDER_MAX_AGE', 3600)
+
+
+def _part_size():
+    # Части multipart upload, кроме последней, должны быть не меньше 5 МБ
+    return max(getattr(settings, 'S3_ARCHIVE_CACHE_PART_SIZE', 8 * 1024 ** 2), 5 * 1024 ** 2)
+
+
+def _paths_text(paths):
+    return '\n' + '\n'.join(paths) + '\n'
+
+
+class Fingerprint:
+    """Ключ содержимого архива: хэш пресета сжатия и имен, ключей и ETag файлов в порядке записи"""
+
+    def __init__(self, preset):
+        self._digest = hashlib.sha256(f"{preset}\n".encode('utf-8'))
+
+    def add(self, name, key, etag):
+        self._digest.update(f"{name}\0{key}\0{etag or ''}\n".encode('utf-8'))
+
+    def hexdigest(self):
+        return self._digest.hexdigest()
+
+
+def scope_key(preset, scope):
+    """Ключ области архива папки (см. S3Service.folder_archive) с учетом пресета сжатия"""
+    return hashlib.sha256(f"{preset}\n{scope}".encode('utf-8')).hexdigest()
+
+
+def lookup(s3_client, bucket_name, fingerprint=None, scope=None):
+    """Архив из кэша по ключу содержимого или по области архива папки, либо None.
+
+    По области выдается последний архив, созданный не раньше
+    S3_ARCHIVE_CACHE_FOLDER_MAX_AGE секунд назад. Если объект архива пропал
+    из бакета, запись удаляется.
+    """
+    if fingerprint is not None:
+        entry = ArchiveCacheEntry.objects.filter(fingerprint=fingerprint).first()
+    else:
+        created_after = timezone.now() - datetime.timedelta(seconds=_folder_max_age())
+        entry = ArchiveCacheEntry.objects.filter(
+            scope=scope, created_at__gte=created_after
+        ).order_by('-created_at').first()
+    if entry is None:
+        return None
+    try:
+        s3_client.head_object(Bucket=bucket_name, Key=entry.object_key)
+    except ClientError as e:
+        logger.warning(f"Cached archive {entry.object_key} is unavailable: {str(e)}")
+        entry.delete()
+        return None
+
+    ArchiveCacheEntry.objects.filter(id=entry.id).update(
+        hit_count=F('hit_count') + 1, last_accessed_at=timezone.now()
+    )
+    return entry
+
+
+def download_url(s3_client, bucket_name, entry, filename, expires_in=3600):
+    """Временная ссылка на архив из кэша, сохраняемый под именем filename"""
+    return s3_client.generate_presigned_url(
+        'get_object',
+        Params={
+            'Bucket': bucket_name,
+            'Key': entry.object_key,
+            'ResponseContentDisposition': content_disposition_header(True, filename),
+            'ResponseContentType': 'application/zip',
+        },
+        ExpiresIn=expires_in
+    )
+
+
+def store_while_streaming(s3_client, bucket_name, fingerprint, stream, paths, report, scope=''):
+    """Отдает части архива дальше и параллельно загружает архив в кэш.
+
+    Архив попадает в кэш, только если поток завершился полностью, все файлы
+    прочитаны (report['failed'] == 0) и размер не превышает
+    S3_ARCHIVE_CACHE_MAX_ENTRY_SIZE. Ключ содержимого известен только после
+    записи последнего файла, поэтому архив загружается под случайным именем,
+    а запись кэша создается в конце. При обрыве загрузки клиентом или ошибке
+    незавершенная загрузка в бакет отменяется.
+
+    Args:
+        fingerprint: Fingerprint, заполняемый S3Service.iter_archive_members
+        stream: генератор частей архива (zip_stream.stream_zip)
+        paths: ключи файлов и префиксы папок архива (для invalidate_paths)
+        report: словарь счетчиков, заполняемый S3Service.iter_archive_members
+        scope: ключ области архива папки (scope_key) или '' для выбранных файлов
+    """
+    object_key = f"{CACHE_PREFIX}{uuid.uuid4().hex}.zip"
+    part_size = _part_size()
+    upload_id = None
+    parts = []
+    buffer = bytearray()
+    size = 0
+
+    def upload_part():
+        response = s3_client.upload_part(
+            Bucket=bucket_name, Key=object_key, UploadId=upload_id,
+            PartNumber=len(parts) + 1, Body=bytes(buffer)
+        )
+        parts.append({'PartNumber': len(parts) + 1, 'ETag': response['ETag']})
+        buffer.clear()
+
+    def abort():
+        try:
+            s3_client.abort_multipart_upload(Bucket=bucket_name, Key=object_key, UploadId=upload_id)
+        except ClientError as e:
+            logger.error(f"Error aborting archive cache upload {object_key}: {str(e)}")
+
+    try:
+        upload_id = s3_client.create_multipart_upload(
+            Bucket=bucket_name, Key=object_key, ContentType='application/zip'
+        )['UploadId']
+    except ClientError as e:
+        logger.error(f"Error starting archive cache upload {object_key}: {str(e)}")
+
+    try:
+        for data in stream:
+            yield data
+            if upload_id is None:
+                continue
+            size += len(data)
+            buffer += data
+            try:
+                if size > _max_entry_size():
+                    # Слишком большой архив не кэшируется
+                    abort()
+                    upload_id = None
+                    buffer.clear()
+                elif len(buffer) >= part_size:
+                    upload_part()
+            except ClientError as e:
+                logger.error(f"Error uploading archive cache part {object_key}: {str(e)}")
+                abort()
+                upload_id = None
+                buffer.clear()
+
+        if upload_id is None:
+            return
+        if report.get('failed'):
+            abort()
+            return
+        try:
+            if buffer or not parts:
+                upload_part()
+            s3_client.complete_multipart_upload(
+                Bucket=bucket_name, Key=object_key, UploadId=upload_id, MultipartUpload={'Parts': parts}
+            )
+        except ClientError as e:
+            logger.error(f"Error completing archive cache upload {object_key}: {str(e)}")
+            abort()
+            return
+        upload_id = None
+
+        entry, created = ArchiveCacheEntry.objects.get_or_create(
+            fingerprint=fingerprint.hexdigest(),
+            defaults={
+                'object_key': object_key,
+                'scope': scope,
+                'size': size,
+                'member_count': report.get('archived', 0),
+                'paths': _paths_text(paths),
+                'last_accessed_at': timezone.now(),
+            }
+        )
+        if not created:
+            # Такой же архив уже сохранен параллельным запросом - копия не нужна
+            try:
+                s3_client.delete_object(Bucket=bucket_name, Key=object_key)
+            except ClientError as e:
+                logger.error(f"Error deleting duplicate cached archive {object_key}: {str(e)}")
+            ArchiveCacheEntry.objects.filter(id=entry.id).update(scope=scope, last_accessed_at=timezone.now())
+        if scope:
+            # Прежние архивы той же папки больше не выдаются
+            _delete_entries(s3_client, bucket_name,
+                            ArchiveCacheEntry.objects.filter(scope=scope).exclude(id=entry.id))
+        evict(s3_client, bucket_name)
+        listing_cache.invalidate_path(CACHE_PREFIX.rstrip('/'))
+    finally:
+        if upload_id is not None:
+            abort()
+
+
+def _delete_entries(s3_client, bucket_name, entries):
+    entries = list(entries)
+    if not entries:
+        return 0
+    result = bulk_ops.bulk_delete(s3_client, bucket_name, [entry.object_key for entry in entries])
+    for error in result['errors'][:10]:
+        logger.error(f"Error deleting cached archive {error['key']}: {error['code']} {error['message']}")
+    ArchiveCacheEntry.objects.filter(id__in=[entry.id for entry in entries]).delete()
+    listing_cache.invalidate_path(CACHE_PREFIX.rstrip('/'))
+    return len(entries)
+
+
+def evict(s3_client, bucket_name):
+    """Удаляет устаревшие архивы и давно не использованные сверх S3_ARCHIVE_CACHE_MAX_SIZE.
+
+    Returns:
+        int: количество удаленных архивов
+    """
+    expired_before = timezone.now() - datetime.timedelta(seconds=_ttl())
+    evicted = _delete_entries(
+        s3_client, bucket_name, ArchiveCacheEntry.objects.filter(last_accessed_at__lt=expired_before)
+    )
+
+    total = ArchiveCacheEntry.objects.aggregate(total=Sum('size'))['total'] or 0
+    excess = total - _max_size()
+    if excess <= 0:
+        return evicted
+
+    victims = []
+    for entry in ArchiveCacheEntry.objects.order_by('last_accessed_at').only('id', 'object_key', 'size'):
+        if excess <= 0:
+            break
+        victims.append(entry)
+        excess -= entry.size
+    return evicted + _delete_entries(s3_client, bucket_name, victims)
+
+
+def invalidate_paths(s3_client, bucket_name, paths):
+    """Удаляет архивы, в которые входят изменившиеся файлы или папки.
+
+    Args:
+        paths: ключи файлов или пути папок, которые изменены, удалены или перемещены
+
+    Returns:
+        int: количество удаленных архивов
+    """
+    if not is_enabled():
+        return 0
+
+    conditions = []
+    for path in filter(None, (path.strip('/') for path in paths)):
+        # Архив содержит сам файл или что-то внутри папки path
+        conditions.append(Q(paths__contains=f"\n{path}\n") | Q(paths__contains=f"\n{path}/"))
+        # Архив содержит папку, в которую входит path
+        parts = path.split('/')
+        for depth in range(1, len(parts)):
+            conditions.append(Q(paths__contains=f"\n{'/'.join(parts[:depth])}/\n"))
+    if not conditions:
+        return 0
+    # Архив всего хранилища (префикс '') затрагивает любое изменение
+    conditions.append(Q(paths__contains='\n\n'))
+
+    entries = ArchiveCacheEntry.objects.filter(functools.reduce(operator.or_, conditions))
+    return _delete_entries(s3_client, bucket_name, entries.only('id', 'object_key'))
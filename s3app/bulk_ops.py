@@ -0,0 +1,498 @@
+"""
+Массовые операции с объектами S3.
+
+Удаление выполняется запросами DeleteObjects по 1000 ключей (максимум S3),
+несколько пачек отправляются одновременно. Копирование папок выполняется
+на стороне сервера параллельно в пуле потоков; исходные объекты (при переносе)
+удаляются пачками и только после успешного копирования. Большие объекты
+копируются по частям (UploadPartCopy), части также копируются параллельно.
+
+Ключи принимаются в виде итератора (например, прямо из пагинатора листинга)
+и читаются по мере освобождения места в очереди задач, поэтому память
+не зависит от количества объектов.
+"""
+import math
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+
+from botocore.exceptions import ClientError
+from django.conf import settings
+
+# Максимальное количество ключей в одном запросе DeleteObjects
+DELETE_BATCH_SIZE = 1000
+
+# Ограничения S3 для составной загрузки: минимальный размер части и максимальное число частей
+MULTIPART_MIN_PART_SIZE = 5 * 1024 ** 2
+MULTIPART_MAX_PARTS = 10000
+
+
+def _delete_concurrency():
+    return getattr(settings, 'S3_DELETE_CONCURRENCY', 4)
+
+
+def copy_concurrency():
+    """Количество одновременных запросов копирования (S3_COPY_CONCURRENCY).
+
+    Используется и для других параллельных поштучных запросов к объектам (например, head_object).
+    """
+    return getattr(settings, 'S3_COPY_CONCURRENCY', 8)
+
+
+def _multipart_threshold():
+    return getattr(settings, 'S3_MULTIPART_COPY_THRESHOLD', 1024 ** 3)
+
+
+def _multipart_part_size():
+    return getattr(settings, 'S3_MULTIPART_COPY_PART_SIZE', 256 * 1024 ** 2)
+
+
+def _multipart_concurrency():
+    return getattr(settings, 'S3_MULTIPART_COPY_CONCURRENCY', 4)
+
+
+def iter_prefix_objects(s3_client, bucket_name, prefix, start_after=None):
+    """Отдает описания всех объектов с указанным префиксом (из листинга) по мере листинга.
+
+    Args:
+        start_after: ключ, после которого начинать листинг (ключи идут в лексикографическом порядке)
+    """
+    params = {'Bucket': bucket_name, 'Prefix': prefix}
+    if start_after:
+        params['StartAfter'] = start_after
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(**params):
+        yield from page.get('Contents', [])
+
+
+def iter_prefix_keys(s3_client, bucket_name, prefix):
+    """Отдает ключи всех объектов с указанным префиксом по мере листинга"""
+    for obj in iter_prefix_objects(s3_client, bucket_name, prefix):
+        yield obj['Key']
+
+
+def client_error_details(e):
+    """Код и сообщение ошибки S3 из ClientError"""
+    error = e.response.get('Error', {})
+    return error.get('Code', ''), error.get('Message', str(e))
+
+
+def _batches(keys, size):
+    iterator = iter(keys)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _delete_entry(key):
+    """Элемент запроса DeleteObjects: ключ или пара (ключ, версия)"""
+    if isinstance(key, tuple):
+        return {'Key': key[0], 'VersionId': key[1]}
+    return {'Key': key}
+
+
+def _delete_batch(s3_client, bucket_name, keys, markers=None):
+    """Удаляет одну пачку ключей.
+
+    Args:
+        keys: ключи или пары (ключ, версия) для удаления конкретных версий
+        markers: словарь, в который записываются версии созданных маркеров удаления
+                 (ключ -> версия маркера; только для бакетов с версионированием)
+
+    Returns:
+        tuple: (количество удаленных, список ошибок {'key', 'operation', 'code', 'message'})
+    """
+    try:
+        response = s3_client.delete_objects(
+            Bucket=bucket_name,
+            # Quiet: в ответе возвращаются только ошибки
+            Delete={'Objects': [_delete_entry(key) for key in keys], 'Quiet': markers is None}
+        )
+    except ClientError as e:
+        code, message = client_error_details(e)
+        errors = [{'key': _delete_entry(key)['Key'], 'operation': 'delete', 'code': code, 'message': message}
+                  for key in keys]
+        return 0, errors
+
+    if markers is not None:
+        for item in response.get('Deleted', []):
+            if item.get('DeleteMarker') and item.get('DeleteMarkerVersionId'):
+                markers[item['Key']] = item['DeleteMarkerVersionId']
+
+    errors = [
+        {'key': item.get('Key'), 'operation': 'delete', 'code': item.get('Code', ''), 'message': item.get('Message', '')}
+        for item in response.get('Errors', [])
+    ]
+    return len(keys) - len(errors), errors
+
+
+def bulk_delete(s3_client, bucket_name, keys, max_workers=None, progress_callback=None, collect_markers=False):
+    """Удаляет объекты пачками DeleteObjects с параллельной отправкой пачек.
+
+    Args:
+        s3_client: клиент S3
+        bucket_name: имя бакета
+        keys: итерируемый набор ключей или пар (ключ, версия) (может быть генератором)
+        max_workers: количество одновременно выполняемых пачек
+                     (по умолчанию S3_DELETE_CONCURRENCY)
+        progress_callback: функция, принимающая текущий результат; вызывается после каждой пачки
+        collect_markers: вернуть версии созданных маркеров удаления (бакет с версионированием)
+
+    Returns:
+        dict: {'deleted_count': количество удаленных объектов,
+               'errors': список ошибок по ключам {'key', 'operation', 'code', 'message'},
+               'markers': ключ -> версия маркера удаления (только при collect_markers)}
+    """
+    max_workers = max(1, max_workers or _delete_concurrency())
+    result = {'deleted_count': 0, 'errors': []}
+    markers = None
+    if collect_markers:
+        markers = result['markers'] = {}
+
+    def collect(futures):
+        for future in futures:
+            deleted_count, errors = future.result()
+            result['deleted_count'] += deleted_count
+            result['errors'].extend(errors)
+            if progress_callback:
+                progress_callback(result)
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='s3-bulk-delete') as executor:
+        pending = set()
+        for batch in _batches(keys, DELETE_BATCH_SIZE):
+            # Ограничиваем число пачек в очереди, чтобы не вычитывать все ключи в память
+            if len(pending) >= max_workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending.add(executor.submit(_delete_batch, s3_client, bucket_name, batch, markers))
+        collect(wait(pending).done)
+
+    return result
+
+
+def copy_object(s3_client, bucket_name, source_key, destination_key, size=None, head=None):
+    """Копирует объект внутри бакета на стороне сервера.
+
+    Объекты больше S3_MULTIPART_COPY_THRESHOLD копируются по частям (UploadPartCopy):
+    одиночный CopyObject ограничен 5 ГБ и не распараллеливается.
+
+    Args:
+        size: размер объекта, если известен из листинга
+        head: уже полученный ответ head_object для исходного объекта
+              (если не передан ни size, ни head, запрашивается head_object)
+
+    Returns:
+        int: размер скопированного объекта в байтах
+    """
+    if size is None and head is not None:
+        size = head.get('ContentLength', 0)
+    if size is None:
+        head = s3_client.head_object(Bucket=bucket_name, Key=source_key)
+        size = head.get('ContentLength', 0)
+
+    if size <= _multipart_threshold():
+        s3_client.copy_object(
+            Bucket=bucket_name,
+            CopySource=f"{bucket_name}/{source_key}",
+            Key=destination_key
+        )
+        return size
+
+    multipart_copy_object(s3_client, bucket_name, source_key, destination_key, size, head=head)
+    return size
+
+
+def _copy_part(s3_client, bucket_name, source_key, destination_key, upload_id, part_number, byte_range, etag):
+    response = s3_client.upload_part_copy(
+        Bucket=bucket_name,
+        Key=destination_key,
+        UploadId=upload_id,
+        PartNumber=part_number,
+        CopySource={'Bucket': bucket_name, 'Key': source_key},
+        CopySourceRange=f"bytes={byte_range[0]}-{byte_range[1]}",
+        # Защита от изменения исходного объекта во время копирования
+        CopySourceIfMatch=etag
+    )
+    return {'PartNumber': part_number, 'ETag': response['CopyPartResult']['ETag']}
+
+
+def multipart_copy_object(s3_client, bucket_name, source_key, destination_key, size, head=None):
+    """Копирует объект по частям (UploadPartCopy) с параллельным копированием частей.
+
+    Метаданные и тип содержимого переносятся с исходного объекта. При ошибке
+    незавершенная загрузка отменяется, чтобы ее части не занимали место в бакете.
+    """
+    if head is None:
+        head = s3_client.head_object(Bucket=bucket_name, Key=source_key)
+
+    extra_args = {}
+    for field in ('ContentType', 'Metadata', 'CacheControl', 'ContentDisposition', 'ContentEncoding', 'ContentLanguage'):
+        if head.get(field):
+            extra_args[field] = head[field]
+
+    # Размер части: не меньше минимального для S3 и такой, чтобы частей было не больше 10000
+    part_size = max(_multipart_part_size(), MULTIPART_MIN_PART_SIZE, math.ceil(size / MULTIPART_MAX_PARTS))
+    byte_ranges = [(start, min(start + part_size, size) - 1) for start in range(0, size, part_size)]
+
+    upload_id = s3_client.create_multipart_upload(
+        Bucket=bucket_name, Key=destination_key, **extra_args
+    )['UploadId']
+
+    executor = ThreadPoolExecutor(
+        max_workers=max(1, min(_multipart_concurrency(), len(byte_ranges))),
+        thread_name_prefix='s3-part-copy'
+    )
+    try:
+        futures = [
+            executor.submit(_copy_part, s3_client, bucket_name, source_key, destination_key,
+                            upload_id, part_number, byte_range, head.get('ETag'))
+            for part_number, byte_range in enumerate(byte_ranges, start=1)
+        ]
+        parts = [future.result() for future in futures]
+        s3_client.complete_multipart_upload(
+            Bucket=bucket_name,
+            Key=destination_key,
+            UploadId=upload_id,
+            MultipartUpload={'Parts': parts}
+        )
+    except Exception:
+        executor.shutdown(wait=True, cancel_futures=True)
+        try:
+            s3_client.abort_multipart_upload(Bucket=bucket_name, Key=destination_key, UploadId=upload_id)
+        except ClientError as e:
+            print(f"Error aborting multipart copy of {source_key}: {str(e)}")
+        raise
+    finally:
+        executor.shutdown(wait=False)
+
+
+def _copy_one(s3_client, bucket_name, source_key, destination_key, size):
+    """Копирует один объект.
+
+    Returns:
+        tuple: (описание ошибки или None, размер объекта)
+    """
+    try:
+        size = copy_object(s3_client, bucket_name, source_key, destination_key, size=size)
+    except ClientError as e:
+        code, message = client_error_details(e)
+        return {'key': source_key, 'operation': 'copy', 'code': code, 'message': message}, size
+    return None, size
+
+
+def _is_multipart_copy(size):
+    """Копируется ли объект такого размера по частям (см. copy_object)"""
+    return size is not None and size > _multipart_threshold()
+
+
+def _same_object(source, destination, known_copies=None):
+    """Совпадает ли объект назначения с исходным.
+
+    Сравниваются размер и ETag. У объекта, скопированного по частям, ETag назначения
+    отличается от исходного, поэтому для него достаточно совпадения размера и записи
+    в known_copies (ключ источника -> ETag источника на момент копирования).
+    """
+    if destination is None or destination.get('Size') != source.get('Size'):
+        return False
+    if destination.get('ETag') == source.get('ETag'):
+        return True
+    return known_copies is not None and known_copies.get(source['Key']) == source.get('ETag')
+
+
+def _with_destinations(s3_client, bucket_name, objects, source_prefix, destination_prefix, start_after=None):
+    """Сопоставляет исходные объекты с уже существующими объектами назначения.
+
+    Ключ назначения отличается от исходного только префиксом, поэтому оба листинга
+    идут в одном порядке и сопоставляются слиянием, без запроса на каждый ключ.
+
+    Yields:
+        tuple: (исходный объект, объект назначения или None)
+    """
+    destination_start = None
+    if start_after and start_after.startswith(source_prefix):
+        destination_start = destination_prefix + start_after[len(source_prefix):]
+    destinations = iter_prefix_objects(s3_client, bucket_name, destination_prefix, start_after=destination_start)
+    current = next(destinations, None)
+
+    for obj in objects:
+        suffix = obj['Key'][len(source_prefix):]
+        while current is not None and current['Key'][len(destination_prefix):] < suffix:
+            current = next(destinations, None)
+        if current is not None and current['Key'][len(destination_prefix):] == suffix:
+            yield obj, current
+        else:
+            yield obj, None
+
+
+def copy_prefix(s3_client, bucket_name, source_prefix, destination_prefix, objects=None,
+                delete_source=False, max_workers=None, progress_callback=None,
+                start_after=None, skip_existing=False, checkpoint_callback=None,
+                known_copies=None, multipart_callback=None):
+    """Копирует все объекты префикса под новый префикс с параллельным копированием.
+
+    Ключ назначения - destination_prefix + часть ключа после source_prefix.
+    При delete_source=True исходные объекты удаляются пачками DeleteObjects,
+    причем только те, копирование которых завершилось успешно.
+
+    Args:
+        s3_client: клиент S3
+        bucket_name: имя бакета
+        source_prefix: исходный префикс (обычно путь папки с '/' на конце)
+        destination_prefix: префикс назначения
+        objects: итерируемый набор описаний объектов {'Key', 'Size'} из листинга
+                 (по умолчанию - все объекты source_prefix); если размер не указан,
+                 он запрашивается при копировании и записывается в описание объекта
+        delete_source: удалять ли исходные объекты после копирования (перенос)
+        max_workers: количество одновременных операций (по умолчанию S3_COPY_CONCURRENCY)
+        progress_callback: функция, принимающая текущий результат; вызывается по мере выполнения
+        start_after: ключ, после которого начинать листинг source_prefix (продолжение операции)
+        skip_existing: не копировать объекты, которые уже есть в назначении с тем же ETag и размером
+                       (такие объекты считаются скопированными; при переносе исходные удаляются)
+        checkpoint_callback: функция (ключ, результат), вызываемая при продвижении контрольной точки -
+                             последнего ключа, до которого включительно все объекты обработаны
+                             (скопированы и, при переносе, удалены)
+        known_copies: объекты, ранее скопированные по частям (ключ источника -> ETag источника);
+                      при skip_existing они пропускаются по размеру, т.к. ETag назначения другой
+        multipart_callback: функция (объект), вызываемая после копирования объекта по частям -
+                            чтобы запомнить его для known_copies при продолжении операции
+
+    Returns:
+        dict: {'copied_count', 'copied_bytes', 'skipped_count', 'deleted_count',
+               'completed_count', 'completed_bytes' - полностью обработанные объекты
+               (скопированы и, при переносе, удалены из источника),
+               'errors': список ошибок {'key', 'operation', 'code', 'message'}}
+    """
+    if objects is None:
+        objects = iter_prefix_objects(s3_client, bucket_name, source_prefix, start_after=start_after)
+    if skip_existing:
+        pairs = _with_destinations(s3_client, bucket_name, objects, source_prefix, destination_prefix, start_after)
+    else:
+        pairs = ((obj, None) for obj in objects)
+    max_workers = max(1, max_workers or copy_concurrency())
+    result = {
+        'copied_count': 0, 'copied_bytes': 0, 'skipped_count': 0, 'deleted_count': 0,
+        'completed_count': 0, 'completed_bytes': 0, 'errors': []
+    }
+    delete_batch = []
+
+    # Ключи в порядке листинга, обработка которых не завершена: ключ -> завершен ли он.
+    # Контрольная точка продвигается по завершенным ключам в начале очереди;
+    # ключ с ошибкой останавливает ее до конца операции.
+    outstanding = OrderedDict()
+    checkpoint_blocked = checkpoint_callback is None
+
+    def track(key):
+        if not checkpoint_blocked:
+            outstanding[key] = False
+
+    def finish(obj, success=True):
+        nonlocal checkpoint_blocked
+        if success:
+            result['completed_count'] += 1
+            result['completed_bytes'] += obj.get('Size', 0)
+        if checkpoint_blocked:
+            return
+        if not success:
+            checkpoint_blocked = True
+            outstanding.clear()
+        elif obj['Key'] in outstanding:
+            outstanding[obj['Key']] = True
+
+    def advance_checkpoint():
+        checkpoint = None
+        while outstanding:
+            key, done = next(iter(outstanding.items()))
+            if not done:
+                break
+            outstanding.popitem(last=False)
+            checkpoint = key
+        if checkpoint is not None:
+            checkpoint_callback(checkpoint, result)
+
+    def copied(obj):
+        result['copied_count'] += 1
+        result['copied_bytes'] += obj.get('Size', 0)
+        if delete_source:
+            delete_batch.append(obj)
+            if len(delete_batch) >= DELETE_BATCH_SIZE:
+                submit_delete()
+        else:
+            finish(obj)
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='s3-copy') as executor:
+        pending = {}
+
+        def submit_delete():
+            keys = [obj['Key'] for obj in delete_batch]
+            pending[executor.submit(_delete_batch, s3_client, bucket_name, keys)] = ('delete', list(delete_batch))
+            delete_batch.clear()
+
+        def drain():
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                operation, payload = pending.pop(future)
+                if operation == 'copy':
+                    error, size = future.result()
+                    if payload.get('Size') is None:
+                        payload['Size'] = size
+                    if error:
+                        result['errors'].append(error)
+                        finish(payload, success=False)
+                    else:
+                        if multipart_callback and _is_multipart_copy(payload['Size']):
+                            multipart_callback(payload)
+                        copied(payload)
+                else:
+                    deleted_count, errors = future.result()
+                    result['deleted_count'] += deleted_count
+                    result['errors'].extend(errors)
+                    failed_keys = {error['key'] for error in errors}
+                    for obj in payload:
+                        finish(obj, success=obj['Key'] not in failed_keys)
+            if not checkpoint_blocked:
+                advance_checkpoint()
+            if progress_callback:
+                progress_callback(result)
+
+        for obj, existing in pairs:
+            # Ограничение очереди: новые ключи читаются из листинга только по мере освобождения места
+            while len(pending) >= max_workers * 2:
+                drain()
+            source_key = obj['Key']
+            track(source_key)
+            if skip_existing and _same_object(obj, existing, known_copies):
+                # Объект уже скопирован (например, до прерывания операции)
+                result['skipped_count'] += 1
+                copied(obj)
+                continue
+            destination_key = destination_prefix + source_key[len(source_prefix):]
+            future = executor.submit(_copy_one, s3_client, bucket_name, source_key, destination_key, obj.get('Size'))
+            pending[future] = ('copy', obj)
+
+        while pending:
+            drain()
+        if delete_batch:
+            submit_delete()
+            while pending:
+                drain()
+
+    if not checkpoint_blocked:
+        advance_checkpoint()
+    if progress_callback:
+        progress_callback(result)
+    return result
+
+
+def errors_to_client_error(errors, operation_name):
+    """Формирует ClientError с описанием ошибок массовой операции"""
+    first_error = errors[0]
+    return ClientError(
+        {'Error': {
+            'Code': first_error['code'],
+            'Message': f"Не удалось обработать объектов: {len(errors)} "
+                       f"(первая ошибка: {first_error['key']} - {first_error['message']})",
+        }},
+        operation_name
+    )
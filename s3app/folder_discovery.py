@@ -0,0 +1,75 @@
+"""
+Параллельный обход папок бакета в ширину.
+
+Каждая папка листингуется запросом list_objects_v2 с разделителем '/',
+найденные подпапки сразу отдаются вызывающему коду и ставятся в очередь
+на листинг. Листинги соседних папок выполняются одновременно в пуле потоков
+общим клиентом S3, поэтому общее время обхода определяется глубиной дерева,
+а не суммой задержек по всем папкам.
+"""
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+
+
+def _concurrency():
+    return getattr(settings, 'S3_FOLDER_DISCOVERY_CONCURRENCY', 8)
+
+
+def _max_depth():
+    return getattr(settings, 'S3_FOLDER_DISCOVERY_MAX_DEPTH', None)
+
+
+def _list_subfolders(s3_client, bucket_name, parent_path):
+    """Возвращает пути непосредственных подпапок папки parent_path"""
+    prefix = parent_path + '/' if parent_path else ''
+    subfolders = []
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix, Delimiter='/'):
+        for common_prefix in page.get('CommonPrefixes', []):
+            sub_path = common_prefix['Prefix'].rstrip('/')
+            # Пропускаем саму папку и пустые сегменты вида 'a//'
+            if sub_path and sub_path != parent_path:
+                subfolders.append(sub_path)
+    return subfolders
+
+
+def discover_folders(s3_client, bucket_name, root='', max_workers=None, max_depth=None):
+    """Обходит папки внутри root в ширину и отдает их по мере обнаружения.
+
+    Args:
+        s3_client: клиент S3 (используется из нескольких потоков)
+        bucket_name: имя бакета
+        root: путь папки, с которой начинается обход ('' - корень бакета)
+        max_workers: максимальное количество одновременных листингов
+                     (по умолчанию S3_FOLDER_DISCOVERY_CONCURRENCY)
+        max_depth: максимальная глубина относительно root, 1 - только непосредственные подпапки
+                   (по умолчанию S3_FOLDER_DISCOVERY_MAX_DEPTH, None - без ограничения)
+
+    Yields:
+        str: путь найденной папки (без слеша на конце)
+    """
+    root = '/'.join(filter(None, (root or '').split('/')))
+    max_workers = max(1, max_workers or _concurrency())
+    if max_depth is None:
+        max_depth = _max_depth()
+    if max_depth is not None and max_depth < 1:
+        return
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='s3-folder-discovery') as executor:
+        pending = {executor.submit(_list_subfolders, s3_client, bucket_name, root): 1}
+        try:
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    depth = pending.pop(future)
+                    # Ошибка листинга любой папки прерывает обход: неполное дерево
+                    # не должно выдаваться за полное
+                    for sub_path in future.result():
+                        yield sub_path
+                        if max_depth is None or depth < max_depth:
+                            pending[executor.submit(_list_subfolders, s3_client, bucket_name, sub_path)] = depth + 1
+        finally:
+            # Обход прерван (ошибка или вызывающий код перестал читать) - не запускаем оставшиеся листинги
+            for future in pending:
+                future.cancel()
@@ -0,0 +1,307 @@
+"""
+Кэшированное дерево папок бакета для автозаполнения путей.
+
+Дерево хранится как отсортированный список путей папок. Для поиска строится
+отсортированный индекс окончаний путей, начинающихся с границы сегмента
+('a/reports/2024' -> 'a/reports/2024', 'reports/2024', '2024'): совпадения
+с началом пути или сегмента находятся бинарным поиском, совпадения в середине
+сегмента добираются проходом по списку, только если первых не хватило. Список лежит в кэш-бэкенде Django (общий для процессов)
+и дублируется в памяти процесса; операции с папками обновляют его точечно,
+без повторного построения по листингу S3.
+
+Дерево в памяти процесса не изменяется на месте: обновление применяется к копии,
+которая затем заменяет ссылку, поэтому поиск в других потоках не видит
+частично измененный список. С кэшем в памяти процесса (shared_cache.is_shared)
+изменения из других процессов не видны, поэтому дерево живет не дольше
+S3_FOLDER_TREE_LOCAL_CACHE_TIMEOUT.
+
+Дерево строится (полный листинг бакета) без блокировки, поэтому операции
+с папками в это время не ждут; изменения, пришедшие во время построения,
+применяются к построенному дереву перед его сохранением.
+"""
+import bisect
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import shared_cache
+
+DATA_CACHE_KEY = 's3_folder_tree:data'
+VERSION_CACHE_KEY = 's3_folder_tree:version'
+# Время, когда дерево нужно построить заново; обновления папок его не продлевают
+EXPIRES_CACHE_KEY = 's3_folder_tree:expires'
+
+_local_lock = threading.RLock()
+# build - текущее построение дерева в этом процессе: {'done': Event, 'pending': изменения, 'tree', 'stale'}
+_local = {'version': None, 'tree': None, 'build': None}
+
+
+def _timeout():
+    timeout = getattr(settings, 'S3_FOLDER_TREE_CACHE_TIMEOUT', 3600)
+    if not shared_cache.is_shared():
+        return min(timeout, getattr(settings, 'S3_FOLDER_TREE_LOCAL_CACHE_TIMEOUT', 60))
+    return timeout
+
+
+def _normalize(path):
+    return '/'.join(filter(None, (path or '').split('/')))
+
+
+def _ancestors(path):
+    """Возвращает путь и всех его предков: 'a/b/c' -> ['a', 'a/b', 'a/b/c']"""
+    parts = path.split('/')
+    return ['/'.join(parts[:i]) for i in range(1, len(parts) + 1)]
+
+
+class FolderTree:
+    """Отсортированный список путей папок с быстрым поиском"""
+
+    def __init__(self, folders):
+        self.folders = sorted(set(folders) | {''})
+        self._folders_lower = None
+        self._suffixes = None
+
+    def _lower(self):
+        if self._folders_lower is None:
+            self._folders_lower = [folder.lower() for folder in self.folders]
+        return self._folders_lower
+
+    def _suffix_index(self):
+        """Отсортированные пары (окончание пути с границы сегмента в нижнем регистре, путь)"""
+        if self._suffixes is None:
+            suffixes = []
+            for folder, folder_lower in zip(self.folders, self._lower()):
+                start = 0
+                while folder:
+                    suffixes.append((folder_lower[start:], folder))
+                    start = folder_lower.find('/', start) + 1
+                    if not start:
+                        break
+            suffixes.sort()
+            self._suffixes = suffixes
+        return self._suffixes
+
+    def _changed(self):
+        self._folders_lower = None
+        self._suffixes = None
+
+    def _subtree_bounds(self, path):
+        """Границы среза вложенных папок path (без самой папки) в отсортированном списке"""
+        # Все потомки начинаются с 'path/' и лежат в диапазоне ['path/', 'path0')
+        start = bisect.bisect_left(self.folders, path + '/')
+        end = bisect.bisect_left(self.folders, path + chr(ord('/') + 1))
+        return start, end
+
+    def search(self, term, limit=10):
+        """Поиск папок, путь которых содержит term (без учета регистра).
+
+        Первыми идут папки, у которых term - начало пути или одного из сегментов.
+        """
+        term_lower = term.lower()
+        if not term_lower:
+            return self.folders[:limit]
+
+        result = []
+        found = set()
+        suffixes = self._suffix_index()
+        index = bisect.bisect_left(suffixes, (term_lower,))
+        while index < len(suffixes) and len(result) < limit and suffixes[index][0].startswith(term_lower):
+            folder = suffixes[index][1]
+            if folder not in found:
+                found.add(folder)
+                result.append(folder)
+            index += 1
+        if len(result) >= limit:
+            return result
+
+        # Совпадения в середине сегмента
+        for folder, folder_lower in zip(self.folders, self._lower()):
+            if term_lower in folder_lower and folder not in found:
+                result.append(folder)
+                if len(result) >= limit:
+                    break
+        return result
+
+    def add(self, path):
+        """Добавляет папку и всех ее предков"""
+        path = _normalize(path)
+        if not path:
+            return
+        for folder in _ancestors(path):
+            index = bisect.bisect_left(self.folders, folder)
+            if index >= len(self.folders) or self.folders[index] != folder:
+                self.folders.insert(index, folder)
+        self._changed()
+
+    def remove(self, path):
+        """Удаляет папку вместе со всеми вложенными папками.
+
+        Returns:
+            list: удаленные пути
+        """
+        path = _normalize(path)
+        if not path:
+            return []
+        start, end = self._subtree_bounds(path)
+        removed = self.folders[start:end]
+        del self.folders[start:end]
+        index = bisect.bisect_left(self.folders, path)
+        if index < len(self.folders) and self.folders[index] == path:
+            del self.folders[index]
+            removed.insert(0, path)
+        self._changed()
+        return removed
+
+    def move(self, source_path, destination_path):
+        """Переносит папку со всеми вложенными папками под новый путь"""
+        source_path = _normalize(source_path)
+        destination_path = _normalize(destination_path)
+        removed = self.remove(source_path)
+        self.add(destination_path)
+        for folder in removed:
+            self.add(destination_path + folder[len(source_path):])
+
+
+def get_tree(loader):
+    """Возвращает дерево папок, при необходимости построив его.
+
+    Одновременно дерево строит один поток процесса, остальные ждут результата.
+
+    Args:
+        loader: функция без аргументов, возвращающая итерируемый набор путей папок
+    """
+    while True:
+        with _local_lock:
+            version = cache.get(VERSION_CACHE_KEY)
+            if version is not None and _local['version'] == version and _local['tree'] is not None:
+                return _local['tree']
+
+            folders = cache.get(DATA_CACHE_KEY) if version is not None else None
+            if folders is not None:
+                tree = FolderTree(folders)
+                _local['version'] = version
+                _local['tree'] = tree
+                return tree
+
+            build = _local['build']
+            if build is None:
+                build = _local['build'] = {'done': threading.Event(), 'pending': [], 'tree': None, 'stale': False}
+                break
+
+        build['done'].wait()
+        if build['tree'] is not None:
+            return build['tree']
+        # Построение в другом потоке завершилось ошибкой - пробуем сами
+
+    try:
+        tree = FolderTree(loader())
+        with _local_lock:
+            # Изменения папок, пришедшие во время листинга
+            for mutator in build['pending']:
+                mutator(tree)
+            build['tree'] = tree
+            if not build['stale']:
+                version = time.time_ns()
+                _store(tree, version, time.time() + _timeout())
+                _local['version'] = version
+                _local['tree'] = tree
+        return tree
+    finally:
+        with _local_lock:
+            _local['build'] = None
+        build['done'].set()
+
+
+def _store(tree, version, expires_at):
+    timeout = max(1, int(expires_at - time.time()))
+    cache.set_many({DATA_CACHE_KEY: tree.folders, VERSION_CACHE_KEY: version, EXPIRES_CACHE_KEY: expires_at}, timeout)
+
+
+def _update(mutator):
+    """Применяет изменение к закэшированному дереву (если оно уже построено)"""
+    with _local_lock:
+        state = cache.get_many([VERSION_CACHE_KEY, EXPIRES_CACHE_KEY])
+        version = state.get(VERSION_CACHE_KEY)
+        expires_at = state.get(EXPIRES_CACHE_KEY)
+        if version is None or expires_at is None:
+            # Дерево еще не построено или истекло - построится при следующем запросе
+            _local['version'] = None
+            _local['tree'] = None
+            if _local['build'] is not None:
+                _local['build']['pending'].append(mutator)
+            return
+        if _local['version'] == version and _local['tree'] is not None:
+            # Копия: текущее дерево может читаться другими потоками без блокировки
+            tree = FolderTree(_local['tree'].folders)
+        else:
+            folders = cache.get(DATA_CACHE_KEY)
+            if folders is None:
+                _local['version'] = None
+                _local['tree'] = None
+                if _local['build'] is not None:
+                    _local['build']['pending'].append(mutator)
+                return
+            tree = FolderTree(folders)
+
+        mutator(tree)
+        new_version = time.time_ns()
+        _store(tree, new_version, expires_at)
+        _local['version'] = new_version
+        _local['tree'] = tree
+
+
+def add_folder(path):
+    """Регистрирует новую папку (и ее предков) в дереве"""
+    if _normalize(path):
+        _update(lambda tree: tree.add(path))
+
+
+def add_folders(paths):
+    """Регистрирует несколько папок (и их предков) в дереве за одно обновление"""
+    paths = [path for path in paths if _normalize(path)]
+    if not paths:
+        return
+
+    def add_all(tree):
+        for path in paths:
+            tree.add(path)
+
+    _update(add_all)
+
+
+def remove_folder(path):
+    """Удаляет папку со всеми вложенными папками из дерева"""
+    if _normalize(path):
+        _update(lambda tree: tree.remove(path))
+
+
+def remove_folders(paths):
+    """Удаляет несколько папок со всеми вложенными папками из дерева за одно обновление"""
+    paths = [path for path in paths if _normalize(path)]
+    if not paths:
+        return
+
+    def remove_all(tree):
+        for path in paths:
+            tree.remove(path)
+
+    _update(remove_all)
+
+
+def move_folder(source_path, destination_path):
+    """Переносит папку со всеми вложенными папками в дереве"""
+    if _normalize(source_path) and _normalize(destination_path):
+        _update(lambda tree: tree.move(source_path, destination_path))
+
+
+def invalidate():
+    """Сбрасывает дерево; оно будет построено заново при следующем запросе"""
+    with _local_lock:
+        cache.delete_many([DATA_CACHE_KEY, VERSION_CACHE_KEY, EXPIRES_CACHE_KEY])
+        _local['version'] = None
+        _local['tree'] = None
+        if _local['build'] is not None:
+            # Листинг текущего построения мог начаться до изменений - его дерево не сохраняется
+            _local['build']['stale'] = True
@@ -0,0 +1,43 @@
+"""
+Отметка активности длительной операции в базе данных.
+
+Фоновые задачи и журналы операций считаются прерванными, если их запись долго
+не обновлялась. Прогресс и контрольная точка могут не меняться минутами
+(например, при копировании одного большого объекта по частям), поэтому время
+последней активности записывается отдельным потоком по таймеру.
+"""
+import threading
+
+from django.db import connection
+from django.utils import timezone
+
+
+class Heartbeat:
+    """Контекстный менеджер: пока он активен, поток раз в interval секунд
+    записывает текущее время в поле field записей queryset"""
+
+    def __init__(self, queryset, field, interval, name='s3-heartbeat'):
+        self.queryset = queryset
+        self.field = field
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        try:
+            while not self._stopped.wait(self.interval):
+                try:
+                    self.queryset.update(**{self.field: timezone.now()})
+                except Exception as e:
+                    print(f"Error updating {self.queryset.model.__name__}.{self.field}: {str(e)}")
+        finally:
+            # У потока свое соединение с базой - закрываем его
+            connection.close()
@@ -0,0 +1,290 @@
+"""
+Очередь фоновых задач на основе базы данных (модель BackgroundJob).
+
+Представления ставят длительные операции в очередь (enqueue) и сразу возвращают
+номер задачи; задачи выполняет команда run_s3_worker. Обработчик задачи
+вызывает соответствующий метод S3Service от имени пользователя, поставившего
+задачу, поэтому права доступа проверяются так же, как при синхронном вызове.
+
+Пока задача выполняется, отдельный поток раз в S3_JOB_HEARTBEAT_INTERVAL секунд
+обновляет heartbeat_at - независимо от прогресса, который может долго не
+меняться (например, при копировании одного большого объекта). Задача без
+обновлений дольше S3_JOB_STALE_TIMEOUT или задача, процесс воркера которой
+завершился, возвращается в очередь (requeue_stale_jobs).
+"""
+import datetime
+import os
+import socket
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import PermissionDenied
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .heartbeat import Heartbeat
+from .models import BackgroundJob
+from .progress import add_rates, progress_from_result
+from .s3_service import S3Service
+
+# Обработчики задач по типу: функция (job, user, progress_callback) -> dict результата
+JOB_HANDLERS = {}
+
+
+def register(job_type):
+    """Регистрирует обработчик задач указанного типа"""
+    def decorator(func):
+        JOB_HANDLERS[job_type] = func
+        return func
+    return decorator
+
+
+def jobs_enabled():
+    """Выполнять ли длительные операции в фоне (настройка S3_BACKGROUND_JOBS_ENABLED)"""
+    return getattr(settings, 'S3_BACKGROUND_JOBS_ENABLED', False)
+
+
+def _progress_interval():
+    return getattr(settings, 'S3_JOB_PROGRESS_INTERVAL', 1.0)
+
+
+def _stale_timeout():
+    return getattr(settings, 'S3_JOB_STALE_TIMEOUT', 600)
+
+
+def _heartbeat_interval():
+    return getattr(settings, 'S3_JOB_HEARTBEAT_INTERVAL', 30)
+
+
+# Отличает процесс воркера от прежнего процесса с тем же PID (например, после перезапуска контейнера)
+_PROCESS_TOKEN = uuid.uuid4().hex[:8]
+
+
+def worker_id():
+    """Идентификатор текущего воркера: хост, процесс и поток"""
+    return f"{socket.gethostname()}:{os.getpid()}:{_PROCESS_TOKEN}:{threading.get_ident()}"
+
+
+def enqueue(job_type, user, **params):
+    """Ставит задачу в очередь.
+
+    Returns:
+        BackgroundJob: созданная задача
+    """
+    if job_type not in JOB_HANDLERS:
+        raise ValueError(f"Неизвестный тип задачи: {job_type}")
+    return BackgroundJob.objects.create(
+        job_type=job_type,
+        user=user if user is not None and user.is_authenticated else None,
+        params=params,
+    )
+
+
+def claim_next_job():
+    """Захватывает самую старую задачу из очереди.
+
+    Захват выполняется условным обновлением статуса, поэтому несколько
+    воркеров не могут взять одну и ту же задачу.
+
+    Returns:
+        BackgroundJob или None, если очередь пуста
+    """
+    while True:
+        job = BackgroundJob.objects.filter(status='pending').order_by('created_at', 'id').first()
+        if job is None:
+            return None
+        now = timezone.now()
+        claimed = BackgroundJob.objects.filter(id=job.id, status='pending').update(
+            status='running', started_at=now, heartbeat_at=now, worker=worker_id()
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+        # Задачу перехватил другой воркер - пробуем следующую
+
+
+def _worker_process_dead(worker):
+    """Завершился ли процесс воркера (известно только для воркеров этого хоста)"""
+    host, pid, token = (worker.split(':') + ['', ''])[:3]
+    if host != socket.gethostname() or not pid.isdigit():
+        return False
+    if int(pid) == os.getpid():
+        # Тот же PID: задача этого процесса или прежнего процесса с тем же PID
+        return token != _PROCESS_TOKEN
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        # Процесс существует, но принадлежит другому пользователю
+        return False
+    return False
+
+
+def requeue_stale_jobs():
+    """Возвращает в очередь задачи, воркер которых перестал подавать признаки жизни.
+
+    Задача возвращается, если heartbeat_at не обновлялся дольше S3_JOB_STALE_TIMEOUT
+    или если процесс ее воркера на этом хосте уже завершился. Возврат выполняется
+    условным обновлением по воркеру и heartbeat_at: задача, которую воркер успел
+    отметить или которую захватил другой воркер, не затрагивается.
+
+    Returns:
+        int: количество возвращенных задач
+    """
+    threshold = timezone.now() - datetime.timedelta(seconds=_stale_timeout())
+    requeued = 0
+    running = BackgroundJob.objects.filter(status='running').values_list('id', 'worker', 'heartbeat_at')
+    for job_id, worker, heartbeat_at in running:
+        stale = heartbeat_at is None or heartbeat_at < threshold
+        if not stale and not _worker_process_dead(worker):
+            continue
+        requeued += BackgroundJob.objects.filter(
+            id=job_id, status='running', worker=worker, heartbeat_at=heartbeat_at
+        ).update(status='pending', worker='')
+    return requeued
+
+
+class ProgressReporter:
+    """Сохраняет прогресс задачи не чаще раза в S3_JOB_PROGRESS_INTERVAL секунд.
+
+    Вызывается с текущим результатом массовой операции (bulk_ops); для операций
+    над несколькими элементами в update() передаются снимки BulkProgress.
+    Прогресс записывается, только пока задача выполняется этим воркером: если ее
+    вернули в очередь или захватил другой воркер, запись прекращается.
+    """
+
+    def __init__(self, job):
+        self.job = job
+        self.started = time.monotonic()
+        self.lost = False
+        self._last_saved = 0.0
+        self._lock = threading.Lock()
+
+    def __call__(self, result):
+        self.update(progress_from_result(result))
+
+    def update(self, progress):
+        now = time.monotonic()
+        progress = add_rates(progress, now - self.started)
+
+        with self._lock:
+            # Последнее значение сохраняется при завершении задачи в любом случае
+            self.job.progress = progress
+            if self.lost or now - self._last_saved < _progress_interval():
+                return
+            self._last_saved = now
+        updated = BackgroundJob.objects.filter(id=self.job.id, worker=self.job.worker, status='running').update(
+            progress=progress, heartbeat_at=timezone.now()
+        )
+        if not updated:
+            self.lost = True
+            print(f"Background job #{self.job.id} is no longer owned by this worker; progress is not saved")
+
+
+def run_job(job):
+    """Выполняет захваченную задачу и сохраняет ее результат"""
+    handler = JOB_HANDLERS.get(job.job_type)
+    reporter = ProgressReporter(job)
+    try:
+        if handler is None:
+            raise ValueError(f"Неизвестный тип задачи: {job.job_type}")
+        user = User.objects.get(id=job.user_id) if job.user_id else None
+        owned = BackgroundJob.objects.filter(id=job.id, worker=job.worker, status='running')
+        with Heartbeat(owned, 'heartbeat_at', _heartbeat_interval(), name=f's3-job-heartbeat-{job.id}'):
+            result = handler(job, user, reporter)
+        success = result.get('success', True)
+        job.status = 'succeeded' if success else 'failed'
+        job.result = result
+        job.error = '' if success else result.get('message', '')
+    except PermissionDenied as e:
+        job.status = 'failed'
+        job.error = str(e) or "Недостаточно прав"
+    except Exception as e:
+        print(f"Error running background job #{job.id} ({job.job_type}): {str(e)}")
+        job.status = 'failed'
+        job.error = str(e)
+
+    job.finished_at = timezone.now()
+    # Результат сохраняется, только если задачу не вернули в очередь и не захватил другой воркер
+    saved = BackgroundJob.objects.filter(id=job.id, status='running', worker=job.worker).update(
+        status=job.status, result=job.result, error=job.error, finished_at=job.finished_at, progress=job.progress
+    )
+    if not saved:
+        print(f"Background job #{job.id} was requeued while running; its result is discarded")
+    return job
+
+
+def run_job_safely(job):
+    """Выполняет задачу в потоке воркера с отдельными соединениями с базой"""
+    close_old_connections()
+    try:
+        return run_job(job)
+    finally:
+        close_old_connections()
+
+
+def job_to_dict(job):
+    """Представление задачи для JSON-ответов"""
+    return {
+        'id': job.id,
+        'job_type': job.job_type,
+        'status': job.status,
+        'progress': job.progress,
+        'result': job.result,
+        'error': job.error,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+@register('move_folder')
+def _move_folder(job, user, progress_callback):
+    return S3Service().move_object(
+        user, job.params['path'], job.params['destination_folder'],
+        is_folder=True, progress_callback=progress_callback
+    )
+
+
+@register('delete_folder')
+def _delete_folder(job, user, progress_callback):
+    return S3Service().delete_folder(user, job.params['path'], progress_callback=progress_callback)
+
+
+@register('move_multiple')
+def _move_multiple(job, user, progress_callback):
+    return S3Service().move_multiple(
+        user, job.params['files'], job.params['folders'], job.params['destination_folder'],
+        progress_callback=progress_callback.update
+    )
+
+
+@register('delete_multiple')
+def _delete_multiple(job, user, progress_callback):
+    return S3Service().delete_multiple(
+        user, job.params['files'], job.params['folders'], progress_callback=progress_callback.update
+    )
+
+
+@register('restore_from_trash')
+def _restore_from_trash(job, user, progress_callback):
+    return S3Service().restore_from_trash(user, job.params['item_id'], progress_callback=progress_callback)
+
+
+@register('delete_from_trash')
+def _delete_from_trash(job, user, progress_callback):
+    return S3Service().delete_from_trash(job.params['item_id'], progress_callback=progress_callback)
+
+
+@register('empty_trash')
+def _empty_trash(job, user, progress_callback):
+    return S3Service().empty_trash(progress_callback=progress_callback)
+
+
+@register('cleanup_expired_trash')
+def _cleanup_expired_trash(job, user, progress_callback):
+    return S3Service().cleanup_expired_trash(progress_callback=progress_callback)
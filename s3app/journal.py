@@ -0,0 +1,206 @@
+"""
+Журнал операций переноса папок (модель OperationJournal).
+
+Перенос папки в S3 - это копирование каждого объекта и удаление исходного.
+Если процесс прерывается на середине, часть объектов уже в назначении, часть -
+в источнике. Журнал хранит операцию и контрольную точку (последний ключ, до
+которого все объекты перенесены), поэтому повторный запуск той же операции
+продолжает ее: листинг начинается после контрольной точки, а объекты, уже
+скопированные в назначение (тот же ETag и размер), не копируются повторно.
+Объекты, скопированные по частям, получают другой ETag, поэтому журнал запоминает
+их сразу после копирования (multipart_copies) и при продолжении сравнивает только размер.
+
+Пока операция выполняется, heartbeat_at журнала обновляется по таймеру
+(см. heartbeat), поэтому выполняемая операция не считается прерванной, даже
+если контрольная точка долго не меняется. Прерванную операцию продолжает только
+пользователь, который ее начал (или команда resume_s3_operations от его имени).
+"""
+import datetime
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .heartbeat import Heartbeat
+from .models import OperationJournal
+
+
+def _checkpoint_interval():
+    return getattr(settings, 'S3_JOURNAL_CHECKPOINT_INTERVAL', 2.0)
+
+
+def _stale_timeout():
+    return getattr(settings, 'S3_JOURNAL_STALE_TIMEOUT', 600)
+
+
+def _heartbeat_interval():
+    return getattr(settings, 'S3_JOURNAL_HEARTBEAT_INTERVAL', 30)
+
+
+def _resume_window():
+    return getattr(settings, 'S3_JOURNAL_RESUME_WINDOW', 7 * 24 * 3600)
+
+
+def resumable():
+    """Журналы прерванных операций: завершившиеся с ошибками или давно не подававшие признаков жизни.
+
+    Выполняемая операция отмечает heartbeat_at по таймеру, поэтому журнал без отметок
+    дольше S3_JOURNAL_STALE_TIMEOUT принадлежит остановленному процессу.
+    Журналы старше S3_JOURNAL_RESUME_WINDOW не продолжаются: за это время в исходной
+    папке могли появиться новые объекты с ключами до контрольной точки.
+    """
+    now = timezone.now()
+    stale = now - datetime.timedelta(seconds=_stale_timeout())
+    journals = OperationJournal.objects.filter(updated_at__gte=now - datetime.timedelta(seconds=_resume_window()))
+    inactive = Q(heartbeat_at__lt=stale) | Q(heartbeat_at__isnull=True, updated_at__lt=stale)
+    return journals.filter(Q(status='failed') | Q(inactive, status='running'))
+
+
+def find_resumable(operation, user, source_prefix, destination_prefix=None):
+    """Последний журнал прерванной операции пользователя с тем же источником (и назначением, если указано).
+
+    Журналы других пользователей не учитываются: продолжение выполняется с правами
+    пользователя, начавшего операцию.
+    """
+    journals = resumable().filter(operation=operation, source_prefix=source_prefix)
+    if user is not None and user.is_authenticated:
+        journals = journals.filter(user=user)
+    else:
+        journals = journals.filter(user__isnull=True)
+    if destination_prefix is not None:
+        journals = journals.filter(destination_prefix=destination_prefix)
+    return journals.order_by('-created_at').first()
+
+
+def start(operation, user, source_prefix, destination_prefix, **params):
+    """Создает журнал новой операции или продолжает журнал прерванной.
+
+    Прерванный журнал захватывается условным обновлением (по статусу и heartbeat_at),
+    поэтому два одновременных запроса не продолжают одну операцию дважды.
+
+    Returns:
+        tuple: (OperationJournal, продолжается ли прерванная операция)
+    """
+    while True:
+        journal = find_resumable(operation, user, source_prefix, destination_prefix)
+        if journal is None:
+            break
+        now = timezone.now()
+        claimed = OperationJournal.objects.filter(
+            id=journal.id, status=journal.status, heartbeat_at=journal.heartbeat_at
+        ).update(status='running', error='', heartbeat_at=now, updated_at=now)
+        if claimed:
+            journal.refresh_from_db()
+            return journal, True
+        # Журнал захватил другой процесс - ищем следующий
+
+    journal = OperationJournal.objects.create(
+        operation=operation,
+        user=user if user is not None and user.is_authenticated else None,
+        source_prefix=source_prefix,
+        destination_prefix=destination_prefix,
+        params=params,
+        heartbeat_at=timezone.now(),
+    )
+    return journal, False
+
+
+def heartbeat(journal):
+    """Контекстный менеджер, отмечающий активность операции журнала по таймеру"""
+    return Heartbeat(
+        OperationJournal.objects.filter(id=journal.id, status='running'), 'heartbeat_at',
+        _heartbeat_interval(), name=f's3-journal-heartbeat-{journal.id}'
+    )
+
+
+class Checkpointer:
+    """checkpoint_callback для bulk_ops.copy_prefix: сохраняет контрольную точку в журнал.
+
+    Запись в базу выполняется не чаще раза в S3_JOURNAL_CHECKPOINT_INTERVAL секунд;
+    счетчики журнала накапливаются между запусками операции.
+    """
+
+    def __init__(self, journal):
+        self.journal = journal
+        self.base_count = journal.copied_count
+        self.base_bytes = journal.copied_bytes
+        self._last_saved = time.monotonic()
+        self._lock = threading.Lock()
+
+    def __call__(self, key, result):
+        with self._lock:
+            self.journal.checkpoint = key
+            self._update_counters(result)
+            now = time.monotonic()
+            if now - self._last_saved < _checkpoint_interval():
+                return
+            self._last_saved = now
+            # Объекты до контрольной точки перенесены и в листинг источника больше не попадут
+            copies = self.journal.multipart_copies
+            for copied_key in [copied_key for copied_key in copies if copied_key <= key]:
+                del copies[copied_key]
+        self.journal.save(update_fields=['checkpoint', 'copied_count', 'copied_bytes', 'multipart_copies', 'updated_at'])
+
+    def record_multipart_copy(self, obj):
+        """multipart_callback для bulk_ops.copy_prefix: запоминает объект, скопированный по частям.
+
+        Запись сохраняется сразу: копирование большого объекта дороже записи в базу,
+        а контрольная точка может не дойти до этого ключа (например, после ошибки).
+        """
+        with self._lock:
+            self.journal.multipart_copies[obj['Key']] = obj.get('ETag')
+        self.journal.save(update_fields=['multipart_copies', 'updated_at'])
+
+    def _update_counters(self, result):
+        # Учитываются только полностью перенесенные объекты: они больше не попадут
+        # в листинг источника, поэтому при продолжении не будут посчитаны повторно
+        self.journal.copied_count = self.base_count + result['completed_count']
+        self.journal.copied_bytes = self.base_bytes + result['completed_bytes']
+
+    def finish(self, result):
+        """Сохраняет итог операции: завершена, если ошибок нет, иначе - прервана"""
+        with self._lock:
+            self._update_counters(result)
+            if result['errors']:
+                first = result['errors'][0]
+                self.journal.status = 'failed'
+                self.journal.error = (
+                    f"Не перенесено объектов: {len(result['errors'])}. "
+                    f"{first.get('key')}: {first.get('code')} {first.get('message')}"
+                )
+            else:
+                self.journal.status = 'completed'
+                self.journal.error = ''
+                self.journal.finished_at = timezone.now()
+        self.journal.save()
+
+    def fail(self, error):
+        """Отмечает операцию прерванной из-за исключения"""
+        self.journal.status = 'failed'
+        self.journal.error = str(error)
+        self.journal.save(update_fields=['status', 'error', 'checkpoint', 'copied_count', 'copied_bytes',
+                                         'multipart_copies', 'updated_at'])
+
+
+def resume(journal):
+    """Продолжает прерванную операцию от имени пользователя, который ее начал.
+
+    Returns:
+        dict: результат соответствующего метода S3Service
+    """
+    from .s3_service import S3Service
+
+    if journal.user is None:
+        raise ValueError("Пользователь, начавший операцию, удален")
+
+    s3_service = S3Service()
+    params = journal.params
+    if journal.operation == 'move_folder':
+        return s3_service.move_object(journal.user, params['source_path'], params['destination_folder'], is_folder=True)
+    if journal.operation == 'delete_folder':
+        return s3_service.delete_folder(journal.user, params['folder_path'])
+    if journal.operation == 'restore_folder':
+        return s3_service.restore_from_trash(journal.user, params['trash_item_id'])
+    raise ValueError(f"Неизвестная операция: {journal.operation}")
@@ -0,0 +1,105 @@
+"""
+Кэш листингов директорий S3 в кэш-бэкенде Django.
+
+Запись кэша не зависит от пользователя: в ней хранится полный листинг префикса,
+а фильтрация служебных папок (__trash, __documents) выполняется поверх него.
+
+Инвалидация построена на счетчиках поколений, а не на удалении ключей:
+- собственное поколение папки меняется при изменении ее непосредственного содержимого;
+- поколение поддерева папки меняется при перемещении/удалении папки целиком
+  и делает недействительными листинги всех вложенных папок.
+Ключ записи включает поколения папки и всех ее предков, поэтому инвалидация
+поддерева любого размера - это одна операция записи в кэш.
+
+Сброс должен быть виден всем процессам, поэтому кэш работает только с общим
+кэш-бэкендом (shared_cache.is_shared); с кэшем в памяти процесса он отключен.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import shared_cache
+
+
+def _timeout():
+    return getattr(settings, 'S3_LISTING_CACHE_TIMEOUT', 60)
+
+
+def _max_items():
+    return getattr(settings, 'S3_LISTING_CACHE_MAX_ITEMS', 5000)
+
+
+def _enabled():
+    return getattr(settings, 'S3_LISTING_CACHE_ENABLED', True) and shared_cache.is_shared()
+
+
+def _normalize(path):
+    """Приводит путь папки к единому виду: без начальных, конечных и повторных слешей"""
+    return '/'.join(filter(None, (path or '').split('/')))
+
+
+def _digest(value):
+    return hashlib.md5(value.encode('utf-8')).hexdigest()
+
+
+def _ancestors(path):
+    """Возвращает путь и всех его предков, начиная с корня: '', 'a', 'a/b'"""
+    parts = path.split('/') if path else []
+    return [''] + ['/'.join(parts[:i]) for i in range(1, len(parts) + 1)]
+
+
+def _own_generation_key(path):
+    return f"s3_listing_gen:{_digest(path)}"
+
+
+def _tree_generation_key(path):
+    return f"s3_listing_tree_gen:{_digest(path)}"
+
+
+def _entry_key(path, variant):
+    """Формирует ключ записи с учетом текущих поколений папки и ее предков"""
+    generation_keys = [_tree_generation_key(p) for p in _ancestors(path)] + [_own_generation_key(path)]
+    generations = cache.get_many(generation_keys)
+    signature = ':'.join(str(generations.get(key, 0)) for key in generation_keys)
+    return f"s3_listing:{_digest(path)}:{_digest(signature + '|' + variant)}"
+
+
+def get_listing(path, variant):
+    """Возвращает закэшированный листинг папки или None"""
+    if not _enabled():
+        return None
+    return cache.get(_entry_key(_normalize(path), variant))
+
+
+def set_listing(path, variant, listing):
+    """Сохраняет листинг папки в кэш, если он не превышает допустимый размер"""
+    if not _enabled():
+        return
+    items_count = len(listing.get('directories', [])) + len(listing.get('files', []))
+    if items_count > _max_items():
+        # Слишком большие папки не кэшируем, чтобы не раздувать кэш-бэкенд
+        return
+    cache.set(_entry_key(_normalize(path), variant), listing, _timeout())
+
+
+def _bump(key):
+    # Поколения хранятся без срока действия: уникальное значение на основе времени
+    # гарантирует, что старые записи не станут снова действительными
+    cache.set(key, time.time_ns(), None)
+
+
+def invalidate_path(path, recursive=False):
+    """Инвалидирует листинг папки и ее родительской папки.
+
+    Args:
+        path: путь папки, содержимое которой изменилось
+        recursive: дополнительно инвалидировать листинги всех вложенных папок
+    """
+    normalized = _normalize(path)
+    _bump(_own_generation_key(normalized))
+    if normalized:
+        _bump(_own_generation_key('/'.join(normalized.split('/')[:-1])))
+    if recursive:
+        _bump(_tree_generation_key(normalized))
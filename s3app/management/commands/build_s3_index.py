@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from s3app import folder_tree, object_index, object_search
+from s3app.s3_service import S3Service
+
+
+class Command(BaseCommand):
+    help = 'Полностью перестраивает локальный индекс метаданных объектов бакета S3'
+
+    def handle(self, *args, **options):
+        s3_service = S3Service()
+
+        def report(count):
+            self.stdout.write(f"Проиндексировано объектов: {count}")
+
+        total = object_index.rebuild_index(s3_service.s3_client, s3_service.bucket_name, progress_callback=report)
+        # Полнотекстовый индекс имен для поиска (только SQLite)
+        object_search.create_search_index()
+        # Дерево папок перестраивается из нового индекса при следующем запросе
+        folder_tree.invalidate()
+
+        if not object_index.is_enabled():
+            self.stdout.write(self.style.WARNING(
+                'Индекс построен, но не используется: включите S3_OBJECT_INDEX_ENABLED в настройках'
+            ))
+        self.stdout.write(self.style.SUCCESS(f"Индекс построен, объектов: {total}"))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from s3app import journal
+from s3app.models import OperationJournal
+
+
+class Command(BaseCommand):
+    help = 'Продолжает прерванные операции переноса папок (перемещение, корзина, восстановление) по журналу'
+
+    def add_arguments(self, parser):
+        parser.add_argument('ids', nargs='*', type=int, help='Номера записей журнала (по умолчанию - все прерванные)')
+        parser.add_argument('--list', action='store_true', help='Только показать прерванные операции')
+
+    def handle(self, *args, **options):
+        journals = journal.resumable().order_by('created_at')
+        if options['ids']:
+            journals = OperationJournal.objects.filter(id__in=options['ids']).exclude(status='completed')
+
+        journals = list(journals)
+        if not journals:
+            self.stdout.write('Прерванных операций нет')
+            return
+
+        for entry in journals:
+            self.stdout.write(
+                f"#{entry.id} {entry} ({entry.get_status_display()}, перенесено {entry.copied_count}, "
+                f"контрольная точка: {entry.checkpoint or '-'})"
+            )
+            if options['list']:
+                continue
+
+            try:
+                result = journal.resume(entry)
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f"#{entry.id}: {str(e)}"))
+                continue
+            style = self.style.SUCCESS if result.get('success', True) else self.style.ERROR
+            self.stdout.write(style(f"#{entry.id}: {result.get('message', '')}"))
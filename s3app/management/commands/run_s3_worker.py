@@ -0,0 +1,85 @@
+import signal
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from s3app import jobs
+
+# Как часто проверять задачи, воркеры которых перестали подавать признаки жизни (секунды)
+REQUEUE_CHECK_INTERVAL = 60
+
+
+class Command(BaseCommand):
+    help = 'Запускает воркер фоновых задач S3 (перемещение и удаление папок, операции с корзиной)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int,
+            default=getattr(settings, 'S3_JOB_WORKER_CONCURRENCY', 2),
+            help='Количество одновременно выполняемых задач'
+        )
+        parser.add_argument(
+            '--poll-interval', type=float,
+            default=getattr(settings, 'S3_JOB_POLL_INTERVAL', 2.0),
+            help='Интервал опроса очереди (секунды)'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Выполнить задачи, находящиеся в очереди, и завершиться'
+        )
+
+    def handle(self, *args, **options):
+        concurrency = max(1, options['concurrency'])
+        poll_interval = options['poll_interval']
+        self.stopping = False
+
+        def stop(signum, frame):
+            self.stdout.write('Получен сигнал остановки, завершаем текущие задачи...')
+            self.stopping = True
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        requeued = jobs.requeue_stale_jobs()
+        if requeued:
+            self.stdout.write(self.style.WARNING(f"Возвращено в очередь зависших задач: {requeued}"))
+        self.stdout.write(f"Воркер запущен, одновременных задач: {concurrency}")
+
+        last_requeue = time.monotonic()
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='s3-job') as executor:
+            running = set()
+            while not self.stopping:
+                # Задачи упавших воркеров возвращаются в очередь и без перезапуска этого воркера
+                if time.monotonic() - last_requeue >= REQUEUE_CHECK_INTERVAL:
+                    last_requeue = time.monotonic()
+                    requeued = jobs.requeue_stale_jobs()
+                    if requeued:
+                        self.stdout.write(self.style.WARNING(f"Возвращено в очередь зависших задач: {requeued}"))
+
+                # Берем новые задачи только при наличии свободных слотов
+                claimed = False
+                while len(running) < concurrency:
+                    job = jobs.claim_next_job()
+                    if job is None:
+                        break
+                    claimed = True
+                    self.stdout.write(f"Задача #{job.id} ({job.job_type}) запущена")
+                    running.add(executor.submit(jobs.run_job_safely, job))
+
+                if not running:
+                    if options['once']:
+                        break
+                    time.sleep(poll_interval)
+                    continue
+
+                done, running = wait(running, timeout=0 if claimed else poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = future.result()
+                    style = self.style.SUCCESS if job.status == 'succeeded' else self.style.ERROR
+                    self.stdout.write(style(f"Задача #{job.id} ({job.job_type}): {job.get_status_display()}"))
+
+            for future in wait(running).done:
+                job = future.result()
+                self.stdout.write(f"Задача #{job.id} ({job.job_type}): {job.get_status_display()}")
@@ -71,6 +71,11 @@ class TrashItem(models.Model):
         ('folder', 'Папка'),
     ]
 
+    BACKENDS = [
+        ('copy', 'Копия в __trash'),
+        ('versioning', 'Маркеры удаления'),
+    ]
+
     original_path = models.CharField(max_length=1024, verbose_name="Исходный путь")
     trash_path = models.CharField(max_length=1024, verbose_name="Путь в корзине")
     object_type = models.CharField(max_length=10, choices=OBJECT_TYPES, verbose_name="Тип объекта")
@@ -78,6 +83,12 @@ class TrashItem(models.Model):
     deleted_at = models.DateTimeField(auto_now_add=True, verbose_name="Время удаления")
     original_size = models.BigIntegerField(default=0, verbose_name="Размер объекта")
     expires_at = models.DateTimeField(verbose_name="Срок хранения до")
+    backend = models.CharField(max_length=20, choices=BACKENDS, default='copy', verbose_name="Способ хранения")
+    # Для backend='versioning': ключ -> [версия объекта, версия маркера удаления]
+    versions = models.JSONField(default=dict, blank=True, verbose_name="Версии объектов")
+    object_count = models.IntegerField(default=0, verbose_name="Количество объектов")
+    # Сжатый список объектов папки (s3app.trash_manifest)
+    manifest = models.BinaryField(null=True, blank=True, editable=False, verbose_name="Манифест объектов")
 
     class Meta:
         verbose_name = "Элемент корзины"
@@ -151,5 +162,172 @@ class DocumentSignature(models.Model):
 
     @classmethod
     def has_pending_documents(cls, user):
-        """Проверяет, есть ли у пользователя документы, ожидающие подписи"""
-        return cls.objects.filter(user=user, status='pending').exists()
+        """Проверяет, есть ли у пользователя документы, ожидающие подписи.
+
+        Результат запоминается на объекте пользователя на время запроса, чтобы
+        middleware, представление и проверки S3Service выполняли один запрос к БД.
+        Между запросами не кэшируется: признак блокирует скачивание и должен
+        сразу учитывать документы, созданные в других процессах.
+        """
+        pending = getattr(user, '_s3_has_pending_documents', None)
+        if pending is None:
+            pending = cls.objects.filter(user=user, status='pending').exists()
+            user._s3_has_pending_documents = pending
+        return pending
+
+
+class S3ObjectIndex(models.Model):
+    """Локальный индекс метаданных объектов бакета S3 (зеркало листинга)"""
+    # Ключ объекта S3. Папки хранятся с '/' на конце, как маркеры папок в S3
+    key = models.CharField(max_length=1024, unique=True, verbose_name="Ключ объекта")
+    # Путь родительской папки без '/' на конце ('' - корень)
+    parent_prefix = models.CharField(max_length=1024, blank=True, default='', verbose_name="Родительская папка")
+    name = models.CharField(max_length=1024, verbose_name="Имя")
+    # Имя в нижнем регистре (str.lower): LOWER и LIKE в SQLite не учитывают регистр кириллицы
+    name_lower = models.CharField(max_length=1024, blank=True, default='', editable=False,
+                                  verbose_name="Имя (нижний регистр)")
+    is_folder = models.BooleanField(default=False, verbose_name="Папка")
+    size = models.BigIntegerField(default=0, verbose_name="Размер")
+    etag = models.CharField(max_length=255, blank=True, default='', verbose_name="ETag")
+    last_modified = models.DateTimeField(null=True, blank=True, verbose_name="Дата изменения")
+    content_type = models.CharField(max_length=255, blank=True, default='', verbose_name="Тип содержимого")
+
+    class Meta:
+        verbose_name = "Объект индекса S3"
+        verbose_name_plural = "Индекс объектов S3"
+        indexes = [
+            models.Index(fields=['parent_prefix', 'is_folder', 'name']),
+        ]
+
+    def __str__(self):
+        return self.key
+
+
+class BackgroundJob(models.Model):
+    """Фоновая задача для длительных операций с бакетом (выполняется воркером run_s3_worker)"""
+    JOB_TYPES = [
+        ('move_folder', 'Перемещение папки'),
+        ('delete_folder', 'Удаление папки'),
+        ('move_multiple', 'Перемещение нескольких объектов'),
+        ('delete_multiple', 'Удаление нескольких объектов'),
+        ('restore_from_trash', 'Восстановление из корзины'),
+        ('delete_from_trash', 'Удаление из корзины'),
+        ('empty_trash', 'Очистка корзины'),
+        ('cleanup_expired_trash', 'Очистка просроченных элементов корзины'),
+    ]
+
+    STATUS_CHOICES = [
+        ('pending', 'В очереди'),
+        ('running', 'Выполняется'),
+        ('succeeded', 'Выполнена'),
+        ('failed', 'Ошибка'),
+    ]
+
+    job_type = models.CharField(max_length=50, choices=JOB_TYPES, verbose_name="Тип задачи")
+    params = models.JSONField(default=dict, blank=True, verbose_name="Параметры")
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Пользователь")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name="Статус")
+    progress = models.JSONField(default=dict, blank=True, verbose_name="Прогресс")
+    result = models.JSONField(null=True, blank=True, verbose_name="Результат")
+    error = models.TextField(blank=True, default='', verbose_name="Ошибка")
+    worker = models.CharField(max_length=255, blank=True, default='', verbose_name="Воркер")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="Дата запуска")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Дата завершения")
+    heartbeat_at = models.DateTimeField(null=True, blank=True, verbose_name="Последняя активность")
+
+    class Meta:
+        verbose_name = "Фоновая задача"
+        verbose_name_plural = "Фоновые задачи"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"#{self.id} {self.get_job_type_display()} ({self.get_status_display()})"
+
+    @property
+    def is_finished(self):
+        return self.status in ('succeeded', 'failed')
+
+
+class OperationJournal(models.Model):
+    """Журнал переноса папки (перемещение, перенос в корзину, восстановление).
+
+    Хранит контрольную точку - последний ключ, до которого включительно все объекты
+    перенесены, - чтобы прерванную операцию можно было продолжить с этого места.
+    """
+    OPERATION_CHOICES = [
+        ('move_folder', 'Перемещение папки'),
+        ('delete_folder', 'Перемещение папки в корзину'),
+        ('restore_folder', 'Восстановление папки из корзины'),
+    ]
+
+    STATUS_CHOICES = [
+        ('running', 'Выполняется'),
+        ('failed', 'Прервана'),
+        ('completed', 'Завершена'),
+    ]
+
+    operation = models.CharField(max_length=50, choices=OPERATION_CHOICES, verbose_name="Операция")
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Пользователь")
+    source_prefix = models.CharField(max_length=1024, verbose_name="Исходный префикс")
+    destination_prefix = models.CharField(max_length=1024, verbose_name="Префикс назначения")
+    params = models.JSONField(default=dict, blank=True, verbose_name="Параметры")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='running', verbose_name="Статус")
+    checkpoint = models.CharField(max_length=1024, blank=True, default='', verbose_name="Контрольная точка")
+    copied_count = models.PositiveIntegerField(default=0, verbose_name="Перенесено объектов")
+    copied_bytes = models.BigIntegerField(default=0, verbose_name="Перенесено байт")
+    # Объекты после контрольной точки, скопированные по частям: ключ источника -> ETag источника.
+    # ETag такой копии отличается от исходного, поэтому при продолжении она узнается по этой записи
+    multipart_copies = models.JSONField(default=dict, blank=True, verbose_name="Скопированные по частям")
+    error = models.TextField(blank=True, default='', verbose_name="Ошибка")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Последнее обновление")
+    # Обновляется по таймеру, пока операция выполняется (s3app.heartbeat)
+    heartbeat_at = models.DateTimeField(null=True, blank=True, verbose_name="Последняя активность")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Дата завершения")
+
+    class Meta:
+        verbose_name = "Журнал операции"
+        verbose_name_plural = "Журнал операций"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['operation', 'source_prefix', 'status']),
+            models.Index(fields=['status', 'updated_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_operation_display()}: {self.source_prefix} → {self.destination_prefix}"
+
+
+class ArchiveCacheEntry(models.Model):
+    """Готовый ZIP-архив в кэше (объект в __cache/archives/, см. s3app.archive_cache).
+
+    Ключ - хэш имен, ключей и ETag файлов архива и пресета сжатия, поэтому
+    изменение любого файла дает новый ключ, а прежний архив больше не выдается.
+    Архивы папок дополнительно находятся по области (папки и пресет) без листинга.
+    """
+    fingerprint = models.CharField(max_length=64, unique=True, verbose_name="Ключ содержимого")
+    # Ключ области архива папки (archive_cache.scope_key); пусто для выбранных файлов
+    scope = models.CharField(max_length=64, blank=True, default='', db_index=True, verbose_name="Область архива")
+    object_key = models.CharField(max_length=1024, verbose_name="Объект архива")
+    size = models.BigIntegerField(default=0, verbose_name="Размер архива")
+    member_count = models.PositiveIntegerField(default=0, verbose_name="Файлов в архиве")
+    # Ключи файлов и префиксы папок архива, по одному на строку (с переводами строк по краям)
+    paths = models.TextField(blank=True, default='', verbose_name="Файлы и папки архива")
+    hit_count = models.PositiveIntegerField(default=0, verbose_name="Выдано из кэша")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    last_accessed_at = models.DateTimeField(default=timezone.now, verbose_name="Последнее обращение")
+
+    class Meta:
+        verbose_name = "Архив в кэше"
+        verbose_name_plural = "Архивы в кэше"
+        ordering = ['-last_accessed_at']
+        indexes = [
+            models.Index(fields=['last_accessed_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.object_key} ({self.member_count} файлов)"
@@ -0,0 +1,282 @@
+"""
+Локальный индекс метаданных объектов бакета (модель S3ObjectIndex).
+
+Индекс заполняется полным сканированием бакета (команда build_s3_index)
+и затем поддерживается инкрементально методами записи S3Service.
+Для каждого объекта хранятся и все его папки-предки, поэтому содержимое
+любой папки (включая "неявные" папки без объекта-маркера) выбирается
+одним запросом по parent_prefix.
+"""
+import functools
+import mimetypes
+import operator
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.models import Q
+
+from .models import S3ObjectIndex
+
+# Размер пачки для bulk_create
+BATCH_SIZE = 1000
+
+_UPDATE_FIELDS = ['parent_prefix', 'name', 'name_lower', 'is_folder', 'size', 'etag', 'last_modified', 'content_type']
+
+
+def is_enabled():
+    """Включено ли использование индекса (настройка S3_OBJECT_INDEX_ENABLED)"""
+    return getattr(settings, 'S3_OBJECT_INDEX_ENABLED', False)
+
+
+def _maintenance(func):
+    """Выполняет обновление индекса только при включенном индексе.
+
+    Ошибка обновления индекса не должна ломать уже выполненную операцию в S3,
+    поэтому она только выводится в лог; рассинхронизация исправляется перестроением индекса.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not is_enabled():
+            return None
+        try:
+            return func(*args, **kwargs)
+        except DatabaseError as e:
+            print(f"Error updating object index ({func.__name__}): {str(e)}")
+            return None
+    return wrapper
+
+
+def _folder_key(path):
+    """Ключ папки в индексе: путь без лишних слешей с '/' на конце"""
+    normalized = '/'.join(filter(None, (path or '').split('/')))
+    return f"{normalized}/" if normalized else ''
+
+
+def prefix_q(folder_key):
+    """Условие выборки всех ключей внутри папки (включая саму папку).
+
+    Диапазон по ключу использует уникальный индекс и, в отличие от LIKE в SQLite,
+    чувствителен к регистру; startswith оставлен для бэкендов с другой сортировкой.
+    """
+    upper_bound = folder_key[:-1] + chr(ord('/') + 1)
+    return Q(key__gte=folder_key, key__lt=upper_bound, key__startswith=folder_key)
+
+
+def _ancestor_folder_keys(key):
+    """Возвращает ключи всех папок-предков объекта: 'a/b/c.txt' -> ['a/', 'a/b/']"""
+    parts = key.rstrip('/').split('/')[:-1]
+    return ['/'.join(parts[:i]) + '/' for i in range(1, len(parts) + 1)]
+
+
+def _build_row(key, size=0, etag='', last_modified=None, content_type=''):
+    """Создает (не сохраняя) строку индекса для ключа"""
+    is_folder = key.endswith('/')
+    parent_prefix, _, name = key.rstrip('/').rpartition('/')
+    if not is_folder and not content_type:
+        content_type = mimetypes.guess_type(name)[0] or ''
+    return S3ObjectIndex(
+        key=key,
+        parent_prefix=parent_prefix,
+        name=name,
+        name_lower=name.lower(),
+        is_folder=is_folder,
+        size=size or 0,
+        etag=(etag or '').strip('"'),
+        last_modified=last_modified,
+        content_type=content_type or '',
+    )
+
+
+def _save_rows(rows):
+    """Сохраняет строки индекса, перезаписывая существующие с теми же ключами"""
+    S3ObjectIndex.objects.bulk_create(
+        rows,
+        batch_size=BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=['key'],
+        update_fields=_UPDATE_FIELDS,
+    )
+
+
+def _ensure_folders(keys):
+    """Добавляет в индекс недостающие папки-предки для переданных ключей"""
+    folder_keys = set()
+    for key in keys:
+        folder_keys.update(_ancestor_folder_keys(key))
+    if folder_keys:
+        S3ObjectIndex.objects.bulk_create(
+            [_build_row(folder_key) for folder_key in folder_keys],
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+
+@_maintenance
+def upsert_object(key, size=0, etag='', last_modified=None, content_type=''):
+    """Добавляет или обновляет объект в индексе"""
+    with transaction.atomic():
+        _save_rows([_build_row(key, size, etag, last_modified, content_type)])
+        _ensure_folders([key])
+
+
+@_maintenance
+def upsert_objects(objects):
+    """Добавляет или обновляет в индексе несколько объектов из листинга ({'Key', 'Size', 'ETag', 'LastModified'})"""
+    rows = [
+        _build_row(obj['Key'], obj.get('Size', 0), obj.get('ETag', ''), obj.get('LastModified'))
+        for obj in objects
+    ]
+    if not rows:
+        return
+    with transaction.atomic():
+        _save_rows(rows)
+        _ensure_folders([row.key for row in rows])
+
+
+@_maintenance
+def add_folder(path):
+    """Добавляет папку (и ее предков) в индекс"""
+    folder_key = _folder_key(path)
+    if not folder_key:
+        return
+    with transaction.atomic():
+        S3ObjectIndex.objects.bulk_create([_build_row(folder_key)], ignore_conflicts=True)
+        _ensure_folders([folder_key])
+
+
+@_maintenance
+def remove_key(key):
+    """Удаляет объект из индекса"""
+    S3ObjectIndex.objects.filter(key=key).delete()
+
+
+@_maintenance
+def remove_prefix(path):
+    """Удаляет из индекса папку и все ее содержимое"""
+    folder_key = _folder_key(path)
+    if not folder_key:
+        return
+    S3ObjectIndex.objects.filter(prefix_q(folder_key)).delete()
+
+
+@_maintenance
+def remove_prefixes(paths):
+    """Удаляет из индекса несколько папок со всем их содержимым"""
+    folder_keys = [folder_key for folder_key in map(_folder_key, paths) if folder_key]
+    # Условия объединяются небольшими группами, чтобы не превысить лимиты параметров запроса
+    for start in range(0, len(folder_keys), 100):
+        chunk = folder_keys[start:start + 100]
+        S3ObjectIndex.objects.filter(functools.reduce(operator.or_, map(prefix_q, chunk))).delete()
+
+
+@_maintenance
+def move_key(source_key, destination_key):
+    """Переносит объект в индексе под новый ключ, сохраняя метаданные"""
+    with transaction.atomic():
+        row = S3ObjectIndex.objects.filter(key=source_key).first()
+        S3ObjectIndex.objects.filter(key=source_key).delete()
+        if row is None:
+            new_row = _build_row(destination_key)
+        else:
+            new_row = _build_row(destination_key, row.size, row.etag, row.last_modified, row.content_type)
+        _save_rows([new_row])
+        _ensure_folders([destination_key])
+
+
+@_maintenance
+def move_prefix(source_path, destination_path):
+    """Переносит папку со всем содержимым в индексе под новый путь"""
+    source_key = _folder_key(source_path)
+    destination_key = _folder_key(destination_path)
+    if not source_key or not destination_key:
+        return
+    with transaction.atomic():
+        rows = list(S3ObjectIndex.objects.filter(prefix_q(source_key)))
+        S3ObjectIndex.objects.filter(prefix_q(source_key)).delete()
+        new_rows = [
+            _build_row(destination_key + row.key[len(source_key):], row.size, row.etag,
+                       row.last_modified, row.content_type)
+            for row in rows
+        ]
+        if not any(row.key == destination_key for row in new_rows):
+            new_rows.append(_build_row(destination_key))
+        _save_rows(new_rows)
+        _ensure_folders([destination_key])
+
+
+def list_folder(path):
+    """Возвращает непосредственное содержимое папки из индекса (папки первыми, по имени)"""
+    parent_prefix = _folder_key(path).rstrip('/')
+    return list(
+        S3ObjectIndex.objects.filter(parent_prefix=parent_prefix)
+        .order_by('-is_folder', 'name')
+        .values('key', 'name', 'is_folder', 'size', 'last_modified')
+    )
+
+
+def list_folder_page(path, after=None, limit=50):
+    """Возвращает одну страницу содержимого папки из индекса (keyset-пагинация).
+
+    Args:
+        path: путь папки
+        after: пара (is_folder, name) последнего элемента предыдущей страницы
+        limit: размер страницы
+
+    Returns:
+        tuple: (строки страницы, есть ли следующая страница)
+    """
+    parent_prefix = _folder_key(path).rstrip('/')
+    queryset = S3ObjectIndex.objects.filter(parent_prefix=parent_prefix)
+    if after is not None:
+        after_is_folder, after_name = after
+        if after_is_folder:
+            queryset = queryset.filter(Q(is_folder=True, name__gt=after_name) | Q(is_folder=False))
+        else:
+            queryset = queryset.filter(is_folder=False, name__gt=after_name)
+    rows = list(
+        queryset.order_by('-is_folder', 'name')
+        .values('key', 'name', 'is_folder', 'size', 'last_modified')[:limit + 1]
+    )
+    return rows[:limit], len(rows) > limit
+
+
+def rebuild_index(s3_client, bucket_name, progress_callback=None):
+    """Полностью перестраивает индекс по листингу бакета.
+
+    Returns:
+        int: количество проиндексированных объектов
+    """
+    indexed_count = 0
+    with transaction.atomic():
+        S3ObjectIndex.objects.all().delete()
+
+        folder_keys = set()
+        batch = []
+        paginator = s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket_name):
+            for obj in page.get('Contents', []):
+                key = obj['Key']
+                batch.append(_build_row(key, obj.get('Size', 0), obj.get('ETag', ''), obj.get('LastModified')))
+                folder_keys.update(_ancestor_folder_keys(key))
+
+                if len(batch) >= BATCH_SIZE:
+                    S3ObjectIndex.objects.bulk_create(batch, ignore_conflicts=True)
+                    indexed_count += len(batch)
+                    batch = []
+                    if progress_callback:
+                        progress_callback(indexed_count)
+
+        if batch:
+            S3ObjectIndex.objects.bulk_create(batch, ignore_conflicts=True)
+            indexed_count += len(batch)
+
+        # Неявные папки (без объекта-маркера); существующие маркеры не перезаписываются
+        S3ObjectIndex.objects.bulk_create(
+            [_build_row(folder_key) for folder_key in folder_keys],
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+    if progress_callback:
+        progress_callback(indexed_count)
+    return indexed_count
@@ -0,0 +1,132 @@
+"""
+Поиск объектов по подстроке в имени на основе локального индекса (S3ObjectIndex).
+
+На SQLite используется полнотекстовая таблица FTS5 с токенизатором trigram:
+она индексирует все трехсимвольные подстроки имен, поэтому поиск по подстроке
+не требует полного просмотра таблицы. Таблица синхронизируется с индексом
+триггерами базы данных, так что любые изменения S3ObjectIndex через ORM
+сразу попадают в поиск. Таблица и триггеры создаются командой build_s3_index
+(create_search_index), а не при запросах. Без этой таблицы (до запуска команды
+или на других бэкендах) и для запросов короче трех символов используется поиск
+подстроки по name_lower.
+
+Регистр сравнивается по S3ObjectIndex.name_lower (str.lower), а не через LOWER
+и LIKE базы данных: в SQLite они приводят к нижнему регистру только ASCII.
+"""
+from django.db import DatabaseError, connection
+from django.db.models import Case, IntegerField, Value, When
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Length
+
+from .models import S3ObjectIndex
+
+# Минимальная длина запроса, при которой работает индекс триграмм
+TRIGRAM_MIN_LENGTH = 3
+
+_fts_ready = False
+
+
+def _fts_table():
+    return f"{S3ObjectIndex._meta.db_table}_fts"
+
+
+def create_search_index():
+    """Создает FTS5-таблицу и триггеры синхронизации (только для SQLite).
+
+    Вызывается командой build_s3_index; существующая таблица не пересоздается.
+
+    Returns:
+        bool: доступен ли полнотекстовый поиск
+    """
+    global _fts_ready
+    if connection.vendor != 'sqlite':
+        return False
+
+    base_table = S3ObjectIndex._meta.db_table
+    fts_table = _fts_table()
+    try:
+        with connection.cursor() as cursor:
+            created = not _fts_table_exists(cursor)
+
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} "
+                f"USING fts5(name, content='{base_table}', content_rowid='id', tokenize='trigram')"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {fts_table}_ai AFTER INSERT ON {base_table} BEGIN "
+                f"INSERT INTO {fts_table}(rowid, name) VALUES (new.id, new.name); END"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {fts_table}_ad AFTER DELETE ON {base_table} BEGIN "
+                f"INSERT INTO {fts_table}({fts_table}, rowid, name) VALUES ('delete', old.id, old.name); END"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {fts_table}_au AFTER UPDATE ON {base_table} BEGIN "
+                f"INSERT INTO {fts_table}({fts_table}, rowid, name) VALUES ('delete', old.id, old.name); "
+                f"INSERT INTO {fts_table}(rowid, name) VALUES (new.id, new.name); END"
+            )
+            if created:
+                # Таблица создана поверх уже заполненного индекса - заполняем ее
+                cursor.execute(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')")
+    except DatabaseError as e:
+        # Например, SQLite собран без FTS5 или без токенизатора trigram
+        print(f"Full-text search index is unavailable: {str(e)}")
+        return False
+
+    _fts_ready = True
+    return True
+
+
+def _fts_table_exists(cursor):
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=%s", [_fts_table()])
+    return cursor.fetchone() is not None
+
+
+def search_index_ready():
+    """Создана ли FTS5-таблица (командой build_s3_index)"""
+    global _fts_ready
+    if not _fts_ready and connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            _fts_ready = _fts_table_exists(cursor)
+    return _fts_ready
+
+
+def search(query, scope_q=None, max_results=200):
+    """Ищет объекты индекса, имя которых содержит query (без учета регистра).
+
+    Args:
+        query: подстрока для поиска
+        scope_q: дополнительное условие (область поиска и права доступа)
+        max_results: максимальное количество результатов
+
+    Returns:
+        list: строки индекса, отсортированные по релевантности:
+              точное совпадение имени, затем совпадение начала имени, затем более короткие имена
+    """
+    query_lower = query.lower()
+    queryset = S3ObjectIndex.objects.all()
+
+    if len(query) >= TRIGRAM_MIN_LENGTH and search_index_ready():
+        # Фраза в кавычках: для trigram это поиск подстроки
+        match_expression = '"' + query.replace('"', '""') + '"'
+        queryset = queryset.filter(
+            id__in=RawSQL(f"SELECT rowid FROM {_fts_table()} WHERE name MATCH %s", [match_expression])
+        )
+    else:
+        queryset = queryset.filter(name_lower__contains=query_lower)
+
+    if scope_q is not None:
+        queryset = queryset.filter(scope_q)
+
+    queryset = queryset.annotate(
+        match_rank=Case(
+            When(name_lower=query_lower, then=Value(0)),
+            When(name_lower__startswith=query_lower, then=Value(1)),
+            default=Value(2),
+            output_field=IntegerField(),
+        ),
+        name_length=Length('name'),
+    ).order_by('match_rank', 'name_length', 'key')
+
+    return list(queryset.values('key', 'name', 'is_folder', 'size', 'last_modified')[:max_results])
+
@@ -0,0 +1,159 @@
+"""
+Проверка прав доступа пользователей к папкам S3 без запросов к базе данных.
+
+Все права пользователя (UserPermission) загружаются одним запросом и
+раскладываются в префиксное дерево по сегментам пути. Право на папку
+распространяется на все вложенные папки, поэтому проверка пути - это спуск
+по дереву от корня с поиском узла, в котором выставлен нужный флаг.
+
+Загруженные права кэшируются на объекте пользователя (на время запроса) и,
+если кэш-бэкенд Django общий для процессов (shared_cache.is_shared), в нем;
+кэш сбрасывается сигналами при изменении UserPermission (см. signals.py).
+С кэшем в памяти процесса сброс не виден другим процессам, и отозванные
+права продолжали бы действовать до истечения записи.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from . import shared_cache
+from .models import UserPermission
+
+# Соответствие названий прав полям модели UserPermission
+PERMISSION_FIELDS = {
+    'read': 'can_read',
+    'write': 'can_write',
+    'delete': 'can_delete',
+    'move': 'can_move',
+}
+
+# Атрибут объекта пользователя для хранения дерева прав в рамках запроса
+_USER_ATTR = '_s3_permission_trie'
+
+
+def _timeout():
+    return getattr(settings, 'S3_PERMISSION_CACHE_TIMEOUT', 300)
+
+
+def _cache_key(user_id):
+    return f"s3_permissions:{user_id}"
+
+
+def _segments(path):
+    """Сегменты пути для спуска по дереву; корень ('') - пустой список"""
+    return path.split('/') if path else []
+
+
+class PermissionTrie:
+    """Префиксное дерево прав пользователя по сегментам пути"""
+
+    def __init__(self, rows):
+        """
+        Args:
+            rows: кортежи (folder_path, can_read, can_write, can_delete, can_move)
+        """
+        self.rows = list(rows)
+        self._root = {'flags': frozenset(), 'children': {}}
+        for folder_path, *values in self.rows:
+            # Путь из базы используется как есть: совпадение проверяется точно,
+            # как и при прежней проверке folder_path=check_path
+            node = self._root
+            for segment in _segments(folder_path):
+                node = node['children'].setdefault(segment, {'flags': frozenset(), 'children': {}})
+            node['flags'] = frozenset(
+                permission for permission, value in zip(PERMISSION_FIELDS, values) if value
+            )
+
+    def allows(self, path, permission):
+        """Есть ли право permission на папку path или на одну из ее родительских папок"""
+        node = self._root
+        if permission in node['flags']:
+            return True
+        for segment in _segments(path):
+            node = node['children'].get(segment)
+            if node is None:
+                return False
+            if permission in node['flags']:
+                return True
+        return False
+
+    def allows_many(self, paths, permission):
+        """Проверка права для набора путей за один проход.
+
+        Результат для каждого общего предка вычисляется один раз и переиспользуется.
+
+        Returns:
+            dict: путь -> есть ли право
+        """
+        resolved = {}  # префикс пути -> (узел дерева или None, выдано ли право на нем или выше)
+        root_granted = permission in self._root['flags']
+        results = {}
+        for path in paths:
+            node, granted = self._root, root_granted
+            prefix = ''
+            for segment in _segments(path):
+                if granted or node is None:
+                    break
+                prefix = f"{prefix}/{segment}" if prefix else segment
+                state = resolved.get(prefix)
+                if state is None:
+                    child = node['children'].get(segment)
+                    state = (child, child is not None and permission in child['flags'])
+                    resolved[prefix] = state
+                node, granted = state
+            results[path] = granted
+        return results
+
+    def paths_with(self, permission):
+        """Пути, на которые право permission выдано явно"""
+        field_index = list(PERMISSION_FIELDS).index(permission)
+        return [row[0] for row in self.rows if row[1 + field_index]]
+
+
+def _load_rows(user):
+    return list(
+        UserPermission.objects.filter(user=user)
+        .values_list('folder_path', *PERMISSION_FIELDS.values())
+    )
+
+
+def get_permission_trie(user):
+    """Возвращает дерево прав пользователя (не более одного запроса к базе)"""
+    trie = getattr(user, _USER_ATTR, None)
+    if trie is not None:
+        return trie
+
+    if shared_cache.is_shared():
+        key = _cache_key(user.pk)
+        rows = cache.get(key)
+        if rows is None:
+            rows = _load_rows(user)
+            cache.set(key, rows, _timeout())
+    else:
+        rows = _load_rows(user)
+
+    trie = PermissionTrie(rows)
+    setattr(user, _USER_ATTR, trie)
+    return trie
+
+
+def has_permission(user, path, permission):
+    """Проверка права пользователя на нормализованный путь папки"""
+    if user.is_superuser:
+        return True
+    return get_permission_trie(user).allows(path, permission)
+
+
+def check_permissions(user, paths, permission):
+    """Проверка права пользователя на набор нормализованных путей папок.
+
+    Returns:
+        dict: путь -> есть ли право
+    """
+    if user.is_superuser:
+        return {path: True for path in paths}
+    return get_permission_trie(user).allows_many(paths, permission)
+
+
+def invalidate_user_permissions(user_id):
+    """Сбрасывает закэшированные права пользователя"""
+    cache.delete(_cache_key(user_id))
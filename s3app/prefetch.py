@@ -0,0 +1,64 @@
+"""
+Упреждающая загрузка элементов с сохранением порядка.
+
+Пока потребитель обрабатывает текущий элемент (например, пишет его в архив),
+следующие элементы загружаются параллельно. Результаты отдаются строго в
+порядке исходного набора; одновременно загружается не больше max_workers
+элементов, поэтому объем буферов ограничен.
+"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+_END = object()
+
+
+def iter_prefetched(items, fetch, max_workers=4, discard=None):
+    """Выполняет fetch для следующих элементов заранее и отдает результаты по порядку.
+
+    Args:
+        items: итерируемый набор элементов (может быть генератором)
+        fetch: функция элемент -> результат; выполняется в потоках
+        max_workers: сколько элементов загружается одновременно (1 - загрузка только следующего)
+        discard: функция для освобождения результатов, не отданных потребителю
+                 (например, при обрыве загрузки клиентом)
+
+    Yields:
+        tuple: (элемент, результат, исключение или None)
+    """
+    max_workers = max(1, max_workers)
+    items = iter(items)
+    pending = deque()
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='s3-prefetch')
+
+    def fill():
+        while len(pending) < max_workers:
+            item = next(items, _END)
+            if item is _END:
+                return
+            pending.append((item, executor.submit(fetch, item)))
+
+    try:
+        fill()
+        while pending:
+            item, future = pending.popleft()
+            try:
+                result, error = future.result(), None
+            except Exception as e:
+                result, error = None, e
+            # Следующий элемент начинает загружаться до того, как потребитель обработает текущий
+            fill()
+            yield item, result, error
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        if discard is not None:
+            # Уже загруженные результаты освобождаются сразу, загружаемые - по завершении
+            for _, future in pending:
+                future.add_done_callback(_discard_callback(discard))
+
+
+def _discard_callback(discard):
+    def callback(future):
+        if not future.cancelled() and future.exception() is None:
+            discard(future.result())
+    return callback
+
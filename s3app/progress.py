@@ -0,0 +1,269 @@
+"""
+Прогресс длительных операций и его потоковая передача клиенту.
+
+Массовые операции (bulk_ops) сообщают о ходе работы через progress_callback,
+передавая текущий результат. BulkProgress сводит результаты операций над
+несколькими элементами (файлами и папками) в один снимок: обработано
+элементов и объектов, скопировано байт, скорость и ошибки.
+
+Клиенту прогресс отдается потоком NDJSON (одно JSON-событие на строку):
+- {"event": "progress", ...} - текущий снимок прогресса;
+- {"event": "error", "message": ...} - очередная ошибка, по мере возникновения;
+- {"event": "heartbeat"} - соединение живо, но прогресс не менялся;
+- {"event": "done", "result": ...} или {"event": "failed", "error": ...} - завершение;
+- {"event": "poll", "status_url": ...} - поток фоновой задачи закрыт по истечении
+  S3_PROGRESS_STREAM_MAX_DURATION, дальше клиент опрашивает состояние задачи.
+"""
+import json
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+
+from .models import BackgroundJob
+
+
+def _stream_interval():
+    return getattr(settings, 'S3_PROGRESS_STREAM_INTERVAL', 0.5)
+
+
+def _heartbeat_interval():
+    return getattr(settings, 'S3_PROGRESS_HEARTBEAT_INTERVAL', 15)
+
+
+def _max_stream_duration():
+    return getattr(settings, 'S3_PROGRESS_STREAM_MAX_DURATION', 60)
+
+
+def progress_from_result(result):
+    """Приводит результат массовой операции (bulk_ops) к счетчикам прогресса"""
+    return {
+        'objects': result.get('copied_count', result.get('deleted_count', 0)),
+        'bytes': result.get('copied_bytes', 0),
+        'deleted': result.get('deleted_count', 0),
+        'failed_objects': len(result.get('errors', [])),
+    }
+
+
+def add_rates(progress, elapsed):
+    """Добавляет к прогрессу время выполнения и скорость обработки"""
+    elapsed = max(elapsed, 0.001)
+    progress = dict(progress, elapsed=round(elapsed, 3))
+    if progress.get('bytes'):
+        progress['bytes_per_second'] = round(progress['bytes'] / elapsed)
+    if progress.get('objects'):
+        progress['objects_per_second'] = round(progress['objects'] / elapsed, 2)
+    return progress
+
+
+class BulkProgress:
+    """Сводный прогресс операции над несколькими элементами.
+
+    Экземпляр передается как progress_callback в операции над отдельными
+    элементами; после каждого элемента вызывается item_done(). Каждый снимок
+    передается в on_update.
+    """
+
+    COUNTERS = ('objects', 'bytes', 'deleted', 'failed_objects')
+
+    def __init__(self, items_total=0, on_update=None):
+        self.items_total = items_total
+        self.items_done = 0
+        self.error_messages = []
+        self.on_update = on_update
+        self.started = time.monotonic()
+        self._done = dict.fromkeys(self.COUNTERS, 0)
+        self._current = dict.fromkeys(self.COUNTERS, 0)
+        self._lock = threading.Lock()
+
+    def __call__(self, result):
+        """Прогресс текущего элемента (результат массовой операции)"""
+        with self._lock:
+            self._current = progress_from_result(result)
+        self._notify()
+
+    def item_done(self, count=1):
+        """Отмечает текущий элемент (или count элементов общей операции) как обработанный"""
+        with self._lock:
+            for counter in self.COUNTERS:
+                self._done[counter] += self._current[counter]
+            self._current = dict.fromkeys(self.COUNTERS, 0)
+            self.items_done += count
+        self._notify()
+
+    def add_error(self, message):
+        with self._lock:
+            self.error_messages.append(message)
+        self._notify()
+
+    def snapshot(self):
+        with self._lock:
+            progress = {counter: self._done[counter] + self._current[counter] for counter in self.COUNTERS}
+            progress.update(
+                items_done=self.items_done,
+                items_total=self.items_total,
+                errors=len(self.error_messages),
+                error_messages=list(self.error_messages),
+            )
+        return add_rates(progress, time.monotonic() - self.started)
+
+    def _notify(self):
+        if self.on_update:
+            self.on_update(self.snapshot())
+
+
+def ndjson_line(event, **data):
+    """Одно событие потока NDJSON"""
+    return json.dumps(dict(data, event=event), ensure_ascii=False, default=str) + '\n'
+
+
+def _progress_lines(progress, sent_errors):
+    """События для снимка прогресса: новые ошибки и сам снимок.
+
+    Returns:
+        tuple: (список строк, количество уже отправленных ошибок)
+    """
+    messages = progress.get('error_messages') or []
+    lines = [ndjson_line('error', message=message) for message in messages[sent_errors:]]
+    data = {key: value for key, value in progress.items() if key != 'error_messages'}
+    lines.append(ndjson_line('progress', **data))
+    return lines, len(messages)
+
+
+def stream_operation(operation):
+    """Выполняет операцию в отдельном потоке и отдает ее прогресс событиями NDJSON.
+
+    Используется без очереди фоновых задач. Если клиент отключился, генератор
+    дожидается завершения операции и пишет ее итог в лог: запрос остается
+    активным, пока идет операция, и плавная остановка процесса веб-сервера
+    не прерывает ее на середине.
+
+    Args:
+        operation: функция, принимающая progress_callback (снимки прогресса)
+                   и возвращающая результат операции
+
+    Yields:
+        str: строки NDJSON; последнее событие - done или failed
+    """
+    events = queue.Queue()
+
+    def run():
+        try:
+            result = operation(lambda progress: events.put(('progress', progress)))
+            events.put(('done', result))
+        except Exception as e:
+            print(f"Error in streamed operation: {str(e)}")
+            events.put(('failed', str(e) or e.__class__.__name__))
+        finally:
+            # Поток завершается - его соединения с базой больше не понадобятся
+            connections.close_all()
+
+    thread = threading.Thread(target=run, name='s3-progress-stream')
+    thread.start()
+    finished = False
+    try:
+        for line in _operation_events(events):
+            yield line
+        finished = True
+    finally:
+        if not finished:
+            # Клиент отключился: операция продолжается, дожидаемся ее завершения
+            thread.join()
+            for kind, data in _drain(events):
+                if kind == 'done':
+                    message = data.get('message', '') if isinstance(data, dict) else data
+                    print(f"Streamed operation finished after client disconnect: {message}")
+                elif kind == 'failed':
+                    print(f"Streamed operation failed after client disconnect: {data}")
+
+
+def _drain(events):
+    while True:
+        try:
+            yield events.get_nowait()
+        except queue.Empty:
+            return
+
+
+def _operation_events(events):
+    """События NDJSON для сообщений очереди потока операции"""
+    interval = _stream_interval()
+    sent_errors = 0
+    latest = None
+    last_sent = time.monotonic()
+    while True:
+        try:
+            kind, data = events.get(timeout=interval)
+        except queue.Empty:
+            kind, data = None, None
+        if kind == 'progress':
+            latest = data
+
+        now = time.monotonic()
+        finished = kind in ('done', 'failed')
+        if latest is not None and (finished or now - last_sent >= interval):
+            lines, sent_errors = _progress_lines(latest, sent_errors)
+            yield from lines
+            latest = None
+            last_sent = now
+        elif kind is None and now - last_sent >= _heartbeat_interval():
+            yield ndjson_line('heartbeat')
+            last_sent = now
+
+        if kind == 'done':
+            yield ndjson_line('done', result=data)
+            return
+        if kind == 'failed':
+            yield ndjson_line('failed', error=data)
+            return
+
+
+def stream_job(job, status_url=None):
+    """Отдает прогресс фоновой задачи событиями NDJSON, пока задача не завершится.
+
+    Состояние задачи читается из базы раз в S3_PROGRESS_STREAM_INTERVAL секунд,
+    поэтому поток можно открыть в любом процессе, в том числе после перезагрузки страницы.
+    Поток занимает воркер веб-сервера, поэтому через S3_PROGRESS_STREAM_MAX_DURATION
+    секунд он закрывается событием poll, и клиент дальше опрашивает status_url.
+    """
+    yield ndjson_line('job', job_id=job.id, status=job.status, status_url=status_url)
+
+    deadline = time.monotonic() + _max_stream_duration()
+    interval = _stream_interval()
+    sent_errors = 0
+    status = job.status
+    progress = None
+    last_sent = time.monotonic()
+    while True:
+        state = BackgroundJob.objects.filter(id=job.id).values('status', 'progress', 'result', 'error').first()
+        if state is None:
+            yield ndjson_line('failed', error='Задача удалена')
+            return
+
+        now = time.monotonic()
+        if state['status'] != status:
+            status = state['status']
+            yield ndjson_line('status', status=status)
+            last_sent = now
+        if state['progress'] and state['progress'] != progress:
+            progress = state['progress']
+            lines, sent_errors = _progress_lines(progress, sent_errors)
+            yield from lines
+            last_sent = now
+
+        if status == 'succeeded':
+            yield ndjson_line('done', result=state['result'])
+            return
+        if status == 'failed':
+            yield ndjson_line('failed', error=state['error'], result=state['result'])
+            return
+
+        if now >= deadline:
+            yield ndjson_line('poll', status=status, status_url=status_url)
+            return
+        if now - last_sent >= _heartbeat_interval():
+            yield ndjson_line('heartbeat')
+            last_sent = now
+        time.sleep(interval)
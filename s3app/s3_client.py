@@ -0,0 +1,117 @@
+"""
+Общий для процесса пул клиентов S3.
+
+Создание boto3-клиента (сессия botocore, модели сервиса, пул соединений urllib3)
+занимает десятки миллисекунд, поэтому клиент создается один раз на процесс и
+переиспользуется всеми экземплярами S3Service. Клиенты boto3 потокобезопасны.
+"""
+import threading
+
+import boto3
+from botocore.config import Config
+from django.conf import settings
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _build_config():
+    """Формирует конфигурацию botocore из настроек проекта"""
+    return Config(
+        # Размер пула соединений urllib3 (по умолчанию в botocore - 10)
+        max_pool_connections=getattr(settings, 'S3_MAX_POOL_CONNECTIONS', 50),
+        connect_timeout=getattr(settings, 'S3_CONNECT_TIMEOUT', 5),
+        read_timeout=getattr(settings, 'S3_READ_TIMEOUT', 60),
+        tcp_keepalive=getattr(settings, 'S3_TCP_KEEPALIVE', True),
+        retries={
+            'max_attempts': getattr(settings, 'S3_MAX_RETRY_ATTEMPTS', 3),
+            'mode': 'standard',
+        },
+    )
+
+
+def get_s3_client(endpoint_url, access_key, secret_key, region_name, use_ssl=False):
+    """Возвращает общий клиент S3 для указанных параметров подключения.
+
+    Клиент создается при первом обращении и затем переиспользуется всеми потоками процесса.
+    """
+    registry_key = (endpoint_url, access_key, region_name, use_ssl)
+    client = _clients.get(registry_key)
+    if client is not None:
+        return client
+
+    with _clients_lock:
+        # Повторная проверка: клиент мог быть создан другим потоком, пока мы ждали блокировку
+        client = _clients.get(registry_key)
+        if client is None:
+            session = boto3.session.Session()
+            client = session.client(
+                's3',
+                endpoint_url=endpoint_url,
+                aws_access_key_id=access_key,
+                aws_secret_access_key=secret_key,
+                region_name=region_name,
+                use_ssl=use_ssl,
+                config=_build_config(),
+            )
+            _clients[registry_key] = client
+        return client
+
+
+def _pool_stats(pool):
+    """Сведения о пуле соединений хоста; недоступные поля - None"""
+    queue = getattr(pool, 'pool', None)
+    maxsize = getattr(queue, 'maxsize', None)
+    in_use = None
+    if queue is not None and maxsize is not None:
+        # Очередь пула содержит свободные соединения и еще не открытые слоты
+        in_use = max(0, maxsize - queue.qsize())
+    return {
+        'host': getattr(pool, 'host', None),
+        'port': getattr(pool, 'port', None),
+        'maxsize': maxsize,
+        'in_use': in_use,
+        'connections_opened': getattr(pool, 'num_connections', None),
+        'requests_made': getattr(pool, 'num_requests', None),
+    }
+
+
+def get_pool_stats():
+    """Возвращает сведения о загрузке пулов соединений всех клиентов процесса.
+
+    Сведения о пулах берутся из внутренних структур botocore/urllib3
+    (URLLib3Session -> PoolManager -> HTTPConnectionPool); если они недоступны
+    в установленной версии, соответствующие поля равны None.
+
+    Returns:
+        list: по одной записи на клиента с информацией по каждому пулу хоста
+    """
+    with _clients_lock:
+        clients = list(_clients.items())
+
+    stats = []
+    for (endpoint_url, _access_key, region_name, _use_ssl), client in clients:
+        max_connections = client.meta.config.max_pool_connections
+        endpoint = getattr(client, '_endpoint', None)
+        manager = getattr(getattr(endpoint, 'http_session', None), '_manager', None)
+        manager_pools = getattr(manager, 'pools', None)
+
+        pools = None
+        in_use_total = None
+        if manager_pools is not None:
+            pools = [_pool_stats(pool) for pool in map(manager_pools.get, list(manager_pools.keys())) if pool]
+            if all(p['in_use'] is not None for p in pools):
+                in_use_total = sum(p['in_use'] for p in pools)
+
+        utilization = None
+        if in_use_total is not None and max_connections:
+            utilization = round(in_use_total / max_connections, 3)
+        stats.append({
+            'endpoint_url': endpoint_url,
+            'region_name': region_name,
+            'max_pool_connections': max_connections,
+            'in_use': in_use_total,
+            'utilization': utilization,
+            'pools': pools,
+        })
+    return stats
@@ -1,13 +1,27 @@
 import os
-import boto3
+import tempfile
 import uuid
 from botocore.exceptions import ClientError
 from django.conf import settings
 from django.core.exceptions import PermissionDenied
+from django.db.models import Q
 from django.utils import timezone
 import datetime
 import mimetypes
-from .models import UserPermission, S3ActionLog, TrashItem, DocumentSignature
+import base64
+import json
+import functools
+import hashlib
+import heapq
+import operator
+from .models import S3ActionLog, TrashItem, DocumentSignature, S3ObjectIndex
+from .s3_client import get_s3_client
+from .folder_discovery import discover_folders
+from . import (
+    archive_cache, bulk_ops, folder_tree, journal, listing_cache, object_index, object_search, permissions,
+    prefetch, trash_manifest, versioned_trash, zip_stream
+)
+from .progress import BulkProgress
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -25,88 +39,49 @@ AWS_S3_ENDPOINT_URL = os.environ.get('AWS_S3_ENDPOINT_URL', 'https://s3.timeweb.
 # S3 region
 AWS_S3_REGION_NAME = os.environ.get('AWS_S3_REGION_NAME', 'ru-1')
 
+# Служебные папки, скрытые от обычных пользователей
+SERVICE_FOLDERS = ('__trash', '__documents', '__cache')
+
+# Форматы, которые уже сжаты: в архив записываются без сжатия
+COMPRESSED_EXTENSIONS = {
+    '.zip', '.gz', '.tgz', '.bz2', '.xz', '.7z', '.rar', '.zst',
+    '.docx', '.xlsx', '.pptx', '.odt', '.ods', '.odp', '.epub', '.jar', '.apk',
+    '.pdf', '.heic', '.avif',
+}
+# Изображения без сжатия (или со слабым) - сжимаются deflate хорошо
+UNCOMPRESSED_IMAGE_EXTENSIONS = {'.bmp', '.svg', '.tiff', '.ico'}
+
 class S3Service:
     """Класс для работы с S3 хранилищем"""
 
     def __init__(self):
-        """Инициализация клиента S3"""
-        self.s3_client = boto3.client(
-            's3',
+        """Инициализация клиента S3 (общий для процесса клиент из пула)"""
+        self.s3_client = get_s3_client(
             endpoint_url=AWS_S3_ENDPOINT_URL,
-            aws_access_key_id=AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
+            access_key=AWS_ACCESS_KEY_ID,
+            secret_key=AWS_SECRET_ACCESS_KEY,
             region_name=AWS_S3_REGION_NAME,
-            use_ssl = False,
+            use_ssl=False,
         )
         self.bucket_name = AWS_STORAGE_BUCKET_NAME
 
     def check_permission(self, user, folder_path, required_permission):
-        """Проверка прав доступа пользователя к папке"""
-        print(f"--- Checking permission ---")  # DEBUG
-        print(f"User: {user.username} ({user.id})")  # DEBUG
-        print(f"Requested Path: '{folder_path}'")  # DEBUG
-        print(f"Required Permission: '{required_permission}'")  # DEBUG
-
-        if user.is_superuser:
-            print("User is superuser. Access granted.")  # DEBUG
-            return True
+        """Проверка прав доступа пользователя к папке.
 
-        # Нормализуем путь к папке
-        normalized_path = self._normalize_path(folder_path)
-        print(f"Normalized Path: '{normalized_path}'")  # DEBUG
-
-        # Получаем все права пользователя
-        permissions = UserPermission.objects.filter(user=user)
-        print(
-            f"All permissions found for user: {list(permissions.values_list('folder_path', 'can_read', 'can_write', 'can_delete', 'can_move'))}")  # DEBUG
-
-        # Проверяем права для указанной папки и всех родительских папок
-        check_path = normalized_path
-        while True:
-            print(f"  Checking path: '{check_path}'")  # DEBUG
-            # Оптимизация: Получаем права для текущего пути за один запрос
-            perm_for_path = permissions.filter(folder_path=check_path).first()
-
-            if perm_for_path:
-                print(
-                    f"    Found permission object for '{check_path}': ID={perm_for_path.id}, Read={perm_for_path.can_read}, Write={perm_for_path.can_write}, Delete={perm_for_path.can_delete}, Move={perm_for_path.can_move}")  # DEBUG
-                if required_permission == 'read' and perm_for_path.can_read:
-                    print(f"    Read permission sufficient. Access granted.")  # DEBUG
-                    return True
-                if required_permission == 'write' and perm_for_path.can_write:
-                    print(f"    Write permission sufficient. Access granted.")  # DEBUG
-                    return True
-                if required_permission == 'delete' and perm_for_path.can_delete:
-                    print(f"    Delete permission sufficient. Access granted.")  # DEBUG
-                    return True
-                if required_permission == 'move' and perm_for_path.can_move:
-                    print(f"    Move permission sufficient. Access granted.")  # DEBUG
-                    return True
-                # Если нашли права, но нужного нет
-                print(
-                    f"    Permission found for '{check_path}', but not the required '{required_permission}'.")  # DEBUG
-
-            else:
-                print(f"    No specific permission found for path '{check_path}'.")  # DEBUG
-
-            # Если дошли до корня ('') и права не найдены или не подходят
-            if check_path == '':
-                print(
-                    f"  Reached root (''). Permission check failed for original path '{normalized_path}'. Access denied.")  # DEBUG
-                return False
-
-            # Переходим к родительской папке
-            parent_path = '/'.join(check_path.split('/')[:-1])
-            print(f"  Moving to parent path: '{parent_path}'")  # DEBUG
-            # Предотвращаем зацикливание
-            if parent_path == check_path:
-                print(f"  Parent path is the same as current path. Stopping check. Access denied.")  # DEBUG
-                return False
-            check_path = parent_path
+        Права на папку распространяются на все вложенные папки; права пользователя
+        загружаются один раз и проверяются без запросов к базе (см. permissions.py).
+        """
+        return permissions.has_permission(user, self._normalize_path(folder_path), required_permission)
 
-        # Если цикл завершился без return True (не должно произойти из-за проверки check_path == '')
-        return False
+    def check_permissions_bulk(self, user, paths, required_permission):
+        """Проверка прав доступа пользователя сразу к нескольким папкам.
 
+        Returns:
+            dict: переданный путь -> есть ли право required_permission
+        """
+        normalized_paths = {path: self._normalize_path(path) for path in paths}
+        allowed = permissions.check_permissions(user, set(normalized_paths.values()), required_permission)
+        return {path: allowed[normalized] for path, normalized in normalized_paths.items()}
 
     def log_action(self, user, action_type, object_path, success=True, ip_address=None, details=None):
         """Логирование действий пользователя"""
@@ -128,123 +103,26 @@ class S3Service:
     def list_objects(self, user, prefix='', delimiter='/'):
         """Получение списка объектов в директории (с пагинацией S3)"""
         normalized_prefix = self._normalize_path(prefix)
-        print(normalized_prefix)
-
-        # Проверка специальной папки __documents - доступна только суперпользователям
-        if normalized_prefix == '__documents' or normalized_prefix.startswith('__documents/'):
-            if not user.is_superuser:
-                raise PermissionDenied("Доступ к папке документов разрешен только администраторам")
-
-        if not self.check_permission(user, normalized_prefix, 'read'):
-            raise PermissionDenied("У вас нет прав для просмотра содержимого этой папки")
 
         # Если префикс не пустой и не заканчивается на '/', добавляем '/'
         # Это важно для корректной работы Delimiter
-        s3_prefix = normalized_prefix
-        if s3_prefix and not s3_prefix.endswith('/'):
-            s3_prefix += '/'
-
-        result = {
-            'directories': [],
-            'files': []
-        }
-        processed_dirs = set()
+        s3_prefix = self._to_s3_prefix(normalized_prefix)
 
         try:
-            paginator = self.s3_client.get_paginator('list_objects_v2')
-            pages = paginator.paginate(
-                Bucket=self.bucket_name,
-                Prefix=s3_prefix,
-                Delimiter=delimiter  # Keep delimiter for browsing
-            )
+            self._check_list_access(user, normalized_prefix)
+
+            if object_index.is_enabled() and delimiter == '/':
+                # Содержимое папки выбирается из локального индекса одним запросом
+                listing = self._listing_from_index(object_index.list_folder(normalized_prefix))
+            else:
+                # Общий для всех пользователей листинг берем из кэша, если он есть
+                listing = listing_cache.get_listing(normalized_prefix, f'full:{delimiter}')
+                if listing is None:
+                    listing = self._fetch_listing(s3_prefix, delimiter)
+                    listing_cache.set_listing(normalized_prefix, f'full:{delimiter}', listing)
 
-            for page in pages:
-                # Получаем общие префиксы (директории)
-                if 'CommonPrefixes' in page:
-                    for common_prefix in page['CommonPrefixes']:
-                        prefix_path = common_prefix['Prefix']
-                        # Проверяем, не обработали ли уже эту директорию
-                        if prefix_path not in processed_dirs:
-                            # Извлекаем имя последней части пути
-                            dir_name = prefix_path.rstrip('/').split('/')[-1]
-
-                            # Скрываем служебные папки для обычных пользователей
-                            if (dir_name == '__trash' or dir_name == '__documents') and not user.is_superuser:
-                                continue
-
-                            result['directories'].append({
-                                'name': dir_name,
-                                'path': prefix_path.rstrip('/') # Сохраняем путь без слеша на конце для консистентности
-                            })
-                            processed_dirs.add(prefix_path)
-                # Получаем содержимое (файлы и "пустые" объекты папок)
-                if 'Contents' in page:
-                    for item in page['Contents']:
-                        item_key = item['Key']
-
-                        # Пропускаем сам объект текущей директории (если он есть)
-                        # Например, при prefix='folder/' может вернуться объект с Key='folder/'
-                        if item_key == s3_prefix:
-                            continue
-
-                        # Скрываем файлы и папки внутри служебных директорий для обычных пользователей
-                        if not user.is_superuser and ('__trash/' in item_key or item_key.startswith('__trash/') or
-                                                    '__documents/' in item_key or item_key.startswith('__documents/')):
-                            continue
-
-                        # Извлекаем имя файла/объекта относительно текущей папки
-                        relative_name = item_key
-                        if s3_prefix:
-                             # Убедимся, что заменяем только в начале строки
-                            if relative_name.startswith(s3_prefix):
-                                relative_name = relative_name[len(s3_prefix):]
-
-                        # Если после удаления префикса осталась пустая строка - пропускаем
-                        if not relative_name:
-                            continue
-
-                        # Пропускаем "подпапки", если они представлены как объекты (например, 'subdir/')
-                        # Они уже должны быть обработаны через CommonPrefixes
-                        # Также пропускаем, если имя содержит '/', но не является файлом (размер 0 и оканчивается на '/')
-                        # Это может произойти, если Delimiter не сработал ожидаемо или объект создан некорректно
-                        if relative_name.endswith('/') and item['Size'] == 0:
-                            # Дополнительно проверим, нет ли уже такой директории из CommonPrefixes
-                            dir_path_check = item_key.rstrip('/')
-
-                            # Пропускаем директории служебных папок для обычных пользователей
-                            dir_name = relative_name.rstrip('/')
-                            if (dir_name == '__trash' or dir_name == '__documents') and not user.is_superuser:
-                                continue
-
-                            if not any(d['path'] == dir_path_check for d in result['directories']):
-                                # Если вдруг папка не пришла в CommonPrefixes, добавим ее
-                                # Пропускаем служебные папки для обычных пользователей
-                                if (dir_name == '__trash' or dir_name == '__documents') and not user.is_superuser:
-                                    continue
-
-                                result['directories'].append({
-                                    'name': dir_name,
-                                    'path': dir_path_check
-                                })
-                                processed_dirs.add(item_key) # Добавляем полный ключ с /
-                            continue # Пропускаем добавление в files
-
-                        # Если это не папка, добавляем в файлы
-                        file_item = {
-                            'name': relative_name,  # Имя относительно текущей папки
-                            'path': item_key,       # Полный путь (Key) от корня бакета
-                            'size': item['Size'],
-                            'last_modified': item['LastModified']
-                        }
-
-                        # Проверяем, является ли файл изображением
-                        if self._is_image_file(relative_name):
-                            file_item['is_image'] = True
-                            file_item['preview_url'] = self.get_presigned_url(item_key)
-                        else:
-                            file_item['is_image'] = False
-
-                        result['files'].append(file_item)
+            # Фильтрация под конкретного пользователя выполняется поверх общей записи кэша
+            result = self._filter_listing_for_user(listing, user)
 
             # Логируем успешное действие после получения всех данных
             # Move this inside try/except to continue even if logging fails
@@ -253,9 +131,6 @@ class S3Service:
             except Exception as e:
                 print(f"Error in logging list action: {str(e)}")
 
-            result['directories'].sort(key=lambda x: x['name'])
-            result['files'].sort(key=lambda x: x['name'])
-
             return result
         except ClientError as e:
             # Логируем неудачное действие
@@ -271,6 +146,409 @@ class S3Service:
                 print(f"Error in logging permission denied: {str(log_error)}")
             raise
 
+    def list_objects_page(self, user, prefix='', cursor=None, page_size=50, delimiter='/'):
+        """Получение одной страницы содержимого директории по курсору.
+
+        В отличие от list_objects, не собирает листинг папки целиком: страница
+        читается из S3 одним запросом от ключа курсора (StartAfter). Папки и файлы
+        идут в порядке ключей, внутри страницы папки показываются первыми.
+
+        Args:
+            user: пользователь, запрашивающий список
+            prefix: путь к директории
+            cursor: непрозрачный курсор, полученный с предыдущей страницы (None - первая страница)
+            page_size: количество элементов на странице
+
+        Returns:
+            dict: {'directories': [...], 'files': [...], 'next_cursor': str или None}
+        """
+        normalized_prefix = self._normalize_path(prefix)
+        s3_prefix = self._to_s3_prefix(normalized_prefix)
+
+        variant = f'page:{delimiter}:{page_size}:{cursor or ""}'
+
+        try:
+            self._check_list_access(user, normalized_prefix)
+
+            if object_index.is_enabled() and delimiter == '/':
+                listing = self._index_listing_window(normalized_prefix, cursor, page_size)
+            else:
+                listing = listing_cache.get_listing(normalized_prefix, variant)
+                if listing is None:
+                    listing = self._fetch_listing_window(s3_prefix, cursor, page_size, delimiter)
+                    listing_cache.set_listing(normalized_prefix, variant, listing)
+
+            # Служебные папки скрываются уже после выборки окна, поэтому для обычных
+            # пользователей страница может оказаться на пару элементов короче
+            result = self._filter_listing_for_user(listing, user)
+            result['next_cursor'] = listing['next_cursor']
+
+            try:
+                self.log_action(user, 'list', s3_prefix or '(root)')
+            except Exception as e:
+                print(f"Error in logging list action: {str(e)}")
+
+            return result
+        except ClientError as e:
+            try:
+                self.log_action(user, 'read', s3_prefix or '(root)', success=False, details=str(e))
+            except Exception as log_error:
+                print(f"Error in logging error: {str(log_error)}")
+            raise
+        except PermissionDenied as e:  # Перехватываем PermissionDenied, чтобы залогировать его
+            try:
+                self.log_action(user, 'read', s3_prefix or '(root)', success=False, details=f"Permission denied: {str(e)}")
+            except Exception as log_error:
+                print(f"Error in logging permission denied: {str(log_error)}")
+            raise
+
+    def _fetch_listing(self, s3_prefix, delimiter):
+        """Запрашивает из S3 полный листинг директории (все страницы list_objects_v2)"""
+        listing = {
+            'directories': [],
+            'files': []
+        }
+        processed_dirs = set()
+
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        pages = paginator.paginate(
+            Bucket=self.bucket_name,
+            Prefix=s3_prefix,
+            Delimiter=delimiter  # Keep delimiter for browsing
+        )
+
+        for page in pages:
+            self._parse_listing_page(page, s3_prefix, listing, processed_dirs)
+
+        listing['directories'].sort(key=lambda x: x['name'])
+        listing['files'].sort(key=lambda x: x['name'])
+        return listing
+
+    def _index_listing_window(self, normalized_prefix, cursor, page_size):
+        """Формирует одно окно листинга из локального индекса (keyset-пагинация по имени)"""
+        cursor_data = self._decode_listing_cursor(cursor)
+        after = tuple(cursor_data['ix']) if isinstance(cursor_data.get('ix'), list) else None
+
+        rows, has_more = object_index.list_folder_page(normalized_prefix, after=after, limit=page_size)
+
+        listing = self._listing_from_index(rows)
+        listing['next_cursor'] = None
+        if has_more:
+            listing['next_cursor'] = self._encode_listing_cursor({'ix': [rows[-1]['is_folder'], rows[-1]['name']]})
+        return listing
+
+    def _listing_from_index(self, rows):
+        """Преобразует строки индекса в структуру листинга директории"""
+        listing = {
+            'directories': [],
+            'files': []
+        }
+        for row in rows:
+            if row['is_folder']:
+                listing['directories'].append({
+                    'name': row['name'],
+                    'path': row['key'].rstrip('/')
+                })
+            else:
+                listing['files'].append({
+                    'name': row['name'],
+                    'path': row['key'],
+                    'size': row['size'],
+                    'last_modified': row['last_modified'],
+                    'is_image': self._is_image_file(row['name'])
+                })
+        return listing
+
+    def _fetch_listing_window(self, s3_prefix, cursor, page_size, delimiter):
+        """Запрашивает из S3 одно окно листинга размером page_size, начиная с курсора.
+
+        Окно читается одним запросом list_objects_v2 с MaxKeys около page_size,
+        поэтому стоимость страницы не зависит от размера папки. Папки и файлы идут
+        в порядке ключей S3 (вперемешку), внутри страницы папки показываются первыми.
+        Курсор хранит последний показанный ключ (StartAfter).
+        """
+        cursor_data = self._decode_listing_cursor(cursor)
+        after = cursor_data.get('a')
+        request_kwargs = {
+            'Bucket': self.bucket_name,
+            'Prefix': s3_prefix,
+            'Delimiter': delimiter,
+            # Один лишний элемент показывает, есть ли следующая страница; еще один - запас
+            # на объект самой папки и на папку after, которая после StartAfter приходит снова
+            'MaxKeys': page_size + 2,
+        }
+        if after:
+            request_kwargs['StartAfter'] = after
+        response = self.s3_client.list_objects_v2(**request_kwargs)
+
+        page = {'directories': [], 'files': []}
+        self._parse_listing_page(response, s3_prefix, page, set())
+        items = sorted(
+            [(entry['path'] + '/', 'directories', entry) for entry in page['directories']]
+            + [(entry['path'], 'files', entry) for entry in page['files']],
+            key=lambda item: item[0]
+        )
+        # После StartAfter объекты внутри последней показанной папки снова сворачиваются в ее префикс
+        items = [item for item in items if not after or item[0] > after]
+        window = items[:page_size]
+
+        listing = {
+            'directories': [entry for _, kind, entry in window if kind == 'directories'],
+            'files': [entry for _, kind, entry in window if kind == 'files'],
+            'next_cursor': None
+        }
+        if window and (len(items) > page_size or response.get('IsTruncated')):
+            listing['next_cursor'] = self._encode_listing_cursor({'a': window[-1][0]})
+        return listing
+
+    def _filter_listing_for_user(self, listing, user):
+        """Формирует листинг для пользователя поверх общего (закэшированного) листинга.
+
+        Обычным пользователям не показываются служебные папки и их содержимое.
+        """
+        if user.is_superuser:
+            directories = list(listing['directories'])
+            files = [dict(file_item) for file_item in listing['files']]
+        else:
+            directories = [d for d in listing['directories'] if d['name'] not in SERVICE_FOLDERS]
+            files = [dict(file_item) for file_item in listing['files'] if not self._is_service_key(file_item['path'])]
+
+        return {
+            'directories': directories,
+            'files': files
+        }
+
+    def _is_service_key(self, key):
+        """Проверяет, находится ли объект внутри служебной папки"""
+        return any(f"{folder}/" in key for folder in SERVICE_FOLDERS)
+
+    def search_objects(self, user, prefix='', query='', max_results=200):
+        """Поиск файлов и папок, имя которых содержит query, в папке prefix и всех ее подпапках.
+
+        При включенном индексе метаданных поиск выполняется одним запросом к индексу
+        (с фильтрацией по правам доступа в самом запросе), иначе - просмотром листинга S3
+        всей области поиска.
+
+        Returns:
+            list: найденные элементы, наиболее релевантные первыми
+        """
+        normalized_prefix = self._normalize_path(prefix)
+        query = (query or '').strip()
+        if not query:
+            return []
+
+        if normalized_prefix == '__documents' or normalized_prefix.startswith('__documents/'):
+            if not user.is_superuser:
+                raise PermissionDenied("Доступ к папке документов разрешен только администраторам")
+
+        folder_key = self._to_s3_prefix(normalized_prefix)
+        readable_roots = self._readable_roots(user)
+        if readable_roots == []:
+            return []
+
+        if object_index.is_enabled():
+            rows = object_search.search(
+                query,
+                scope_q=self._search_scope_q(user, folder_key, readable_roots),
+                max_results=max_results
+            )
+        else:
+            rows = self._scan_search(user, folder_key, query, readable_roots, max_results)
+
+        results = []
+        for row in rows:
+            item = {
+                'name': row['name'],
+                'path': row['key'],  # Для папок - с '/' на конце
+                'display_path': row['key'][len(folder_key):].rstrip('/'),
+                'is_folder': row['is_folder'],
+            }
+            if not row['is_folder']:
+                item['size'] = row['size']
+                item['last_modified'] = row['last_modified']
+                item['is_image'] = self._is_image_file(row['name'])
+            results.append(item)
+
+        try:
+            self.log_action(user, 'search', folder_key or '(root)', details=f"Запрос: {query}")
+        except Exception as e:
+            print(f"Error in logging search action: {str(e)}")
+
+        return results
+
+    def _readable_roots(self, user):
+        """Возвращает папки, на которые у пользователя есть право чтения.
+
+        Право на папку распространяется на все вложенные папки, поэтому достаточно
+        списка "корней". None означает доступ ко всему хранилищу.
+        """
+        if user.is_superuser:
+            return None
+        roots = sorted({
+            self._normalize_path(path)
+            for path in permissions.get_permission_trie(user).paths_with('read')
+        })
+        if '' in roots:
+            return None
+        # Убираем папки, уже покрытые правами на родительскую папку
+        result = []
+        for root in roots:
+            if not any(root.startswith(parent + '/') for parent in result):
+                result.append(root)
+        return result
+
+    def _search_scope_q(self, user, folder_key, readable_roots):
+        """Условие выборки индекса: область поиска, права доступа и скрытие служебных папок"""
+        scope = Q()
+        if folder_key:
+            scope &= object_index.prefix_q(folder_key) & ~Q(key=folder_key)
+        if readable_roots is not None:
+            scope &= functools.reduce(operator.or_, [object_index.prefix_q(root + '/') for root in readable_roots])
+        if not user.is_superuser:
+            for folder in SERVICE_FOLDERS:
+                scope &= ~Q(key__contains=f"{folder}/")
+        return scope
+
+    def _scan_search(self, user, folder_key, query, readable_roots, max_results):
+        """Поиск без индекса: рекурсивный листинг S3 с фильтрацией по подстроке.
+
+        Просматривается вся область поиска: лучшие совпадения могут встретиться в
+        конце листинга. В памяти хранится не больше 2 * max_results кандидатов.
+        """
+        query_lower = query.lower()
+        rows = []
+        seen_folders = set()
+
+        def rank(row):
+            name_lower = row['name'].lower()
+            match_rank = 0 if name_lower == query_lower else 1 if name_lower.startswith(query_lower) else 2
+            return match_rank, len(row['name']), row['key']
+
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=folder_key):
+            for obj in page.get('Contents', []):
+                key = obj['Key']
+                if key == folder_key:
+                    continue
+                if not user.is_superuser and self._is_service_key(key):
+                    continue
+                if readable_roots is not None and not any(key.startswith(root + '/') for root in readable_roots):
+                    continue
+
+                parts = key[len(folder_key):].split('/')
+                # Папки по пути к объекту (в том числе неявные, без объекта-маркера)
+                for depth in range(1, len(parts)):
+                    sub_folder_key = folder_key + '/'.join(parts[:depth]) + '/'
+                    if sub_folder_key in seen_folders:
+                        continue
+                    seen_folders.add(sub_folder_key)
+                    if query_lower in parts[depth - 1].lower():
+                        rows.append({'key': sub_folder_key, 'name': parts[depth - 1], 'is_folder': True,
+                                     'size': 0, 'last_modified': None})
+
+                name = parts[-1]
+                if name and query_lower in name.lower():
+                    rows.append({'key': key, 'name': name, 'is_folder': False,
+                                 'size': obj.get('Size', 0), 'last_modified': obj.get('LastModified')})
+
+            if len(rows) >= 2 * max_results:
+                rows = heapq.nsmallest(max_results, rows, key=rank)
+
+        return heapq.nsmallest(max_results, rows, key=rank)
+
+    def _check_list_access(self, user, normalized_prefix):
+        """Проверка прав на просмотр содержимого директории"""
+        # Проверка специальной папки __documents - доступна только суперпользователям
+        if normalized_prefix == '__documents' or normalized_prefix.startswith('__documents/'):
+            if not user.is_superuser:
+                raise PermissionDenied("Доступ к папке документов разрешен только администраторам")
+
+        if not self.check_permission(user, normalized_prefix, 'read'):
+            raise PermissionDenied("У вас нет прав для просмотра содержимого этой папки")
+
+    def _to_s3_prefix(self, normalized_prefix):
+        """Преобразует нормализованный путь папки в префикс S3 (с '/' на конце)"""
+        if normalized_prefix and not normalized_prefix.endswith('/'):
+            return normalized_prefix + '/'
+        return normalized_prefix
+
+    def _encode_listing_cursor(self, data):
+        """Кодирует состояние листинга в непрозрачный курсор для URL"""
+        raw = json.dumps(data, separators=(',', ':')).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+    def _decode_listing_cursor(self, cursor):
+        """Декодирует курсор листинга. Некорректный курсор означает первую страницу"""
+        if not cursor:
+            return {}
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            data = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+            return data if isinstance(data, dict) else {}
+        except (ValueError, TypeError):
+            return {}
+
+    def _parse_listing_page(self, page, s3_prefix, result, processed_dirs):
+        """Разбирает одну страницу ответа list_objects_v2 и добавляет элементы в result"""
+        # Получаем общие префиксы (директории)
+        if 'CommonPrefixes' in page:
+            for common_prefix in page['CommonPrefixes']:
+                prefix_path = common_prefix['Prefix']
+                # Проверяем, не обработали ли уже эту директорию
+                if prefix_path not in processed_dirs:
+                    # Извлекаем имя последней части пути
+                    dir_name = prefix_path.rstrip('/').split('/')[-1]
+
+                    result['directories'].append({
+                        'name': dir_name,
+                        'path': prefix_path.rstrip('/') # Сохраняем путь без слеша на конце для консистентности
+                    })
+                    processed_dirs.add(prefix_path)
+        # Получаем содержимое (файлы и "пустые" объекты папок)
+        if 'Contents' in page:
+            for item in page['Contents']:
+                item_key = item['Key']
+
+                # Пропускаем сам объект текущей директории (если он есть)
+                # Например, при prefix='folder/' может вернуться объект с Key='folder/'
+                if item_key == s3_prefix:
+                    continue
+
+                # Извлекаем имя файла/объекта относительно текущей папки
+                relative_name = item_key
+                if s3_prefix:
+                     # Убедимся, что заменяем только в начале строки
+                    if relative_name.startswith(s3_prefix):
+                        relative_name = relative_name[len(s3_prefix):]
+
+                # Если после удаления префикса осталась пустая строка - пропускаем
+                if not relative_name:
+                    continue
+
+                # Пропускаем "подпапки", если они представлены как объекты (например, 'subdir/')
+                # Они уже должны быть обработаны через CommonPrefixes
+                # Также пропускаем, если имя содержит '/', но не является файлом (размер 0 и оканчивается на '/')
+                # Это может произойти, если Delimiter не сработал ожидаемо или объект создан некорректно
+                if relative_name.endswith('/') and item['Size'] == 0:
+                    # Дополнительно проверим, нет ли уже такой директории из CommonPrefixes
+                    if item_key not in processed_dirs:
+                        # Если вдруг папка не пришла в CommonPrefixes, добавим ее
+                        result['directories'].append({
+                            'name': relative_name.rstrip('/'),
+                            'path': item_key.rstrip('/')
+                        })
+                        processed_dirs.add(item_key) # Добавляем полный ключ с /
+                    continue # Пропускаем добавление в files
+
+                # Если это не папка, добавляем в файлы
+                result['files'].append({
+                    'name': relative_name,  # Имя относительно текущей папки
+                    'path': item_key,       # Полный путь (Key) от корня бакета
+                    'size': item['Size'],
+                    'last_modified': item['LastModified'],
+                    'is_image': self._is_image_file(relative_name)  # Проверяем, является ли файл изображением
+                })
+
     def create_folder(self, user, folder_path):
         """Создание новой папки (директории) в S3"""
         # Нормализуем путь ДО проверки прав
@@ -322,6 +600,9 @@ class S3Service:
                 Key=s3_folder_key,
                 Body=''
             )
+            listing_cache.invalidate_path(normalized_path)
+            object_index.add_folder(normalized_path)
+            folder_tree.add_folder(normalized_path)
 
             # Логируем действие
             self.log_action(user, 'create_folder', s3_folder_key)
@@ -366,21 +647,34 @@ class S3Service:
             )
             file_size = file_info.get('ContentLength', 0)
 
-            # Генерируем уникальный путь в корзине
-            trash_path = f"__trash/{uuid.uuid4().hex}/{os.path.basename(normalized_file_path)}"
+            if versioned_trash.is_enabled(self.s3_client, self.bucket_name):
+                # Корзина на версиях: вместо копии создается маркер удаления
+                trash_result = versioned_trash.trash_objects(self.s3_client, self.bucket_name, [{
+                    'Key': normalized_file_path, 'VersionId': file_info.get('VersionId'), 'Size': file_size
+                }])
+                if trash_result['errors']:
+                    raise bulk_ops.errors_to_client_error(trash_result['errors'], 'DeleteObject')
+                trash_path = normalized_file_path
+                backend = 'versioning'
+                versions = trash_result['versions']
+                object_index.remove_key(normalized_file_path)
+            else:
+                # Генерируем уникальный путь в корзине
+                trash_path = f"__trash/{uuid.uuid4().hex}/{os.path.basename(normalized_file_path)}"
 
-            # Копируем файл в корзину
-            self.s3_client.copy_object(
-                Bucket=self.bucket_name,
-                CopySource=f"{self.bucket_name}/{normalized_file_path}",
-                Key=trash_path
-            )
+                # Копируем файл в корзину (большие файлы - по частям)
+                bulk_ops.copy_object(self.s3_client, self.bucket_name, normalized_file_path, trash_path, head=file_info)
 
-            # Удаляем оригинальный файл
-            self.s3_client.delete_object(
-                Bucket=self.bucket_name,
-                Key=normalized_file_path # Используем нормализованный путь
-            )
+                # Удаляем оригинальный файл
+                self.s3_client.delete_object(
+                    Bucket=self.bucket_name,
+                    Key=normalized_file_path # Используем нормализованный путь
+                )
+                backend = 'copy'
+                versions = {}
+                listing_cache.invalidate_path('__trash')
+                object_index.move_key(normalized_file_path, trash_path)
+                folder_tree.add_folder(os.path.dirname(trash_path))
 
             # Создаем запись в таблице корзины
             expiration_date = timezone.now() + datetime.timedelta(days=30)
@@ -390,8 +684,13 @@ class S3Service:
                 object_type='file',
                 deleted_by=user,
                 original_size=file_size,
-                expires_at=expiration_date
+                expires_at=expiration_date,
+                backend=backend,
+                versions=versions,
+                object_count=1
             )
+            listing_cache.invalidate_path(folder_path)
+            archive_cache.invalidate_paths(self.s3_client, self.bucket_name, [normalized_file_path])
 
             # Логируем действие
             self.log_action(user, 'delete', normalized_file_path)
@@ -405,7 +704,7 @@ class S3Service:
             self.log_action(user, 'delete', normalized_file_path, success=False, details=str(e))
             raise
 
-    def delete_folder(self, user, folder_path):
+    def delete_folder(self, user, folder_path, progress_callback=None):
         """Удаление папки и всего её содержимого из S3 (перемещение в корзину)"""
         normalized_path = self._normalize_path(folder_path)
 
@@ -428,68 +727,94 @@ class S3Service:
             s3_prefix += '/'
 
         try:
-            # Получаем общий размер всех объектов в папке
-            total_size = 0
-            objects_to_move = []
-
-            # Используем пагинатор для получения ВСЕХ объектов с этим префиксом
-            paginator = self.s3_client.get_paginator('list_objects_v2')
-            pages = paginator.paginate(Bucket=self.bucket_name, Prefix=s3_prefix)
-
-            for page in pages:
-                if 'Contents' in page:
-                    for obj in page['Contents']:
-                        objects_to_move.append(obj)
-                        total_size += obj.get('Size', 0)
-
-            # Генерируем уникальный идентификатор для корзины
-            trash_id = uuid.uuid4().hex
-
-            # Перемещаем все объекты в корзину и удаляем оригиналы
-            for obj in objects_to_move:
-                original_key = obj['Key']
-                relative_path = original_key[len(s3_prefix):] if len(s3_prefix) > 0 and original_key.startswith(s3_prefix) else original_key
-                trash_key = f"__trash/{trash_id}/{normalized_path}/{relative_path}"
-
-                # Копируем объект в корзину
-                self.s3_client.copy_object(
-                    Bucket=self.bucket_name,
-                    CopySource=f"{self.bucket_name}/{original_key}",
-                    Key=trash_key
-                )
+            # Архивы в кэше с файлами этой папки больше не нужны
+            archive_cache.invalidate_paths(self.s3_client, self.bucket_name, [normalized_path])
 
-                # Удаляем оригинальный объект
-                self.s3_client.delete_object(
-                    Bucket=self.bucket_name,
-                    Key=original_key
+            if versioned_trash.is_enabled(self.s3_client, self.bucket_name):
+                return self._delete_folder_versioned(user, normalized_path, s3_prefix, progress_callback)
+
+            # Прерванный перенос этой папки в корзину продолжаем в ту же папку корзины
+            interrupted = journal.find_resumable('delete_folder', user, s3_prefix)
+            if interrupted is not None:
+                trash_prefix = interrupted.destination_prefix
+            else:
+                # Генерируем уникальный идентификатор для корзины
+                trash_id = uuid.uuid4().hex
+                trash_prefix = f"__trash/{trash_id}/{normalized_path}/"
+
+            # Объекты папки запоминаются для манифеста. При продолжении прерванной
+            # операции часть объектов уже в корзине, поэтому манифест не составляется
+            listed = None
+            objects = None
+            if interrupted is None:
+                listed = []
+                objects = self._recorded(
+                    bulk_ops.iter_prefix_objects(self.s3_client, self.bucket_name, s3_prefix), listed
                 )
 
-            # Создаем запись в таблице корзины
+            # Переносим все объекты в корзину: копирование выполняется параллельно,
+            # оригиналы удаляются пачками после успешного копирования
+            copy_result, entry = self._journaled_move_prefix(
+                'delete_folder', user, s3_prefix, trash_prefix, {'folder_path': normalized_path},
+                objects=objects, progress_callback=progress_callback
+            )
+            moved_count = copy_result['copied_count']
+            total_size = entry.copied_bytes
+
+            copy_failed = {error['key'] for error in copy_result['errors'] if error['operation'] == 'copy'}
+            manifest = None
+            if listed is not None:
+                listed = [obj for obj in listed if obj['Key'] not in copy_failed]
+                manifest = trash_manifest.encode(listed, s3_prefix)
+                object_count = len(listed)
+            else:
+                object_count = entry.copied_count + len(copy_result['errors']) - len(copy_failed)
+
+            if copy_result['errors']:
+                self._record_partial_folder_move(normalized_path, trash_prefix, copy_result['errors'])
+                if not moved_count:
+                    raise bulk_ops.errors_to_client_error(copy_result['errors'], 'DeleteFolder')
+            else:
+                listing_cache.invalidate_path(normalized_path, recursive=True)
+                listing_cache.invalidate_path('__trash')
+                object_index.move_prefix(normalized_path, trash_prefix)
+                folder_tree.move_folder(normalized_path, trash_prefix)
+
+            # Создаем запись в таблице корзины (при продолжении операции она может уже существовать)
             expiration_date = timezone.now() + datetime.timedelta(days=30)
-            trash_prefix = f"__trash/{trash_id}/{normalized_path}/"
-            TrashItem.objects.create(
-                original_path=normalized_path,
+            TrashItem.objects.update_or_create(
                 trash_path=trash_prefix,
-                object_type='folder',
-                deleted_by=user,
-                original_size=total_size,
-                expires_at=expiration_date
+                defaults={
+                    'original_path': normalized_path,
+                    'object_type': 'folder',
+                    'deleted_by': user,
+                    'original_size': total_size,
+                    'expires_at': expiration_date,
+                    'object_count': object_count,
+                    'manifest': manifest,
+                }
             )
 
+            message = f"Папка '{normalized_path}' и ее содержимое ({moved_count} объектов) перемещены в корзину"
+            details = None
+            if copy_result['errors']:
+                details = f"Не перемещено объектов: {len(copy_result['errors'])}"
+                message += f". {details}"
+
             # Логируем действие
-            self.log_action(user, 'delete', s3_prefix)
+            self.log_action(user, 'delete', s3_prefix, details=details)
 
             return {
                 'success': True,
-                'message': f"Папка '{normalized_path}' и ее содержимое ({len(objects_to_move)} объектов) перемещены в корзину",
-                'deleted_objects_count': len(objects_to_move)
+                'message': message,
+                'deleted_objects_count': moved_count
             }
         except ClientError as e:
             # Логируем неудачное действие
             self.log_action(user, 'delete', s3_prefix, success=False, details=str(e))
             raise
 
-    def move_object(self, user, source_path, destination_folder, is_folder=False):
+    def move_object(self, user, source_path, destination_folder, is_folder=False, progress_callback=None):
         """Перемещение файла или папки из исходного пути в целевую папку"""
         normalized_source_path = self._normalize_path(source_path)
         normalized_destination_folder = self._normalize_path(destination_folder)
@@ -526,21 +851,13 @@ class S3Service:
         destination_path = f"{normalized_destination_folder}/{object_name}" if normalized_destination_folder else object_name
 
         try:
+            archive_cache.invalidate_paths(self.s3_client, self.bucket_name, [normalized_source_path, destination_path])
             if is_folder:
                 # Перемещение папки и всего ее содержимого
                 # S3 не имеет атомарной операции перемещения, поэтому нужно скопировать все файлы и удалить исходные
-                moved_count = 0
-
                 # Добавляем слеш в конец пути для использования в префиксе
                 source_path_prefix = f"{normalized_source_path}/" if not normalized_source_path.endswith("/") else normalized_source_path
 
-                # Получаем список всех объектов в папке
-                paginator = self.s3_client.get_paginator('list_objects_v2')
-                pages = paginator.paginate(
-                    Bucket=self.bucket_name,
-                    Prefix=source_path_prefix
-                )
-
                 # Создаем целевую папку, если она еще не существует
                 target_folder_key = f"{destination_path}/" if not destination_path.endswith('/') else destination_path
                 self.s3_client.put_object(
@@ -549,33 +866,19 @@ class S3Service:
                     Body=''
                 )
 
-                for page in pages:
-                    if 'Contents' in page:
-                        for obj in page['Contents']:
-                            source_key = obj['Key']
-
-                            # Пропускаем объект, если это сам префикс папки
-                            if source_key == source_path_prefix:
-                                continue
-
-                            # Определяем относительный путь от корня исходной папки
-                            relative_path = source_key[len(source_path_prefix):]
-                            target_key = f"{target_folder_key}{relative_path}"
-
-                            # Копируем объект в новое расположение
-                            self.s3_client.copy_object(
-                                Bucket=self.bucket_name,
-                                CopySource=f"{self.bucket_name}/{source_key}",
-                                Key=target_key
-                            )
-
-                            # Удаляем исходный объект
-                            self.s3_client.delete_object(
-                                Bucket=self.bucket_name,
-                                Key=source_key
-                            )
+                # Копируем все объекты папки (кроме самого объекта папки) параллельно,
+                # исходные объекты удаляются пачками после успешного копирования
+                copy_result, entry = self._journaled_move_prefix(
+                    'move_folder', user, source_path_prefix, target_folder_key,
+                    {'source_path': normalized_source_path, 'destination_folder': normalized_destination_folder},
+                    exclude_key=source_path_prefix, progress_callback=progress_callback
+                )
+                moved_count = entry.copied_count
 
-                            moved_count += 1
+                if copy_result['errors']:
+                    # Часть объектов осталась в исходной папке: объект исходной папки не удаляем
+                    self._record_partial_folder_move(normalized_source_path, destination_path, copy_result['errors'])
+                    raise bulk_ops.errors_to_client_error(copy_result['errors'], 'MoveFolder')
 
                 # Удаляем исходную папку (пустой объект папки)
                 if normalized_source_path.endswith('/'):
@@ -587,6 +890,10 @@ class S3Service:
                     Bucket=self.bucket_name,
                     Key=folder_key
                 )
+                listing_cache.invalidate_path(normalized_source_path, recursive=True)
+                listing_cache.invalidate_path(destination_path, recursive=True)
+                object_index.move_prefix(normalized_source_path, destination_path)
+                folder_tree.move_folder(normalized_source_path, destination_path)
 
                 # Логируем действие
                 self.log_action(user, 'move', f"{normalized_source_path} → {destination_path}")
@@ -599,18 +906,19 @@ class S3Service:
 
             else:
                 # Перемещение файла
-                # Копируем файл в новое расположение
-                self.s3_client.copy_object(
-                    Bucket=self.bucket_name,
-                    CopySource=f"{self.bucket_name}/{normalized_source_path}",
-                    Key=destination_path
-                )
+                # Копируем файл в новое расположение (большие файлы - по частям)
+                size = bulk_ops.copy_object(self.s3_client, self.bucket_name, normalized_source_path, destination_path)
+                if progress_callback:
+                    progress_callback({'copied_count': 1, 'copied_bytes': size, 'errors': []})
 
                 # Удаляем исходный файл
                 self.s3_client.delete_object(
                     Bucket=self.bucket_name,
                     Key=normalized_source_path
                 )
+                listing_cache.invalidate_path(os.path.dirname(normalized_source_path))
+                listing_cache.invalidate_path(normalized_destination_folder)
+                object_index.move_key(normalized_source_path, destination_path)
 
                 # Логируем действие
                 self.log_action(user, 'move', f"{normalized_source_path} → {destination_path}")
@@ -626,6 +934,375 @@ class S3Service:
             self.log_action(user, 'move', f"{normalized_source_path} → {destination_path}", success=False, details=str(e))
             raise
 
+    def move_multiple(self, user, file_paths, folder_paths, destination_folder, progress_callback=None):
+        """Перемещение нескольких файлов и папок в целевую папку.
+
+        Права на все элементы проверяются одним проходом до операций с S3;
+        элементы без прав пропускаются с сообщением об ошибке.
+
+        Args:
+            progress_callback: функция, принимающая снимки BulkProgress
+        """
+        tracker = BulkProgress(len(file_paths) + len(folder_paths), on_update=progress_callback)
+        moved_files = 0
+        moved_folders = 0
+
+        # Для файла нужно право на перемещение из его папки, для папки - на саму папку
+        file_parents = {file_path: os.path.dirname(file_path.strip('/')) for file_path in file_paths}
+        move_allowed = self.check_permissions_bulk(user, list(file_parents.values()) + folder_paths, 'move')
+        if not self.check_permission(user, destination_folder, 'write'):
+            tracker.add_error("У вас нет прав для записи в целевую папку")
+            file_paths, folder_paths = [], []
+
+        denied_files = {file_path for file_path in file_paths if not move_allowed[file_parents[file_path]]}
+        denied_folders = {folder_path for folder_path in folder_paths if not move_allowed[folder_path]}
+        for path in sorted(denied_files | denied_folders):
+            tracker.add_error(f"Нет прав для перемещения {path}")
+        file_paths = [file_path for file_path in file_paths if file_path not in denied_files]
+        folder_paths = [folder_path for folder_path in folder_paths if folder_path not in denied_folders]
+
+        for file_path in file_paths:
+            try:
+                self.move_object(user, file_path, destination_folder, is_folder=False, progress_callback=tracker)
+                moved_files += 1
+            except Exception as e:
+                tracker.add_error(f"Не удалось переместить файл {file_path}: {str(e)}")
+            tracker.item_done()
+
+        for folder_path in folder_paths:
+            # Проверка, чтобы не перемещать папку в саму себя или свою подпапку
+            if destination_folder.startswith(folder_path) or destination_folder == folder_path:
+                tracker.add_error(f"Невозможно переместить папку {folder_path} внутрь самой себя или в свою подпапку")
+                tracker.item_done()
+                continue
+
+            try:
+                self.move_object(user, folder_path, destination_folder, is_folder=True, progress_callback=tracker)
+                moved_folders += 1
+            except Exception as e:
+                tracker.add_error(f"Не удалось переместить папку {folder_path}: {str(e)}")
+            tracker.item_done()
+
+        return {
+            'success': True,
+            'moved_files': moved_files,
+            'moved_folders': moved_folders,
+            'errors': tracker.error_messages
+        }
+
+    def _delete_folder_versioned(self, user, normalized_path, s3_prefix, progress_callback=None):
+        """Перенос папки в корзину маркерами удаления (S3_TRASH_BACKEND = 'versioning').
+
+        Данные не копируются: на каждый объект создается маркер удаления, поэтому
+        журнал операции не нужен - повторный запуск просто удалит оставшиеся объекты.
+        """
+        trash_result = versioned_trash.trash_objects(
+            self.s3_client, self.bucket_name,
+            versioned_trash.iter_current_versions(self.s3_client, self.bucket_name, s3_prefix),
+            progress_callback=progress_callback
+        )
+        moved_count = len(trash_result['versions'])
+        errors = trash_result['errors']
+        if errors and not moved_count:
+            raise bulk_ops.errors_to_client_error(errors, 'DeleteFolder')
+
+        listing_cache.invalidate_path(normalized_path, recursive=True)
+        object_index.remove_prefix(normalized_path)
+        folder_tree.remove_folder(normalized_path)
+        remaining = [error['key'] for error in errors if error['operation'] == 'delete']
+        if remaining:
+            # Не удаленные объекты остаются в папке
+            for key in remaining:
+                object_index.upsert_object(key)
+            folder_tree.add_folders([os.path.dirname(key) for key in remaining])
+
+        expiration_date = timezone.now() + datetime.timedelta(days=30)
+        TrashItem.objects.create(
+            original_path=normalized_path,
+            trash_path=s3_prefix,
+            object_type='folder',
+            deleted_by=user,
+            original_size=trash_result['deleted_bytes'],
+            expires_at=expiration_date,
+            backend='versioning',
+            versions=trash_result['versions'],
+            object_count=moved_count
+        )
+
+        message = f"Папка '{normalized_path}' и ее содержимое ({moved_count} объектов) перемещены в корзину"
+        details = None
+        if errors:
+            details = f"Не перемещено объектов: {len(errors)}"
+            message += f". {details}"
+        self.log_action(user, 'delete', s3_prefix, details=details)
+
+        return {
+            'success': True,
+            'message': message,
+            'deleted_objects_count': moved_count
+        }
+
+    def delete_multiple(self, user, file_paths, folder_paths, progress_callback=None):
+        """Удаление (перемещение в корзину) нескольких файлов и папок одной операцией.
+
+        Права на все элементы проверяются одним проходом; все элементы переносятся
+        в общую папку корзины '__trash/<id>/' с сохранением исходных путей:
+        объекты копируются параллельно, оригиналы удаляются пачками DeleteObjects,
+        записи корзины создаются одним запросом.
+
+        Args:
+            progress_callback: функция, принимающая снимки BulkProgress
+        """
+        tracker = BulkProgress(len(file_paths) + len(folder_paths), on_update=progress_callback)
+        file_paths = list(dict.fromkeys(filter(None, map(self._normalize_path, file_paths))))
+        folder_paths = list(dict.fromkeys(filter(None, map(self._normalize_path, folder_paths))))
+
+        if not user.is_superuser and DocumentSignature.has_pending_documents(user):
+            tracker.add_error("Для удаления файлов и папок необходимо подписать все документы")
+            file_paths, folder_paths = [], []
+
+        # Для файла нужно право на удаление в его папке, для папки - на саму папку
+        file_parents = {file_path: os.path.dirname(file_path) for file_path in file_paths}
+        delete_allowed = self.check_permissions_bulk(user, list(file_parents.values()) + folder_paths, 'delete')
+
+        def is_documents(path):
+            return not user.is_superuser and (path == '__documents' or path.startswith('__documents/'))
+
+        denied = {file_path for file_path in file_paths
+                  if not delete_allowed[file_parents[file_path]] or is_documents(file_path)}
+        denied |= {folder_path for folder_path in folder_paths
+                   if not delete_allowed[folder_path] or is_documents(folder_path)}
+        for path in sorted(denied):
+            tracker.add_error(f"Нет прав для удаления {path}")
+        folders = {folder_path for folder_path in folder_paths if folder_path not in denied}
+
+        def selected_folder(key):
+            """Выбранная папка, внутри которой находится ключ, или None"""
+            return self._selected_prefix(key, folders)
+
+        # Элементы внутри выбранных папок переносятся вместе с папкой
+        folders = {folder for folder in folders if selected_folder(folder) is None}
+        files = [file_path for file_path in file_paths if file_path not in denied and selected_folder(file_path) is None]
+
+        archive_cache.invalidate_paths(self.s3_client, self.bucket_name, files + sorted(folders))
+        if versioned_trash.is_enabled(self.s3_client, self.bucket_name):
+            return self._delete_multiple_versioned(user, files, folders, tracker)
+
+        trash_root = f"__trash/{uuid.uuid4().hex}/"
+        # Размер файлов запрашивается при копировании и записывается в их описания
+        file_objects = [{'Key': file_path} for file_path in files]
+        folder_objects = {folder: [] for folder in folders}
+
+        def iter_objects():
+            yield from file_objects
+            for folder in sorted(folders):
+                yield from self._recorded(
+                    bulk_ops.iter_prefix_objects(self.s3_client, self.bucket_name, f"{folder}/"),
+                    folder_objects[folder]
+                )
+
+        # Общий префикс источника пустой: ключ в корзине - это папка корзины + исходный ключ
+        copy_result = bulk_ops.copy_prefix(
+            self.s3_client, self.bucket_name, '', trash_root,
+            objects=iter_objects(), delete_source=True, progress_callback=tracker
+        )
+
+        errors_by_item = {}
+        copy_failed = set()
+        for error in copy_result['errors']:
+            item = error['key'] if error['key'] in files else selected_folder(error['key'])
+            errors_by_item.setdefault(item, []).append(error)
+            if error['operation'] == 'copy':
+                copy_failed.add(error['key'])
+
+        expiration_date = timezone.now() + datetime.timedelta(days=30)
+        trash_items = []
+        logs = []
+        deleted_files = 0
+        deleted_folders = 0
+
+        for file_obj in file_objects:
+            file_path = file_obj['Key']
+            trash_path = trash_root + file_path
+            item_errors = errors_by_item.get(file_path, [])
+            if any(error['operation'] == 'copy' for error in item_errors):
+                error = item_errors[0]
+                tracker.add_error(f"Не удалось удалить файл {file_path}: {error['code']} {error['message']}")
+                logs.append(S3ActionLog(user=user, action='delete', path=file_path, success=False,
+                                        details=f"{error['code']} {error['message']}"))
+                continue
+
+            trash_items.append(TrashItem(
+                original_path=file_path, trash_path=trash_path, object_type='file',
+                deleted_by=user, original_size=file_obj.get('Size') or 0, expires_at=expiration_date,
+                object_count=1
+            ))
+            logs.append(S3ActionLog(user=user, action='delete', path=file_path))
+            object_index.move_key(file_path, trash_path)
+            if item_errors:
+                # Копия в корзине создана, но оригинал удалить не удалось
+                tracker.add_error(f"Файл {file_path} помещен в корзину, но не удален из исходной папки")
+                object_index.upsert_object(file_path, size=file_obj.get('Size') or 0)
+            else:
+                deleted_files += 1
+            listing_cache.invalidate_path(file_parents[file_path])
+            folder_tree.add_folder(os.path.dirname(trash_path))
+
+        for folder in sorted(folders):
+            trash_path = f"{trash_root}{folder}/"
+            item_errors = errors_by_item.get(folder, [])
+            if item_errors:
+                self._record_partial_folder_move(folder, trash_path, item_errors)
+                tracker.add_error(f"Не удалось переместить в корзину {len(item_errors)} объектов папки {folder}")
+            else:
+                listing_cache.invalidate_path(folder, recursive=True)
+                object_index.move_prefix(folder, trash_path)
+                folder_tree.move_folder(folder, trash_path)
+            # Объекты, которые не удалось скопировать, остались в исходной папке
+            objects = [obj for obj in folder_objects[folder] if obj['Key'] not in copy_failed]
+            if not objects:
+                logs.append(S3ActionLog(user=user, action='delete', path=f"{folder}/", success=False,
+                                        details="Ни один объект папки не перемещен в корзину"))
+                continue
+
+            trash_items.append(TrashItem(
+                original_path=folder, trash_path=trash_path, object_type='folder',
+                deleted_by=user, original_size=sum(obj.get('Size', 0) for obj in objects),
+                expires_at=expiration_date, object_count=len(objects),
+                manifest=trash_manifest.encode(objects, f"{folder}/")
+            ))
+            logs.append(S3ActionLog(user=user, action='delete', path=f"{folder}/",
+                                    details=f"Не перемещено объектов: {len(item_errors)}" if item_errors else None))
+            if not item_errors:
+                deleted_folders += 1
+
+        TrashItem.objects.bulk_create(trash_items)
+        S3ActionLog.objects.bulk_create(logs)
+        listing_cache.invalidate_path('__trash', recursive=True)
+        tracker.item_done(tracker.items_total - tracker.items_done)
+
+        return {
+            'success': True,
+            'deleted_files': deleted_files,
+            'deleted_folders': deleted_folders,
+            'errors': tracker.error_messages
+        }
+
+    def _delete_multiple_versioned(self, user, files, folders, tracker):
+        """Перенос файлов и папок в корзину маркерами удаления одной пачкой DeleteObjects.
+
+        Каждый элемент получает свою запись корзины с версиями своих объектов;
+        ключи в бакете не меняются.
+        """
+        file_objects, head_errors = versioned_trash.head_versions(self.s3_client, self.bucket_name, files)
+        for error in head_errors:
+            tracker.add_error(f"Не удалось удалить файл {error['key']}: {error['code']} {error['message']}")
+
+        sizes = {}
+
+        def iter_objects():
+            yield from file_objects
+            for folder in sorted(folders):
+                yield from versioned_trash.iter_current_versions(self.s3_client, self.bucket_name, f"{folder}/")
+
+        def tracked(objects):
+            for obj in objects:
+                sizes[obj['Key']] = obj.get('Size', 0)
+                yield obj
+
+        trash_result = versioned_trash.trash_objects(
+            self.s3_client, self.bucket_name, tracked(iter_objects()), progress_callback=tracker
+        )
+        versions = trash_result['versions']
+        failed = {error['key']: error for error in trash_result['errors']}
+
+        expiration_date = timezone.now() + datetime.timedelta(days=30)
+        trash_items = []
+        logs = [S3ActionLog(user=user, action='delete', path=error['key'], success=False,
+                            details=f"{error['code']} {error['message']}") for error in head_errors]
+        deleted_files = 0
+        deleted_folders = 0
+
+        for file_obj in file_objects:
+            file_path = file_obj['Key']
+            if file_path in failed:
+                error = failed[file_path]
+                tracker.add_error(f"Не удалось удалить файл {file_path}: {error['code']} {error['message']}")
+                logs.append(S3ActionLog(user=user, action='delete', path=file_path, success=False,
+                                        details=f"{error['code']} {error['message']}"))
+                continue
+            trash_items.append(TrashItem(
+                original_path=file_path, trash_path=file_path, object_type='file',
+                deleted_by=user, original_size=file_obj.get('Size', 0), expires_at=expiration_date,
+                backend='versioning', versions={file_path: versions[file_path]}, object_count=1
+            ))
+            logs.append(S3ActionLog(user=user, action='delete', path=file_path))
+            object_index.remove_key(file_path)
+            listing_cache.invalidate_path(os.path.dirname(file_path))
+            deleted_files += 1
+
+        # Выбранные папки не вложены друг в друга, поэтому ключ относится не более чем к одной
+        file_keys = {file_obj['Key'] for file_obj in file_objects}
+        folder_versions = {folder: {} for folder in folders}
+        folder_errors = {folder: [] for folder in folders}
+        for key, key_versions in versions.items():
+            folder = None if key in file_keys else self._selected_prefix(key, folders)
+            if folder is not None:
+                folder_versions[folder][key] = key_versions
+        for key, error in failed.items():
+            folder = None if key in file_keys else self._selected_prefix(key, folders)
+            if folder is not None:
+                folder_errors[folder].append(error)
+
+        for folder in sorted(folders):
+            item_versions = folder_versions[folder]
+            item_errors = folder_errors[folder]
+            listing_cache.invalidate_path(folder, recursive=True)
+            object_index.remove_prefix(folder)
+            folder_tree.remove_folder(folder)
+            if item_errors:
+                tracker.add_error(f"Не удалось переместить в корзину {len(item_errors)} объектов папки {folder}")
+                # Объекты, удаленные без маркера, в папке уже не остаются
+                remaining = [error['key'] for error in item_errors if error['operation'] == 'delete']
+                for key in remaining:
+                    object_index.upsert_object(key)
+                folder_tree.add_folders([os.path.dirname(key) for key in remaining])
+            if not item_versions and item_errors:
+                logs.append(S3ActionLog(user=user, action='delete', path=f"{folder}/", success=False,
+                                        details="Ни один объект папки не перемещен в корзину"))
+                continue
+
+            trash_items.append(TrashItem(
+                original_path=folder, trash_path=f"{folder}/", object_type='folder', deleted_by=user,
+                original_size=sum(sizes[key] for key in item_versions),
+                expires_at=expiration_date, backend='versioning', versions=item_versions,
+                object_count=len(item_versions)
+            ))
+            logs.append(S3ActionLog(user=user, action='delete', path=f"{folder}/",
+                                    details=f"Не перемещено объектов: {len(item_errors)}" if item_errors else None))
+            if not item_errors:
+                deleted_folders += 1
+
+        TrashItem.objects.bulk_create(trash_items)
+        S3ActionLog.objects.bulk_create(logs)
+        tracker.item_done(tracker.items_total - tracker.items_done)
+
+        return {
+            'success': True,
+            'deleted_files': deleted_files,
+            'deleted_folders': deleted_folders,
+            'errors': tracker.error_messages
+        }
+
+    def _selected_prefix(self, key, folders):
+        """Папка из набора folders, внутри которой находится ключ, или None"""
+        parts = key.split('/')
+        for depth in range(1, len(parts)):
+            folder = '/'.join(parts[:depth])
+            if folder in folders:
+                return folder
+        return None
+
     def _is_image_file(self, file_name):
         """Проверяет, является ли файл изображением по его расширению"""
         # Список распространенных расширений изображений
@@ -633,6 +1310,17 @@ class S3Service:
         _, ext = os.path.splitext(file_name.lower())
         return ext in image_extensions
 
+    def attach_preview_urls(self, items, expires_in=300):
+        """Добавляет ссылки предпросмотра к изображениям из переданного набора элементов.
+
+        Ссылки подписываются только для реально отображаемых строк (текущей страницы),
+        а не для всех изображений папки.
+        """
+        for item in items:
+            if item.get('is_image') and not item.get('preview_url'):
+                item['preview_url'] = self.get_presigned_url(item['path'], expires_in=expires_in)
+        return items
+
     def get_presigned_url(self, object_key, expires_in=300):
         """Генерирует presigned URL для объекта в S3 хранилище"""
         try:
@@ -718,21 +1406,359 @@ class S3Service:
             self.log_action(user, 'download', object_key, success=False, details=str(e))
             raise
 
+    def file_archive(self, user, file_paths):
+        """Описание архива из выбранных файлов (см. iter_archive_members).
+
+        Права на чтение проверяются сразу для всех папок; файлы без прав
+        пропускаются. Пути в архиве задаются относительно общей папки выбранных
+        файлов, поэтому одноименные файлы из разных папок не совпадают.
+
+        Raises:
+            PermissionDenied: если у пользователя есть неподписанные документы
+
+        Returns:
+            dict: {'entries': функция, возвращающая записи {'key', 'name'},
+                   'paths': ключи файлов, 'summary_path': None, 'scope': None,
+                   'logs': записи журнала}
+        """
+        if not user.is_superuser and DocumentSignature.has_pending_documents(user):
+            raise PermissionDenied("Для скачивания файлов необходимо подписать все документы")
+
+        file_paths = list(dict.fromkeys(filter(None, map(self._normalize_path, file_paths))))
+        parents = {file_path: os.path.dirname(file_path) for file_path in file_paths}
+        read_allowed = self.check_permissions_bulk(user, set(parents.values()), 'read')
+
+        logs = []
+        entries = []
+        base = os.path.commonpath(list(parents.values())) if file_paths else ''
+        for file_path in file_paths:
+            if read_allowed[parents[file_path]]:
+                entries.append({'key': file_path, 'name': os.path.relpath(file_path, base or '.')})
+            else:
+                logs.append(S3ActionLog(user=user, action='download', path=file_path, success=False,
+                                        details="Нет прав на чтение"))
+        return {
+            'entries': lambda: iter(entries),
+            'paths': [entry['key'] for entry in entries],
+            'summary_path': None,
+            'scope': None,
+            'logs': logs,
+        }
+
+    def folder_archive(self, user, folder_path):
+        """Описание архива из папки со всеми вложенными папками (см. iter_archive_members).
+
+        Объекты перебираются листингом по мере записи архива; пути в архиве
+        начинаются с имени папки. Права проверяются один раз на поддерево: если
+        на саму папку права чтения нет, в архив попадают только вложенные папки,
+        на которые оно выдано.
+
+        Raises:
+            PermissionDenied: если у пользователя есть неподписанные документы
+                              или нет прав на чтение ни одной части папки
+
+        Returns:
+            dict: {'entries': функция, возвращающая записи {'key', 'name', 'size', 'etag'},
+                   'paths': префиксы поддеревьев, 'summary_path': папка для журнала,
+                   'scope': область архива для кэша (archive_cache.scope_key), 'logs': []}
+        """
+        if not user.is_superuser and DocumentSignature.has_pending_documents(user):
+            raise PermissionDenied("Для скачивания файлов необходимо подписать все документы")
+
+        normalized_path = self._normalize_path(folder_path)
+        if self.check_permission(user, normalized_path, 'read'):
+            subtrees = [normalized_path]
+        else:
+            subtrees = [
+                root for root in self._readable_roots(user) or []
+                if not normalized_path or root.startswith(normalized_path + '/')
+            ]
+            if not subtrees:
+                raise PermissionDenied(f"У вас нет прав для скачивания папки '{normalized_path}'")
+
+        base = os.path.dirname(normalized_path)
+        prefixes = [f"{subtree}/" if subtree else '' for subtree in subtrees]
+
+        def iter_entries():
+            for prefix in prefixes:
+                for obj in bulk_ops.iter_prefix_objects(self.s3_client, self.bucket_name, prefix):
+                    key = obj['Key']
+                    if key.endswith('/') or (not user.is_superuser and self._is_service_key(key)):
+                        continue
+                    yield {
+                        'key': key,
+                        'name': key[len(base) + 1:] if base else key,
+                        'size': obj.get('Size'),
+                        'etag': obj.get('ETag', ''),
+                    }
+
+        return {
+            'entries': iter_entries,
+            'paths': prefixes,
+            'summary_path': f"{normalized_path}/",
+            # Состав архива зависит от префиксов и от того, скрываются ли служебные объекты
+            'scope': f"{int(user.is_superuser)}\n{normalized_path}\n" + '\n'.join(prefixes),
+            'logs': [],
+        }
+
+    def archive_fingerprint(self, archive, preset):
+        """Ключ содержимого архива выбранных файлов (archive_cache.Fingerprint) или None.
+
+        ETag запрашиваются head_object (параллельно). Если какой-то файл недоступен,
+        архив не может быть в кэше, и возвращается None.
+        """
+        def head_etag(entry):
+            return self.s3_client.head_object(Bucket=self.bucket_name, Key=entry['key']).get('ETag', '')
+
+        fingerprint = archive_cache.Fingerprint(preset)
+        for entry, etag, error in prefetch.iter_prefetched(
+            archive['entries'](), head_etag, max_workers=bulk_ops.copy_concurrency()
+        ):
+            if error is not None:
+                return None
+            fingerprint.add(entry['name'], entry['key'], etag)
+        return fingerprint.hexdigest()
+
+    def _archive_cacheable(self, archive):
+        """Можно ли найти архив в кэше до начала ответа (см. s3app.archive_cache)"""
+        if not archive_cache.is_enabled():
+            return False
+        return archive['scope'] is not None or len(archive['paths']) <= archive_cache.lookup_max_members()
+
+    def cached_archive_url(self, user, archive, preset, filename):
+        """Ссылка на такой же архив из кэша (S3_ARCHIVE_CACHE_ENABLED) или None.
+
+        Листинг папки до начала ответа не выполняется: архив папки ищется по
+        области, выбранные файлы - по текущим ETag, если их немного.
+        """
+        if not self._archive_cacheable(archive):
+            return None
+        if archive['scope'] is not None:
+            entry = archive_cache.lookup(self.s3_client, self.bucket_name,
+                                         scope=archive_cache.scope_key(preset, archive['scope']))
+        else:
+            fingerprint = self.archive_fingerprint(archive, preset)
+            entry = fingerprint and archive_cache.lookup(self.s3_client, self.bucket_name, fingerprint=fingerprint)
+        if not entry:
+            return None
+
+        logs = list(archive['logs'])
+        if archive['summary_path'] is not None:
+            logs.append(S3ActionLog(user=user, action='download', path=archive['summary_path'],
+                                    details=f"Downloaded cached folder archive: {entry.member_count} files"))
+        else:
+            logs.extend(S3ActionLog(user=user, action='download', path=path,
+                                    details='Downloaded in cached bulk archive') for path in archive['paths'])
+        S3ActionLog.objects.bulk_create(logs)
+        return archive_cache.download_url(self.s3_client, self.bucket_name, entry, filename)
+
+    def archive_stream(self, user, archive, preset):
+        """Части ZIP-архива (s3app.zip_stream).
+
+        При включенном кэше архив одновременно сохраняется в кэш; ключ содержимого
+        вычисляется по ходу записи, без отдельного листинга.
+        """
+        if not self._archive_cacheable(archive):
+            return zip_stream.stream_zip(self.iter_archive_members(user, archive), preset=preset)
+
+        report = {}
+        fingerprint = archive_cache.Fingerprint(preset)
+        stream = zip_stream.stream_zip(
+            self.iter_archive_members(user, archive, report=report, fingerprint=fingerprint), preset=preset
+        )
+        scope = archive_cache.scope_key(preset, archive['scope']) if archive['scope'] is not None else ''
+        return archive_cache.store_while_streaming(
+            self.s3_client, self.bucket_name, fingerprint, stream, archive['paths'], report, scope=scope
+        )
+
+    def iter_archive_members(self, user, archive, report=None, fingerprint=None):
+        """Элементы архива (см. s3app.zip_stream) по описанию из file_archive или folder_archive.
+
+        Объекты запрашиваются по мере записи архива (следующие - заранее) и читаются
+        блоками S3_ARCHIVE_CHUNK_SIZE; недоступные в S3 файлы пропускаются. При
+        скачивании папки в журнал пишется одна запись на папку.
+
+        Args:
+            report: словарь, в который по завершении записываются счетчики
+                    'archived' и 'failed'
+            fingerprint: archive_cache.Fingerprint, в который добавляются
+                         записанные файлы
+
+        Returns:
+            generator: элементы архива {'name', 'size', 'last_modified', 'compression', 'chunks'}
+        """
+        logs = list(archive['logs'])
+        summary_path = archive['summary_path']
+        entries = archive['entries']()
+        archived_count = 0
+        failed_count = 0
+
+        # Следующие файлы загружаются заранее, пока текущий пишется в архив
+        prefetched = prefetch.iter_prefetched(
+            entries, self._prefetch_archive_object,
+            max_workers=getattr(settings, 'S3_ARCHIVE_PREFETCH_CONCURRENCY', 4),
+            discard=lambda fetched: fetched['buffer'] and fetched['buffer'].close()
+        )
+        try:
+            for entry, fetched, error in prefetched:
+                file_path = entry['key']
+                if error is None and fetched['buffer'] is None:
+                    # Большой объект не буферизуется: читается потоком в свою очередь
+                    fetched, error = self._open_archive_object(file_path)
+                if error is not None:
+                    print(f"Error reading {file_path} for archive: {str(error)}")
+                    failed_count += 1
+                    logs.append(S3ActionLog(user=user, action='download', path=file_path, success=False,
+                                            details=str(error)))
+                    continue
+
+                archived_count += 1
+                if fingerprint is not None:
+                    fingerprint.add(entry['name'], file_path, entry.get('etag') or fetched['etag'])
+                if summary_path is None:
+                    logs.append(S3ActionLog(user=user, action='download', path=file_path,
+                                            details='Downloaded in bulk archive'))
+                yield {
+                    'name': entry['name'],
+                    'size': fetched['size'],
+                    'last_modified': fetched['last_modified'],
+                    'compression': self._archive_compression(file_path, fetched['content_type']),
+                    'chunks': fetched['chunks'],
+                }
+        finally:
+            prefetched.close()
+            if report is not None:
+                report.update(archived=archived_count, failed=failed_count)
+            if summary_path is not None:
+                details = f"Downloaded folder archive: {archived_count} files"
+                if failed_count:
+                    details += f", failed: {failed_count}"
+                logs.append(S3ActionLog(user=user, action='download', path=summary_path, details=details))
+            # Журнал пишется и при обрыве загрузки архива клиентом
+            S3ActionLog.objects.bulk_create(logs)
+
+    def _archive_compression(self, file_name, content_type=None):
+        """Сжатие файла в архиве (см. s3app.zip_stream): 'stored', 'deflated' или 'auto'"""
+        _, ext = os.path.splitext(file_name.lower())
+        if ext in COMPRESSED_EXTENSIONS:
+            return 'stored'
+        if self._is_image_file(file_name) and ext not in UNCOMPRESSED_IMAGE_EXTENSIONS:
+            return 'stored'
+
+        guessed_type, encoding = mimetypes.guess_type(file_name)
+        if encoding:
+            # Например, .tar.gz
+            return 'stored'
+        content_type = guessed_type or content_type or ''
+        if content_type.startswith(('video/', 'audio/')):
+            return 'stored'
+        if content_type.startswith('text/') or content_type in ('application/json', 'application/xml'):
+            return 'deflated'
+        # Тип не определен - решение принимается по энтропии начала файла
+        return 'auto'
+
+    def _archive_chunk_size(self):
+        return getattr(settings, 'S3_ARCHIVE_CHUNK_SIZE', 1024 * 1024)
+
+    def _open_archive_object(self, key):
+        """Открывает объект для потокового чтения.
+
+        Returns:
+            tuple: ({'size', 'last_modified', 'content_type', 'etag', 'buffer': None, 'chunks'}, None)
+                   или (None, ClientError)
+        """
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=key)
+        except ClientError as e:
+            return None, e
+        return {
+            'size': response.get('ContentLength'),
+            'last_modified': response.get('LastModified'),
+            'content_type': response.get('ContentType'),
+            'etag': response.get('ETag', ''),
+            'buffer': None,
+            'chunks': self._iter_body(response['Body']),
+        }, None
+
+    def _prefetch_archive_object(self, entry):
+        """Загружает объект в буфер заранее (выполняется в потоке упреждающей загрузки).
+
+        Буфер держится в памяти до S3_ARCHIVE_PREFETCH_MEMORY байт, больше - на диске.
+        Объекты больше S3_ARCHIVE_PREFETCH_MAX_OBJECT_SIZE не буферизуются ('buffer': None).
+        """
+        max_object_size = getattr(settings, 'S3_ARCHIVE_PREFETCH_MAX_OBJECT_SIZE', 256 * 1024 ** 2)
+        fetched = {'size': entry.get('size'), 'last_modified': None, 'content_type': None,
+                   'etag': entry.get('etag'), 'buffer': None, 'chunks': None}
+        if (entry.get('size') or 0) > max_object_size:
+            # Размер известен из листинга - объект откроется в свою очередь
+            return fetched
+
+        response = self.s3_client.get_object(Bucket=self.bucket_name, Key=entry['key'])
+        body = response['Body']
+        fetched.update(
+            size=response.get('ContentLength'),
+            last_modified=response.get('LastModified'),
+            content_type=response.get('ContentType'),
+            etag=response.get('ETag', ''),
+        )
+        try:
+            if (fetched['size'] or 0) > max_object_size:
+                return fetched
+            buffer = tempfile.SpooledTemporaryFile(
+                max_size=getattr(settings, 'S3_ARCHIVE_PREFETCH_MEMORY', 8 * 1024 * 1024)
+            )
+            try:
+                for chunk in body.iter_chunks(self._archive_chunk_size()):
+                    buffer.write(chunk)
+            except Exception:
+                buffer.close()
+                raise
+        finally:
+            body.close()
+        buffer.seek(0)
+        fetched['buffer'] = buffer
+        fetched['chunks'] = self._iter_buffer(buffer)
+        return fetched
+
+    def _iter_buffer(self, buffer):
+        """Читает буфер упреждающей загрузки блоками и закрывает его"""
+        chunk_size = self._archive_chunk_size()
+        try:
+            while True:
+                chunk = buffer.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+        finally:
+            buffer.close()
+
+    def _iter_body(self, body):
+        """Читает тело объекта S3 блоками S3_ARCHIVE_CHUNK_SIZE"""
+        try:
+            yield from body.iter_chunks(self._archive_chunk_size())
+        finally:
+            body.close()
+
     def list_trash_items(self):
         """Получение списка элементов в корзине"""
         try:
             # Получаем записи из БД
-            trash_items = TrashItem.objects.all().order_by('-deleted_at')
+            # Манифесты папок для списка не нужны
+            trash_items = TrashItem.objects.defer('manifest').order_by('-deleted_at')
             return trash_items
         except Exception as e:
             print(f"Error listing trash items: {str(e)}")
             return []
 
-    def restore_from_trash(self, user, trash_item_id):
+    def restore_from_trash(self, user, trash_item_id, progress_callback=None):
         """Восстановление элемента из корзины"""
         try:
             # Получаем запись из БД
             trash_item = TrashItem.objects.get(id=trash_item_id)
+            archive_cache.invalidate_paths(self.s3_client, self.bucket_name, [trash_item.original_path])
+
+            if trash_item.backend == 'versioning' and trash_item.object_type in ('file', 'folder'):
+                return self._restore_versioned(user, trash_item, progress_callback)
 
             if trash_item.object_type == 'file':
                 # Восстановление файла
@@ -752,24 +1778,25 @@ class S3Service:
                     if e.response['Error']['Code'] != '404':
                         raise
 
-                # Копируем объект из корзины в исходное расположение
-                self.s3_client.copy_object(
-                    Bucket=self.bucket_name,
-                    CopySource=f"{self.bucket_name}/{trash_path}",
-                    Key=original_path
-                )
+                # Копируем объект из корзины в исходное расположение (большие файлы - по частям)
+                bulk_ops.copy_object(self.s3_client, self.bucket_name, trash_path, original_path)
 
                 # Удаляем объект из корзины
                 self.s3_client.delete_object(
                     Bucket=self.bucket_name,
                     Key=trash_path
                 )
+                listing_cache.invalidate_path(os.path.dirname(original_path))
+                listing_cache.invalidate_path(os.path.dirname(trash_path))
+                object_index.move_key(trash_path, original_path)
+                folder_tree.add_folder(os.path.dirname(original_path))
 
                 # Логируем действие
                 self.log_action(user, 'restore', original_path)
 
                 # Удаляем запись из БД
                 trash_item.delete()
+                self._forget_trash_items([trash_item])
 
                 return {
                     'success': True,
@@ -782,44 +1809,38 @@ class S3Service:
                 original_path = trash_item.original_path
                 trash_path = trash_item.trash_path.rstrip('/')
 
-                # Получаем все объекты в корзине с этим префиксом
-                paginator = self.s3_client.get_paginator('list_objects_v2')
-                pages = paginator.paginate(Bucket=self.bucket_name, Prefix=trash_path)
-
-                restored_count = 0
-                for page in pages:
-                    if 'Contents' in page:
-                        for obj in page['Contents']:
-                            trash_key = obj['Key']
-
-                            # Пропускаем сам префикс
-                            if trash_key == trash_path:
-                                continue
-
-                            # Определяем исходный путь
-                            relative_path = trash_key[len(trash_path)+1:] if trash_key.startswith(trash_path+'/') else ''
-                            target_key = f"{original_path}/{relative_path}" if original_path else relative_path
-
-                            # Копируем объект из корзины в исходное расположение
-                            self.s3_client.copy_object(
-                                Bucket=self.bucket_name,
-                                CopySource=f"{self.bucket_name}/{trash_key}",
-                                Key=target_key
-                            )
-
-                            # Удаляем объект из корзины
-                            self.s3_client.delete_object(
-                                Bucket=self.bucket_name,
-                                Key=trash_key
-                            )
-
-                            restored_count += 1
+                # Переносим все объекты папки из корзины в исходное расположение
+                # (список объектов берется из манифеста, если он есть)
+                copy_result, entry = self._journaled_move_prefix(
+                    'restore_folder', user, f"{trash_path}/", f"{original_path}/",
+                    {'trash_item_id': trash_item.id}, objects=self._manifest_objects(trash_item),
+                    progress_callback=progress_callback
+                )
+                restored_count = entry.copied_count
+
+                if copy_result['errors']:
+                    # Часть объектов осталась в корзине: запись корзины сохраняем для повторной попытки
+                    self._record_partial_folder_move(trash_path, original_path, copy_result['errors'])
+                    self._shrink_manifest(trash_item, {error['key'] for error in copy_result['errors']})
+                    self.log_action(user, 'restore', original_path, success=False,
+                                    details=f"Не восстановлено объектов: {len(copy_result['errors'])}")
+                    return {
+                        'success': False,
+                        'message': f"Ошибка восстановления: не удалось восстановить {len(copy_result['errors'])} "
+                                   f"объектов папки '{original_path}' (восстановлено {restored_count})"
+                    }
+
+                listing_cache.invalidate_path(original_path, recursive=True)
+                listing_cache.invalidate_path(trash_path, recursive=True)
+                object_index.move_prefix(trash_path, original_path)
+                folder_tree.move_folder(trash_path, original_path)
 
                 # Логируем действие
                 self.log_action(user, 'restore', original_path)
 
                 # Удаляем запись из БД
                 trash_item.delete()
+                self._forget_trash_items([trash_item])
 
                 return {
                     'success': True,
@@ -845,58 +1866,117 @@ class S3Service:
                 'message': f"Ошибка восстановления: {str(e)}"
             }
 
-    def delete_from_trash(self, trash_item_id):
-        """Окончательное удаление элемента из корзины"""
-        try:
-            # Получаем запись из БД
-            trash_item = TrashItem.objects.get(id=trash_item_id)
-            trash_path = trash_item.trash_path
+    def _restore_versioned(self, user, trash_item, progress_callback=None):
+        """Восстановление элемента корзины на версиях: удаление маркеров удаления"""
+        original_path = trash_item.original_path
 
-            if trash_item.object_type == 'file':
-                # Удаляем файл из корзины
-                self.s3_client.delete_object(
-                    Bucket=self.bucket_name,
-                    Key=trash_path
+        if trash_item.object_type == 'file':
+            object_version, marker_version = (list(trash_item.versions.get(original_path) or []) + [None, None])[:2]
+            if not object_version or not marker_version:
+                self.log_action(user, 'restore', original_path, success=False,
+                                details="В записи корзины нет версий объекта")
+                return {
+                    'success': False,
+                    'message': f"Ошибка восстановления: для файла '{original_path}' не сохранены версии объекта"
+                }
+            restored_path = original_path
+            try:
+                self.s3_client.head_object(Bucket=self.bucket_name, Key=original_path)
+                # По исходному пути уже создан новый файл: прежняя версия восстанавливается рядом
+                filename, ext = os.path.splitext(original_path)
+                restored_path = f"{filename}_restored{ext}"
+                self.s3_client.copy_object(
+                    Bucket=self.bucket_name, Key=restored_path,
+                    CopySource={'Bucket': self.bucket_name, 'Key': original_path, 'VersionId': object_version}
                 )
+            except ClientError as e:
+                if e.response['Error']['Code'] not in ('404', 'NoSuchKey'):
+                    raise
 
-                # Удаляем запись из БД
-                trash_item.delete()
+            result = versioned_trash.restore_objects(self.s3_client, self.bucket_name, trash_item.versions)
+            if result['errors'] and restored_path == original_path:
+                raise bulk_ops.errors_to_client_error(result['errors'], 'DeleteObject')
 
-                return {
-                    'success': True,
-                    'message': f"Файл '{os.path.basename(trash_item.original_path)}' окончательно удален из корзины"
-                }
+            listing_cache.invalidate_path(os.path.dirname(restored_path))
+            object_index.upsert_object(restored_path, size=trash_item.original_size)
+            folder_tree.add_folder(os.path.dirname(restored_path))
+            self.log_action(user, 'restore', restored_path)
+            trash_item.delete()
 
-            elif trash_item.object_type == 'folder':
-                # Удаляем все объекты с этим префиксом
-                paginator = self.s3_client.get_paginator('list_objects_v2')
-                pages = paginator.paginate(Bucket=self.bucket_name, Prefix=trash_path)
-
-                deleted_count = 0
-                for page in pages:
-                    if 'Contents' in page:
-                        for obj in page['Contents']:
-                            self.s3_client.delete_object(
-                                Bucket=self.bucket_name,
-                                Key=obj['Key']
-                            )
-                            deleted_count += 1
+            return {
+                'success': True,
+                'message': f"Файл '{os.path.basename(restored_path)}' успешно восстановлен",
+                'restored_path': restored_path
+            }
 
-                # Удаляем запись из БД
-                trash_item.delete()
+        result = versioned_trash.restore_objects(
+            self.s3_client, self.bucket_name, trash_item.versions, progress_callback=progress_callback
+        )
+        failed_keys = {error['key'] for error in result['errors']}
+        restored_count = len(trash_item.versions) - len(failed_keys)
+
+        listing_cache.invalidate_path(original_path, recursive=True)
+        object_index.upsert_objects(
+            versioned_trash.iter_current_versions(self.s3_client, self.bucket_name, f"{original_path}/")
+        )
+        folder_tree.add_folders(
+            {os.path.dirname(key) for key in trash_item.versions if key not in failed_keys} | {original_path}
+        )
+
+        if failed_keys:
+            # Часть маркеров не удалена: в записи корзины остаются только эти объекты
+            trash_item.versions = {key: trash_item.versions[key] for key in failed_keys}
+            trash_item.object_count = len(failed_keys)
+            trash_item.save(update_fields=['versions', 'object_count'])
+            self.log_action(user, 'restore', original_path, success=False,
+                            details=f"Не восстановлено объектов: {len(failed_keys)}")
+            return {
+                'success': False,
+                'message': f"Ошибка восстановления: не удалось восстановить {len(failed_keys)} "
+                           f"объектов папки '{original_path}' (восстановлено {restored_count})"
+            }
+
+        self.log_action(user, 'restore', original_path)
+        trash_item.delete()
+
+        return {
+            'success': True,
+            'message': f"Папка '{original_path}' и ее содержимое ({restored_count} объектов) успешно восстановлены",
+            'restored_path': original_path,
+            'restored_count': restored_count
+        }
 
+    def delete_from_trash(self, trash_item_id, progress_callback=None):
+        """Окончательное удаление элемента из корзины"""
+        try:
+            # Получаем запись из БД
+            trash_item = TrashItem.objects.get(id=trash_item_id)
+
+            if trash_item.object_type not in ('file', 'folder'):
                 return {
-                    'success': True,
-                    'message': f"Папка '{trash_item.original_path}' и ее содержимое ({deleted_count} объектов) окончательно удалены из корзины",
-                    'deleted_count': deleted_count
+                    'success': False,
+                    'message': f"Неизвестный тип объекта: {trash_item.object_type}"
                 }
 
-            else:
+            deleted_count, failed_items = self._purge_trash_items([trash_item], progress_callback)
+            if failed_items:
                 return {
                     'success': False,
-                    'message': f"Неизвестный тип объекта: {trash_item.object_type}"
+                    'message': f"Ошибка удаления: не удалось удалить часть объектов '{trash_item.original_path}' из корзины"
                 }
 
+            if trash_item.object_type == 'file':
+                return {
+                    'success': True,
+                    'message': f"Файл '{os.path.basename(trash_item.original_path)}' окончательно удален из корзины"
+                }
+
+            return {
+                'success': True,
+                'message': f"Папка '{trash_item.original_path}' и ее содержимое ({deleted_count} объектов) окончательно удалены из корзины",
+                'deleted_count': deleted_count
+            }
+
         except TrashItem.DoesNotExist:
             return {
                 'success': False,
@@ -908,45 +1988,21 @@ class S3Service:
                 'message': f"Ошибка удаления: {str(e)}"
             }
 
-    def empty_trash(self):
+    def empty_trash(self, progress_callback=None):
         """Полная очистка корзины"""
         try:
             # Получаем все записи из корзины
-            trash_items = TrashItem.objects.all()
-            deleted_count = 0
-
-            for item in trash_items:
-                trash_path = item.trash_path
+            trash_items = list(TrashItem.objects.all())
+            deleted_count, failed_items = self._purge_trash_items(trash_items, progress_callback)
+            items_count = len(trash_items) - len(failed_items)
 
-                if item.object_type == 'file':
-                    # Удаляем файл из корзины
-                    self.s3_client.delete_object(
-                        Bucket=self.bucket_name,
-                        Key=trash_path
-                    )
-                    deleted_count += 1
-
-                elif item.object_type == 'folder':
-                    # Удаляем все объекты с этим префиксом
-                    paginator = self.s3_client.get_paginator('list_objects_v2')
-                    pages = paginator.paginate(Bucket=self.bucket_name, Prefix=trash_path)
-
-                    for page in pages:
-                        if 'Contents' in page:
-                            for obj in page['Contents']:
-                                self.s3_client.delete_object(
-                                    Bucket=self.bucket_name,
-                                    Key=obj['Key']
-                                )
-                                deleted_count += 1
-
-            # Удаляем все записи из БД
-            items_count = trash_items.count()
-            trash_items.delete()
+            message = f"Корзина очищена. Удалено {items_count} элементов ({deleted_count} объектов)."
+            if failed_items:
+                message += f" Не удалось удалить {len(failed_items)} элементов."
 
             return {
                 'success': True,
-                'message': f"Корзина очищена. Удалено {items_count} элементов ({deleted_count} объектов).",
+                'message': message,
                 'deleted_count': deleted_count
             }
 
@@ -956,45 +2012,21 @@ class S3Service:
                 'message': f"Ошибка очистки корзины: {str(e)}"
             }
 
-    def cleanup_expired_trash(self):
+    def cleanup_expired_trash(self, progress_callback=None):
         """Очистка элементов корзины с истекшим сроком хранения"""
         try:
             # Получаем элементы с истекшим сроком хранения
-            expired_items = TrashItem.get_expired_items()
-            deleted_count = 0
-
-            for item in expired_items:
-                trash_path = item.trash_path
-
-                if item.object_type == 'file':
-                    # Удаляем файл из корзины
-                    self.s3_client.delete_object(
-                        Bucket=self.bucket_name,
-                        Key=trash_path
-                    )
-                    deleted_count += 1
+            expired_items = list(TrashItem.get_expired_items())
+            deleted_count, failed_items = self._purge_trash_items(expired_items, progress_callback)
+            items_count = len(expired_items) - len(failed_items)
 
-                elif item.object_type == 'folder':
-                    # Удаляем все объекты с этим префиксом
-                    paginator = self.s3_client.get_paginator('list_objects_v2')
-                    pages = paginator.paginate(Bucket=self.bucket_name, Prefix=trash_path)
-
-                    for page in pages:
-                        if 'Contents' in page:
-                            for obj in page['Contents']:
-                                self.s3_client.delete_object(
-                                    Bucket=self.bucket_name,
-                                    Key=obj['Key']
-                                )
-                                deleted_count += 1
-
-            # Удаляем записи из БД
-            items_count = expired_items.count()
-            expired_items.delete()
+            message = f"Очищены элементы с истекшим сроком хранения: {items_count} элементов ({deleted_count} объектов)."
+            if failed_items:
+                message += f" Не удалось удалить {len(failed_items)} элементов."
 
             return {
                 'success': True,
-                'message': f"Очищены элементы с истекшим сроком хранения: {items_count} элементов ({deleted_count} объектов).",
+                'message': message,
                 'deleted_count': deleted_count
             }
 
@@ -1004,6 +2036,179 @@ class S3Service:
                 'message': f"Ошибка очистки элементов с истекшим сроком хранения: {str(e)}"
             }
 
+    def _purge_trash_items(self, trash_items, progress_callback=None):
+        """Окончательно удаляет объекты элементов корзины пачками DeleteObjects.
+
+        Ключи всех элементов удаляются одним потоком пачек; записи элементов,
+        все объекты которых удалены, удаляются из БД.
+
+        Returns:
+            tuple: (количество удаленных объектов, элементы, удаленные не полностью)
+        """
+        def iter_trash_keys():
+            for item in trash_items:
+                if item.backend == 'versioning':
+                    # Удаляются сама версия объекта и маркер удаления
+                    yield from versioned_trash.iter_purge_versions(item.versions)
+                elif item.object_type == 'file':
+                    yield item.trash_path
+                elif item.object_type == 'folder':
+                    objects = self._manifest_objects(item)
+                    if objects is None:
+                        yield from bulk_ops.iter_prefix_keys(self.s3_client, self.bucket_name, item.trash_path)
+                    else:
+                        yield from (obj['Key'] for obj in objects)
+
+        result = bulk_ops.bulk_delete(
+            self.s3_client, self.bucket_name, iter_trash_keys(), progress_callback=progress_callback
+        )
+
+        failed_keys = {error['key'] for error in result['errors']}
+        for error in result['errors'][:10]:
+            print(f"Error deleting {error['key']} from trash: {error['code']} {error['message']}")
+
+        failed_items = []
+        purged_items = []
+        for item in trash_items:
+            if item.backend == 'versioning':
+                failed = any(key in failed_keys for key in item.versions)
+            elif item.object_type == 'folder':
+                failed = any(key.startswith(item.trash_path) for key in failed_keys)
+            else:
+                failed = item.trash_path in failed_keys
+            (failed_items if failed else purged_items).append(item)
+
+        # Удаляем записи из БД
+        TrashItem.objects.filter(id__in=[item.id for item in purged_items]).delete()
+        self._forget_trash_items(purged_items)
+        listing_cache.invalidate_path('__trash', recursive=True)
+
+        return result['deleted_count'], failed_items
+
+    def _journaled_move_prefix(self, operation, user, source_prefix, destination_prefix, params,
+                               exclude_key=None, objects=None, progress_callback=None):
+        """Перенос всех объектов префикса с записью в журнал операций.
+
+        Если та же операция была прервана, она продолжается с контрольной точки журнала,
+        а объекты, уже скопированные в назначение (тот же ETag и размер или записанные в журнал
+        как скопированные по частям), не копируются повторно.
+
+        Args:
+            objects: объекты источника в порядке листинга (по умолчанию - листинг source_prefix)
+
+        Returns:
+            tuple: (результат bulk_ops.copy_prefix для этого запуска, OperationJournal
+                    с общими счетчиками всех запусков)
+        """
+        entry, resumed = journal.start(operation, user, source_prefix, destination_prefix, **params)
+        checkpointer = journal.Checkpointer(entry)
+        start_after = entry.checkpoint or None
+
+        if objects is None:
+            objects = bulk_ops.iter_prefix_objects(
+                self.s3_client, self.bucket_name, source_prefix, start_after=start_after
+            )
+        elif start_after is not None:
+            objects = (obj for obj in objects if obj['Key'] > start_after)
+        if exclude_key is not None:
+            objects = (obj for obj in objects if obj['Key'] != exclude_key)
+
+        try:
+            # Контрольная точка может долго не меняться - активность отмечается по таймеру
+            with journal.heartbeat(entry):
+                copy_result = bulk_ops.copy_prefix(
+                    self.s3_client, self.bucket_name, source_prefix, destination_prefix,
+                    objects=objects, delete_source=True, progress_callback=progress_callback,
+                    start_after=start_after, skip_existing=resumed, checkpoint_callback=checkpointer,
+                    known_copies=dict(entry.multipart_copies), multipart_callback=checkpointer.record_multipart_copy
+                )
+        except Exception as e:
+            checkpointer.fail(e)
+            raise
+        checkpointer.finish(copy_result)
+        return copy_result, entry
+
+    def _record_partial_folder_move(self, source_path, destination_path, errors):
+        """Обновляет кэши и индекс после переноса папки, завершившегося с ошибками.
+
+        Успешно перенесенные объекты находятся в destination_path, объекты из errors
+        остались в source_path (при ошибке удаления - в обеих папках).
+        """
+        source_path = self._normalize_path(source_path)
+        destination_path = self._normalize_path(destination_path)
+        source_prefix = f"{source_path}/"
+        destination_prefix = f"{destination_path}/"
+
+        listing_cache.invalidate_path(source_path, recursive=True)
+        listing_cache.invalidate_path(destination_path, recursive=True)
+        object_index.move_prefix(source_path, destination_path)
+        folder_tree.move_folder(source_path, destination_path)
+        for error in errors:
+            source_key = error['key']
+            destination_key = destination_prefix + source_key[len(source_prefix):]
+            if error['operation'] == 'copy':
+                object_index.move_key(destination_key, source_key)
+            else:
+                object_index.upsert_object(source_key)
+            folder_tree.add_folder(os.path.dirname(source_key))
+
+    def _recorded(self, objects, listed):
+        """Передает объекты дальше, запоминая их в списке listed"""
+        for obj in objects:
+            listed.append(obj)
+            yield obj
+
+    def _manifest_objects(self, trash_item):
+        """Объекты папки в корзине из манифеста или None, если манифеста нет"""
+        if not trash_item.manifest:
+            return None
+        return trash_manifest.iter_objects(trash_item.manifest, trash_item.trash_path)
+
+    def _shrink_manifest(self, trash_item, keys):
+        """Оставляет в манифесте элемента корзины только объекты с указанными ключами"""
+        objects = self._manifest_objects(trash_item)
+        if objects is None:
+            return
+        remaining = [obj for obj in objects if obj['Key'] in keys]
+        trash_item.manifest = trash_manifest.encode(remaining, trash_item.trash_path)
+        trash_item.object_count = len(remaining)
+        trash_item.original_size = sum(obj['Size'] for obj in remaining)
+        trash_item.save(update_fields=['manifest', 'object_count', 'original_size'])
+
+    def _forget_trash_items(self, trash_items):
+        """Удаляет из индекса и дерева папок объекты элементов корзины, записи которых уже удалены.
+
+        Несколько элементов могут делить одну папку корзины '__trash/<id>' (массовое удаление),
+        поэтому папка удаляется целиком, только если в ней не осталось других элементов.
+        """
+        # Объекты элементов корзины на версиях не видны в бакете и не попадают в индекс
+        trash_items = [item for item in trash_items if item.backend != 'versioning']
+        roots = {self._trash_root(item.trash_path) for item in trash_items}
+        shared_roots = set()
+        root_list = sorted(roots)
+        for start in range(0, len(root_list), 100):
+            condition = functools.reduce(
+                operator.or_, (Q(trash_path__startswith=f"{root}/") for root in root_list[start:start + 100])
+            )
+            shared_roots.update(
+                self._trash_root(path) for path in TrashItem.objects.filter(condition).values_list('trash_path', flat=True)
+            )
+
+        folders = sorted(roots - shared_roots)
+        for item in trash_items:
+            if self._trash_root(item.trash_path) not in shared_roots:
+                continue
+            if item.object_type == 'file':
+                object_index.remove_key(item.trash_path)
+            else:
+                folders.append(item.trash_path)
+        object_index.remove_prefixes(folders)
+        folder_tree.remove_folders(folders)
+
+    def _trash_root(self, trash_path):
+        """Возвращает папку элемента корзины вида '__trash/<id>' для пути объекта в корзине"""
+        return '/'.join(trash_path.strip('/').split('/')[:2])
+
     def _normalize_path(self, path):
         """Нормализация пути к объекту/директории.
            Удаляет начальные/конечные слеши и множественные слеши."""
@@ -1015,64 +2220,55 @@ class S3Service:
 
     def list_all_folders(self):
         """Получение списка всех папок в хранилище для автозаполнения"""
-        folders = set([''])  # Включаем корневую папку
-
         try:
-            paginator = self.s3_client.get_paginator('list_objects_v2')
-            pages = paginator.paginate(
-                Bucket=self.bucket_name,
-                Delimiter='/'
-            )
-
-            # Обрабатываем первый уровень папок
-            for page in pages:
-                if 'CommonPrefixes' in page:
-                    for prefix in page['CommonPrefixes']:
-                        prefix_path = prefix['Prefix'].rstrip('/')
-                        folders.add(prefix_path)
-
-                        # Рекурсивно получаем подпапки
-                        self._get_subfolders(prefix_path, folders)
-
-            # Преобразуем set в список и сортируем
-            folders_list = sorted(list(folders))
-
-            return folders_list
-
+            return list(folder_tree.get_tree(self._load_all_folders).folders)
         except ClientError as e:
             print(f"Error listing all folders: {str(e)}")
             return []
 
-    def _get_subfolders(self, parent_path, folders_set):
-        """Рекурсивное получение подпапок для указанного пути"""
+    def search_folders(self, term, limit=10):
+        """Поиск папок, путь которых содержит term (без учета регистра), по дереву папок"""
         try:
-            # Добавляем слеш в конец для получения содержимого папки
-            prefix = parent_path + '/' if parent_path else ''
-
-            paginator = self.s3_client.get_paginator('list_objects_v2')
-            pages = paginator.paginate(
-                Bucket=self.bucket_name,
-                Prefix=prefix,
-                Delimiter='/'
-            )
-
-            for page in pages:
-                if 'CommonPrefixes' in page:
-                    for sub_prefix in page['CommonPrefixes']:
-                        sub_path = sub_prefix['Prefix'].rstrip('/')
+            return folder_tree.get_tree(self._load_all_folders).search(term, limit=limit)
+        except ClientError as e:
+            print(f"Error searching folders: {str(e)}")
+            return []
 
-                        # Пропускаем, если это текущая папка
-                        if sub_path == parent_path:
-                            continue
+    def iter_folders(self, prefix='', max_depth=None):
+        """Параллельный обход папок внутри prefix в ширину.
 
-                        # Добавляем папку в набор
-                        folders_set.add(sub_path)
+        Папки отдаются по мере обнаружения, порядок не гарантируется.
+        """
+        return discover_folders(self.s3_client, self.bucket_name, root=prefix, max_depth=max_depth)
 
-                        # Рекурсивно получаем подпапки
-                        self._get_subfolders(sub_path, folders_set)
+    def _load_all_folders(self):
+        """Собирает пути всех папок бакета для построения дерева папок.
 
-        except ClientError as e:
-            print(f"Error getting subfolders for {parent_path}: {str(e)}")
+        При включенном индексе папки берутся из него. Иначе, в зависимости от
+        S3_FOLDER_TREE_SOURCE, - из одного листинга бакета без разделителя
+        (папки выводятся из ключей объектов) или параллельным обходом папок.
+        """
+        if object_index.is_enabled():
+            return [
+                key.rstrip('/')
+                for key in S3ObjectIndex.objects.filter(is_folder=True).values_list('key', flat=True)
+            ]
+
+        if getattr(settings, 'S3_FOLDER_TREE_SOURCE', 'listing') == 'discovery':
+            return set(self.iter_folders())
+
+        folders = set()
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket_name):
+            for obj in page.get('Contents', []):
+                parts = obj['Key'].split('/')[:-1]
+                for i in range(len(parts), 0, -1):
+                    folder = '/'.join(filter(None, parts[:i]))
+                    if not folder or folder in folders:
+                        # Предки уже добавлены вместе с этой папкой
+                        break
+                    folders.add(folder)
+        return folders
 
     def upload_file(self, user, file_obj, destination_path):
         """Загрузка файла в S3"""
@@ -1105,6 +2301,19 @@ class S3Service:
                 normalized_path,
                 ExtraArgs={'ContentType': content_type}
             )
+            listing_cache.invalidate_path(folder_path)
+            archive_cache.invalidate_paths(self.s3_client, self.bucket_name, [normalized_path])
+            folder_tree.add_folder(folder_path)
+            if object_index.is_enabled():
+                # Размер, ETag и дату изменения берем у только что загруженного объекта
+                uploaded = self.s3_client.head_object(Bucket=self.bucket_name, Key=normalized_path)
+                object_index.upsert_object(
+                    normalized_path,
+                    size=uploaded.get('ContentLength', 0),
+                    etag=uploaded.get('ETag', ''),
+                    last_modified=uploaded.get('LastModified'),
+                    content_type=content_type
+                )
 
             # Логируем действие
             self.log_action(user, 'upload', normalized_path)
@@ -0,0 +1,35 @@
+"""
+Проверка, общий ли кэш-бэкенд Django для процессов приложения.
+
+Кэши со сбросом при изменениях (листинги директорий, дерево папок) корректны,
+только если сброс, выполненный в одном процессе, виден во всех остальных:
+в нескольких воркерах веб-сервера и в воркере фоновых задач. Бэкенды в памяти
+процесса (LocMemCache) этого не обеспечивают.
+"""
+from django.conf import settings
+from django.core.checks import Warning, register
+
+# Бэкенды, данные которых не видны другим процессам
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def is_shared(alias='default'):
+    """Видны ли записи кэша alias всем процессам приложения"""
+    backend = settings.CACHES.get(alias, {}).get('BACKEND', '')
+    return backend not in PROCESS_LOCAL_BACKENDS
+
+
+@register()
+def check_listing_cache_backend(app_configs, **kwargs):
+    """Предупреждает, что включенный кэш листингов не работает без общего кэш-бэкенда"""
+    if getattr(settings, 'S3_LISTING_CACHE_ENABLED', True) and not is_shared():
+        return [Warning(
+            "S3_LISTING_CACHE_ENABLED включен, но кэш Django хранится в памяти процесса: "
+            "кэш листингов отключен.",
+            hint="Укажите общий кэш-бэкенд в DJANGO_CACHE_BACKEND (например, Redis или FileBasedCache).",
+            id='s3app.W001',
+        )]
+    return []
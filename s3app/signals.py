@@ -0,0 +1,13 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import UserPermission
+from .permissions import invalidate_user_permissions
+
+
+@receiver(post_save, sender=UserPermission)
+@receiver(post_delete, sender=UserPermission)
+def reset_user_permissions_cache(sender, instance, **kwargs):
+    """Сбрасывает кэш прав пользователя при изменении его прав доступа"""
+    invalidate_user_permissions(instance.user_id)
+
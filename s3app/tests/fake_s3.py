@@ -0,0 +1,296 @@
+"""Клиент S3 в памяти для тестов: подмножество API boto3, которое использует приложение"""
+import datetime
+import hashlib
+import io
+import threading
+
+from botocore.exceptions import ClientError
+
+
+def client_error(code, operation_name, message=''):
+    return ClientError({'Error': {'Code': code, 'Message': message or code}}, operation_name)
+
+
+class _Paginator:
+    def __init__(self, client, operation_name):
+        self.client = client
+        self.operation_name = operation_name
+
+    def paginate(self, **params):
+        params = dict(params)
+        while True:
+            page = getattr(self.client, self.operation_name)(**params)
+            yield page
+            if not page.get('IsTruncated'):
+                return
+            params['ContinuationToken'] = page['NextContinuationToken']
+
+
+class _Body(io.BytesIO):
+    def iter_chunks(self, chunk_size=1024):
+        while True:
+            chunk = self.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+class FakeS3Client:
+    """Один бакет; objects - текущие версии объектов (ключ -> содержимое).
+
+    Версионирование включается атрибутом versioning ('Enabled' или 'Suspended'):
+    при включенном каждая запись и удаление добавляют версию в history
+    (ключ -> список {'VersionId', 'Body'}, Body None - маркер удаления).
+    При report_markers=False DeleteObjects не возвращает версии маркеров, как
+    некоторые S3-совместимые хранилища. Ключи из fail_copy и fail_delete
+    возвращают ошибку AccessDenied при копировании и удалении соответственно.
+    В calls записываются имена вызванных методов. Объект, собранный из частей
+    (CompleteMultipartUpload), получает составной ETag вида "<md5>-<число частей>", как в S3.
+    """
+
+    def __init__(self, objects=None, page_size=1000):
+        self.objects = {}
+        self.page_size = page_size
+        self.versioning = None
+        self.history = {}
+        self.report_markers = True
+        self.fail_copy = set()
+        self.fail_delete = set()
+        self.calls = []
+        self.uploads = {}
+        self.etags = {}
+        self._lock = threading.Lock()
+        self._version_counter = 0
+        for key, body in (objects or {}).items():
+            self.put_object(Bucket='bucket', Key=key, Body=body)
+
+    def _record(self, name):
+        with self._lock:
+            self.calls.append(name)
+
+    def _meta(self, key):
+        body = self.objects[key]
+        return {
+            'Key': key,
+            'Size': len(body),
+            'ETag': self.etags.get(key) or f'"{hashlib.md5(body).hexdigest()}"',
+            'LastModified': datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc),
+        }
+
+    def _add_version(self, key, body):
+        self._version_counter += 1
+        version_id = f"v{self._version_counter}"
+        self.history.setdefault(key, []).append({'VersionId': version_id, 'Body': body})
+        return version_id
+
+    def _write(self, key, body):
+        """Записывает текущую версию объекта; возвращает ее VersionId (или None без версионирования)"""
+        self.objects[key] = body
+        self.etags.pop(key, None)
+        if self.versioning == 'Enabled':
+            return self._add_version(key, body)
+        return None
+
+    def _delete_current(self, key):
+        """Удаляет текущую версию; возвращает версию созданного маркера удаления или None"""
+        self.objects.pop(key, None)
+        self.etags.pop(key, None)
+        if self.versioning == 'Enabled':
+            return self._add_version(key, None)
+        return None
+
+    def _delete_version(self, key, version_id):
+        versions = [version for version in self.history.get(key, []) if version['VersionId'] != version_id]
+        self.history[key] = versions
+        self.etags.pop(key, None)
+        if versions and versions[-1]['Body'] is not None:
+            self.objects[key] = versions[-1]['Body']
+        else:
+            self.objects.pop(key, None)
+
+    def _current_version_id(self, key):
+        versions = self.history.get(key)
+        return versions[-1]['VersionId'] if versions else None
+
+    def get_bucket_versioning(self, Bucket):
+        self._record('get_bucket_versioning')
+        return {'Status': self.versioning} if self.versioning else {}
+
+    def list_object_versions(self, Bucket, Prefix='', **kwargs):
+        self._record('list_object_versions')
+        versions, markers = [], []
+        with self._lock:
+            for key in sorted(key for key in self.history if key.startswith(Prefix)):
+                history = self.history[key]
+                for index, version in enumerate(reversed(history)):
+                    item = {'Key': key, 'VersionId': version['VersionId'], 'IsLatest': index == 0}
+                    if version['Body'] is None:
+                        markers.append(item)
+                    else:
+                        item.update(Size=len(version['Body']), ETag=f'"{hashlib.md5(version["Body"]).hexdigest()}"')
+                        versions.append(item)
+        return {'Versions': versions, 'DeleteMarkers': markers, 'IsTruncated': False}
+
+    def get_paginator(self, operation_name):
+        return _Paginator(self, operation_name)
+
+    def list_objects_v2(self, Bucket, Prefix='', Delimiter='', StartAfter='', ContinuationToken=None,
+                        MaxKeys=None, **kwargs):
+        """Как в S3: ключи в порядке возрастания, с Delimiter вложенные ключи сворачиваются
+        в CommonPrefixes; объекты и префиксы вместе ограничены MaxKeys"""
+        self._record('list_objects_v2')
+        start = ContinuationToken or StartAfter
+        max_keys = min(MaxKeys or self.page_size, self.page_size)
+        with self._lock:
+            keys = sorted(key for key in self.objects if key.startswith(Prefix) and key > start)
+
+        contents, common_prefixes = [], []
+        last_key = None
+        truncated = False
+        for key in keys:
+            rest = key[len(Prefix):]
+            common_prefix = None
+            if Delimiter and Delimiter in rest:
+                common_prefix = Prefix + rest[:rest.index(Delimiter) + len(Delimiter)]
+                if common_prefixes and common_prefixes[-1] == common_prefix:
+                    # Ключ внутри уже возвращенного префикса
+                    last_key = key
+                    continue
+            if len(contents) + len(common_prefixes) == max_keys:
+                truncated = True
+                break
+            if common_prefix is not None:
+                common_prefixes.append(common_prefix)
+            else:
+                contents.append(self._meta(key))
+            last_key = key
+
+        response = {'Contents': contents, 'KeyCount': len(contents) + len(common_prefixes),
+                    'IsTruncated': truncated}
+        if common_prefixes:
+            response['CommonPrefixes'] = [{'Prefix': prefix} for prefix in common_prefixes]
+        if truncated:
+            response['NextContinuationToken'] = last_key
+        return response
+
+    def put_object(self, Bucket, Key, Body=b'', **kwargs):
+        self._record('put_object')
+        if isinstance(Body, str):
+            Body = Body.encode('utf-8')
+        with self._lock:
+            version_id = self._write(Key, Body if isinstance(Body, bytes) else Body.read())
+        response = {'ETag': self._meta(Key)['ETag']}
+        if version_id:
+            response['VersionId'] = version_id
+        return response
+
+    def head_object(self, Bucket, Key):
+        self._record('head_object')
+        if Key not in self.objects:
+            raise client_error('404', 'HeadObject', 'Not Found')
+        meta = self._meta(Key)
+        response = {'ContentLength': meta['Size'], 'ETag': meta['ETag'], 'LastModified': meta['LastModified']}
+        if self._current_version_id(Key):
+            response['VersionId'] = self._current_version_id(Key)
+        return response
+
+    def get_object(self, Bucket, Key, **kwargs):
+        self._record('get_object')
+        if Key not in self.objects:
+            raise client_error('NoSuchKey', 'GetObject')
+        response = self.head_object(Bucket=Bucket, Key=Key)
+        response['Body'] = _Body(self.objects[Key])
+        return response
+
+    def copy_object(self, Bucket, CopySource, Key, **kwargs):
+        self._record('copy_object')
+        if isinstance(CopySource, dict):
+            source_key, source_version = CopySource['Key'], CopySource.get('VersionId')
+        else:
+            source_key, source_version = CopySource.split('/', 1)[1], None
+        if source_key in self.fail_copy:
+            raise client_error('AccessDenied', 'CopyObject')
+        with self._lock:
+            if source_version:
+                bodies = [version['Body'] for version in self.history.get(source_key, [])
+                          if version['VersionId'] == source_version and version['Body'] is not None]
+                body = bodies[0] if bodies else None
+            else:
+                body = self.objects.get(source_key)
+            if body is None:
+                raise client_error('NoSuchKey', 'CopyObject')
+            self._write(Key, body)
+        return {'CopyObjectResult': {'ETag': self._meta(Key)['ETag']}}
+
+    def delete_object(self, Bucket, Key):
+        self._record('delete_object')
+        with self._lock:
+            self._delete_current(Key)
+        return {}
+
+    def delete_objects(self, Bucket, Delete):
+        self._record('delete_objects')
+        deleted, errors = [], []
+        with self._lock:
+            for item in Delete['Objects']:
+                if item['Key'] in self.fail_delete:
+                    errors.append({'Key': item['Key'], 'Code': 'AccessDenied', 'Message': 'Access Denied'})
+                    continue
+                if item.get('VersionId'):
+                    self._delete_version(item['Key'], item['VersionId'])
+                    deleted.append({'Key': item['Key'], 'VersionId': item['VersionId']})
+                    continue
+                marker_version = self._delete_current(item['Key'])
+                entry = {'Key': item['Key']}
+                if marker_version:
+                    entry['DeleteMarker'] = True
+                    if self.report_markers:
+                        entry['DeleteMarkerVersionId'] = marker_version
+                deleted.append(entry)
+        response = {'Errors': errors} if errors else {}
+        if not Delete.get('Quiet'):
+            response['Deleted'] = deleted
+        return response
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        self._record('create_multipart_upload')
+        upload_id = f"upload-{len(self.calls)}"
+        with self._lock:
+            self.uploads[upload_id] = {'key': Key, 'parts': {}}
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self._record('upload_part')
+        with self._lock:
+            self.uploads[UploadId]['parts'][PartNumber] = Body
+        return {'ETag': f'"{hashlib.md5(Body).hexdigest()}"'}
+
+    def upload_part_copy(self, Bucket, Key, UploadId, PartNumber, CopySource, CopySourceRange, **kwargs):
+        self._record('upload_part_copy')
+        if CopySource['Key'] in self.fail_copy:
+            raise client_error('AccessDenied', 'UploadPartCopy')
+        start, end = (int(value) for value in CopySourceRange[len('bytes='):].split('-'))
+        with self._lock:
+            body = self.objects[CopySource['Key']][start:end + 1]
+            self.uploads[UploadId]['parts'][PartNumber] = body
+        return {'CopyPartResult': {'ETag': f'"{hashlib.md5(body).hexdigest()}"'}}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self._record('complete_multipart_upload')
+        with self._lock:
+            upload = self.uploads.pop(UploadId)
+            parts = [upload['parts'][part['PartNumber']] for part in MultipartUpload['Parts']]
+            self._write(Key, b''.join(parts))
+            digest = hashlib.md5(b''.join(hashlib.md5(part).digest() for part in parts)).hexdigest()
+            self.etags[Key] = f'"{digest}-{len(parts)}"'
+        return {}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self._record('abort_multipart_upload')
+        with self._lock:
+            self.uploads.pop(UploadId, None)
+        return {}
+
+    def generate_presigned_url(self, ClientMethod, Params, ExpiresIn=3600):
+        self._record('generate_presigned_url')
+        return f"https://{Params['Bucket']}.example/{Params['Key']}"
@@ -0,0 +1,117 @@
+"""Кэш готовых архивов (s3app.archive_cache): сохранение при отдаче потока и сброс по изменившимся путям"""
+import io
+import zipfile
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+
+from s3app import archive_cache
+from s3app.models import ArchiveCacheEntry
+from s3app.s3_service import S3Service
+
+from .fake_s3 import FakeS3Client
+
+
+@override_settings(S3_ARCHIVE_CACHE_ENABLED=True)
+class InvalidatePathsTests(TestCase):
+    ARCHIVES = {
+        'files': ['a/x.txt', 'b/y.txt'],
+        'folder_a': ['a/'],
+        'folder_a_sub': ['a/sub/'],
+        'folder_ab': ['ab/'],
+        'root': [''],
+        'folder_c': ['c/'],
+    }
+
+    def setUp(self):
+        self.fake = FakeS3Client()
+        for name, paths in self.ARCHIVES.items():
+            object_key = f"{archive_cache.CACHE_PREFIX}{name}.zip"
+            self.fake.put_object(Bucket='bucket', Key=object_key, Body=b'zip')
+            ArchiveCacheEntry.objects.create(fingerprint=name, object_key=object_key,
+                                             paths=archive_cache._paths_text(paths))
+
+    def cached(self):
+        return set(ArchiveCacheEntry.objects.values_list('fingerprint', flat=True))
+
+    def invalidate(self, *paths):
+        """Названия архивов, удаленных из кэша этим вызовом"""
+        before = self.cached()
+        archive_cache.invalidate_paths(self.fake, 'bucket', list(paths))
+        return before - self.cached()
+
+    def test_file_change(self):
+        self.assertEqual(self.invalidate('a/x.txt'), {'files', 'folder_a', 'root'})
+        self.assertNotIn(f"{archive_cache.CACHE_PREFIX}files.zip", self.fake.objects)
+        self.assertIn(f"{archive_cache.CACHE_PREFIX}folder_a_sub.zip", self.fake.objects)
+
+    def test_nested_folder_change(self):
+        self.assertEqual(self.invalidate('a/sub/'), {'folder_a', 'folder_a_sub', 'root'})
+
+    def test_folder_change_covers_selected_files(self):
+        self.assertEqual(self.invalidate('/a'), {'files', 'folder_a', 'folder_a_sub', 'root'})
+
+    def test_similar_names_do_not_match(self):
+        self.assertEqual(self.invalidate('a/x', 'b/y.txt.bak'), {'folder_a', 'root'})
+        self.assertEqual(self.invalidate('ab/z.txt'), {'folder_ab'})
+
+    def test_unrelated_change_only_drops_root_archive(self):
+        self.assertEqual(self.invalidate('', '/'), set())
+        self.assertEqual(self.invalidate('d/new.txt'), {'root'})
+
+    @override_settings(S3_ARCHIVE_CACHE_ENABLED=False)
+    def test_disabled_cache_keeps_entries(self):
+        self.assertEqual(self.invalidate('a/x.txt'), set())
+
+
+@override_settings(S3_ARCHIVE_CACHE_ENABLED=True, S3_ARCHIVE_CACHE_LOOKUP_MAX_MEMBERS=2)
+class ArchiveStreamCacheTests(TestCase):
+    def setUp(self):
+        self.fake = FakeS3Client({'r/a.txt': b'a' * 100, 'r/b.txt': b'b' * 100, 'r/c/d.txt': b'd'})
+        with mock.patch('s3app.s3_service.get_s3_client', return_value=self.fake):
+            self.service = S3Service()
+        self.service.bucket_name = 'bucket'
+        self.user = User.objects.create_superuser('admin', password='x')
+
+    def download(self, archive):
+        url = self.service.cached_archive_url(self.user, archive, 'balanced', 'archive.zip')
+        if url:
+            return url
+        return zipfile.ZipFile(io.BytesIO(b''.join(self.service.archive_stream(self.user, archive, 'balanced'))))
+
+    def test_selected_files_are_cached_by_content(self):
+        files = ['r/a.txt', 'r/b.txt']
+        first = self.download(self.service.file_archive(self.user, files))
+        self.assertEqual(first.read('a.txt'), b'a' * 100)
+        entry = ArchiveCacheEntry.objects.get()
+        self.assertEqual(entry.member_count, 2)
+        self.assertEqual(self.fake.objects[entry.object_key][:2], b'PK')
+
+        self.assertIn(entry.object_key, self.download(self.service.file_archive(self.user, files)))
+
+        # Измененный файл дает другой ключ содержимого
+        self.fake.put_object(Bucket='bucket', Key='r/a.txt', Body=b'changed')
+        self.assertIsInstance(self.download(self.service.file_archive(self.user, files)), zipfile.ZipFile)
+        self.assertEqual(ArchiveCacheEntry.objects.count(), 2)
+
+    def test_large_selection_is_not_cached(self):
+        self.download(self.service.file_archive(self.user, ['r/a.txt', 'r/b.txt', 'r/c/d.txt']))
+        self.assertFalse(ArchiveCacheEntry.objects.exists())
+        self.assertNotIn('create_multipart_upload', self.fake.calls)
+
+    def test_folder_lookup_does_not_list(self):
+        first = self.download(self.service.folder_archive(self.user, 'r'))
+        self.assertEqual(sorted(first.namelist()), ['r/a.txt', 'r/b.txt', 'r/c/d.txt'])
+        self.assertEqual(self.fake.calls.count('list_objects_v2'), 1)
+
+        self.fake.calls = []
+        url = self.download(self.service.folder_archive(self.user, 'r'))
+        self.assertIn(ArchiveCacheEntry.objects.get().object_key, url)
+        self.assertNotIn('list_objects_v2', self.fake.calls)
+
+    def test_archive_with_failed_member_is_not_cached(self):
+        archive = self.service.file_archive(self.user, ['r/a.txt', 'r/missing.txt'])
+        self.download(archive)
+        self.assertFalse(ArchiveCacheEntry.objects.exists())
+        self.assertEqual(self.fake.uploads, {})
@@ -0,0 +1,84 @@
+"""Удаление пачками DeleteObjects (bulk_ops.bulk_delete) и очистка корзины"""
+import datetime
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from s3app import bulk_ops
+from s3app.models import TrashItem
+from s3app.s3_service import S3Service
+
+from .fake_s3 import FakeS3Client
+
+
+class RecordingClient(FakeS3Client):
+    """Запоминает размер каждой пачки DeleteObjects"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.batch_sizes = []
+
+    def delete_objects(self, Bucket, Delete):
+        with self._lock:
+            self.batch_sizes.append(len(Delete['Objects']))
+        return super().delete_objects(Bucket=Bucket, Delete=Delete)
+
+
+class BulkDeleteTests(SimpleTestCase):
+    def setUp(self):
+        self.keys = [f"data/{index:05d}" for index in range(2500)]
+        self.client = RecordingClient({key: b'x' for key in self.keys})
+
+    def test_keys_deleted_in_batches_of_1000(self):
+        progress = []
+        result = bulk_ops.bulk_delete(self.client, 'bucket', iter(self.keys), max_workers=2,
+                                      progress_callback=lambda result: progress.append(result['deleted_count']))
+
+        self.assertEqual(result, {'deleted_count': 2500, 'errors': []})
+        self.assertEqual(sorted(self.client.batch_sizes), [500, 1000, 1000])
+        self.assertEqual(self.client.objects, {})
+        self.assertEqual(progress[-1], 2500)
+
+    def test_errors_reported_per_key(self):
+        self.client.fail_delete.update({self.keys[3], self.keys[2100]})
+        result = bulk_ops.bulk_delete(self.client, 'bucket', self.keys)
+
+        self.assertEqual(result['deleted_count'], 2498)
+        self.assertEqual(sorted((error['key'], error['operation'], error['code']) for error in result['errors']),
+                         [(self.keys[3], 'delete', 'AccessDenied'), (self.keys[2100], 'delete', 'AccessDenied')])
+        self.assertEqual(sorted(self.client.objects), [self.keys[3], self.keys[2100]])
+
+
+@override_settings(S3_OBJECT_INDEX_ENABLED=False, S3_LISTING_CACHE_ENABLED=False)
+class EmptyTrashTests(TestCase):
+    def setUp(self):
+        objects = {f"__trash/big/{index:04d}.txt": b'x' for index in range(1500)}
+        objects['__trash/one.txt'] = b'1'
+        objects['__trash/small/a.txt'] = b'a'
+        self.fake = RecordingClient(objects)
+        with mock.patch('s3app.s3_service.get_s3_client', return_value=self.fake):
+            self.service = S3Service()
+        self.service.bucket_name = 'bucket'
+        expires_at = timezone.now() + datetime.timedelta(days=30)
+        for original_path, trash_path, object_type in (('big', '__trash/big/', 'folder'),
+                                                       ('one.txt', '__trash/one.txt', 'file'),
+                                                       ('small', '__trash/small/', 'folder')):
+            TrashItem.objects.create(original_path=original_path, trash_path=trash_path,
+                                     object_type=object_type, expires_at=expires_at)
+
+    def test_all_items_share_delete_batches(self):
+        result = self.service.empty_trash()
+
+        self.assertTrue(result['success'])
+        self.assertEqual(result['deleted_count'], 1502)
+        self.assertEqual(sorted(self.fake.batch_sizes), [502, 1000])
+        self.assertFalse(TrashItem.objects.exists())
+
+    def test_item_with_failed_key_is_kept(self):
+        self.fake.fail_delete.add('__trash/small/a.txt')
+        result = self.service.empty_trash()
+
+        self.assertIn("Не удалось удалить 1 элементов", result['message'])
+        self.assertEqual(list(TrashItem.objects.values_list('original_path', flat=True)), ['small'])
+        self.assertEqual(sorted(self.fake.objects), ['__trash/small/a.txt'])
@@ -0,0 +1,51 @@
+"""Проверка прав на несколько элементов одним проходом (S3Service.check_permissions_bulk)"""
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+
+from s3app.models import UserPermission
+from s3app.s3_service import S3Service
+
+from .fake_s3 import FakeS3Client
+
+
+@override_settings(S3_OBJECT_INDEX_ENABLED=False, S3_LISTING_CACHE_ENABLED=False)
+class BulkPermissionTests(TestCase):
+    def setUp(self):
+        self.fake = FakeS3Client({
+            'open/': b'', 'open/a.txt': b'a', 'open/sub/b.txt': b'b',
+            'closed/': b'', 'closed/c.txt': b'c', 'dest/': b'',
+        })
+        with mock.patch('s3app.s3_service.get_s3_client', return_value=self.fake):
+            self.service = S3Service()
+        self.service.bucket_name = 'bucket'
+        self.user = User.objects.create_user('bob', password='x')
+        UserPermission.objects.create(user=self.user, folder_path='open', can_read=True, can_move=True)
+        UserPermission.objects.create(user=self.user, folder_path='dest', can_read=True, can_write=True)
+
+    def test_one_query_for_many_paths(self):
+        paths = ['open', '/open/sub/', 'open/sub/deeper', 'closed', 'closed/x', '', 'dest']
+        with self.assertNumQueries(1):
+            allowed = self.service.check_permissions_bulk(self.user, paths, 'move')
+        self.assertEqual(allowed, {
+            'open': True, '/open/sub/': True, 'open/sub/deeper': True,
+            'closed': False, 'closed/x': False, '': False, 'dest': False,
+        })
+
+    def test_move_multiple_skips_denied_items_before_s3_calls(self):
+        result = self.service.move_multiple(self.user, ['open/a.txt', 'closed/c.txt'], ['open/sub', 'closed'], 'dest')
+
+        self.assertEqual((result['moved_files'], result['moved_folders']), (1, 1))
+        self.assertEqual(result['errors'], ["Нет прав для перемещения closed", "Нет прав для перемещения closed/c.txt"])
+        self.assertIn('dest/a.txt', self.fake.objects)
+        self.assertIn('dest/sub/b.txt', self.fake.objects)
+        self.assertIn('closed/c.txt', self.fake.objects)
+
+    def test_move_multiple_to_unwritable_destination_does_nothing(self):
+        self.fake.calls = []
+        result = self.service.move_multiple(self.user, ['open/a.txt'], ['open/sub'], 'closed')
+
+        self.assertEqual((result['moved_files'], result['moved_folders']), (0, 0))
+        self.assertEqual(result['errors'], ["У вас нет прав для записи в целевую папку"])
+        self.assertEqual(self.fake.calls, [])
@@ -0,0 +1,73 @@
+"""Выбор сжатия элементов архива по типу файла и энтропии (zip_stream, S3Service._archive_compression)"""
+import io
+import os
+import zipfile
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from s3app import zip_stream
+from s3app.s3_service import S3Service
+
+from .fake_s3 import FakeS3Client
+
+TEXT = b'quarterly report line\n' * 2000
+RANDOM = os.urandom(40000)
+
+
+class EntropyTests(SimpleTestCase):
+    def test_entropy_bounds(self):
+        self.assertEqual(zip_stream.entropy(b''), 0.0)
+        self.assertEqual(zip_stream.entropy(b'a' * 100), 0.0)
+        self.assertAlmostEqual(zip_stream.entropy(bytes(range(256)) * 4), 8.0)
+        self.assertLess(zip_stream.entropy(TEXT), 5)
+        self.assertGreater(zip_stream.entropy(RANDOM), 7.5)
+
+
+@override_settings(S3_OBJECT_INDEX_ENABLED=False, S3_ARCHIVE_CHUNK_SIZE=4096)
+class ArchiveCompressionTests(TestCase):
+    def setUp(self):
+        self.fake = FakeS3Client({
+            'f/notes.txt': TEXT, 'f/data.json': TEXT, 'f/photo.jpg': RANDOM, 'f/scan.bmp': TEXT,
+            'f/bundle.tar.gz': RANDOM, 'f/movie.mp4': RANDOM, 'f/report.pdf': TEXT,
+            'f/random.dat': RANDOM, 'f/plain.dat': TEXT,
+        })
+        with mock.patch('s3app.s3_service.get_s3_client', return_value=self.fake):
+            self.service = S3Service()
+        self.service.bucket_name = 'bucket'
+        self.user = User.objects.create_superuser('admin', password='x')
+
+    def test_compression_by_file_type(self):
+        expected = {
+            'notes.txt': 'deflated', 'data.json': 'deflated', 'photo.jpg': 'stored', 'scan.bmp': 'auto',
+            'bundle.tar.gz': 'stored', 'movie.mp4': 'stored', 'report.pdf': 'stored', 'random.dat': 'auto',
+            'UPPER.JPG': 'stored', 'archive.ZIP': 'stored',
+        }
+        for name, compression in expected.items():
+            with self.subTest(name=name):
+                self.assertEqual(self.service._archive_compression(name), compression)
+
+    def compress_types(self, preset):
+        archive = self.service.file_archive(self.user, sorted(self.fake.objects))
+        members = self.service.iter_archive_members(self.user, archive)
+        data = b''.join(zip_stream.stream_zip(members, preset=preset))
+        result = zipfile.ZipFile(io.BytesIO(data))
+        for name in result.namelist():
+            self.assertEqual(result.read(name), self.fake.objects[f"f/{name}"])
+        return {info.filename: info.compress_type for info in result.infolist()}
+
+    def test_auto_members_probed_by_entropy(self):
+        types = self.compress_types('balanced')
+
+        self.assertEqual(types['random.dat'], zipfile.ZIP_STORED)
+        self.assertEqual(types['plain.dat'], zipfile.ZIP_DEFLATED)
+        self.assertEqual(types['notes.txt'], zipfile.ZIP_DEFLATED)
+        self.assertEqual(types['photo.jpg'], zipfile.ZIP_STORED)
+
+    def test_max_preset_deflates_unknown_types(self):
+        types = self.compress_types('max')
+
+        self.assertEqual(types['random.dat'], zipfile.ZIP_DEFLATED)
+        # Уже сжатые форматы не сжимаются ни в одном пресете
+        self.assertEqual(types['movie.mp4'], zipfile.ZIP_STORED)
@@ -0,0 +1,99 @@
+"""Параллельное копирование на стороне сервера при переносе папки (bulk_ops.copy_prefix)"""
+import threading
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from s3app import bulk_ops
+from s3app.s3_service import S3Service
+
+from .fake_s3 import FakeS3Client
+
+KEYS = [f"src/{index:04d}.bin" for index in range(300)]
+
+
+class TrackingClient(FakeS3Client):
+    """Считает одновременные копирования и ключи, взятые из листинга, но еще не скопированные"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.active = 0
+        self.max_active = 0
+        self.consumed = 0
+        self.copied = 0
+        self.max_backlog = 0
+        self.release = threading.Event()
+        self.release.set()
+
+    def listed(self, objects):
+        for obj in objects:
+            with self._lock:
+                self.consumed += 1
+                self.max_backlog = max(self.max_backlog, self.consumed - self.copied)
+            yield obj
+
+    def copy_object(self, **kwargs):
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        self.release.wait()
+        try:
+            return super().copy_object(**kwargs)
+        finally:
+            with self._lock:
+                self.active -= 1
+                self.copied += 1
+
+
+class CopyPipelineTests(SimpleTestCase):
+    def setUp(self):
+        self.client = TrackingClient({key: key.encode() for key in KEYS})
+
+    def test_copies_run_concurrently_with_bounded_queue(self):
+        objects = self.client.listed(bulk_ops.iter_prefix_objects(self.client, 'bucket', 'src/'))
+        timer = threading.Timer(0.2, self.client.release.set)
+        self.client.release.clear()
+        timer.start()
+        result = bulk_ops.copy_prefix(self.client, 'bucket', 'src/', 'dst/', objects=objects, max_workers=4)
+        timer.join()
+
+        self.assertEqual(result['errors'], [])
+        self.assertEqual(result['copied_count'], len(KEYS))
+        self.assertEqual(self.client.max_active, 4)
+        # Из листинга читается не больше очереди из 2 * max_workers копирований
+        self.assertLessEqual(self.client.max_backlog, 4 * 2 + 1)
+
+    def test_move_deletes_sources_in_batches(self):
+        progress = []
+        result = bulk_ops.copy_prefix(self.client, 'bucket', 'src/', 'dst/', delete_source=True,
+                                      progress_callback=lambda result: progress.append(result['copied_count']))
+
+        self.assertEqual((result['copied_count'], result['deleted_count']), (len(KEYS), len(KEYS)))
+        self.assertEqual(sorted(self.client.objects), [key.replace('src/', 'dst/') for key in KEYS])
+        self.assertEqual(self.client.calls.count('delete_objects'), 1)
+        self.assertEqual(progress, sorted(progress))
+        self.assertEqual(progress[-1], len(KEYS))
+
+
+@override_settings(S3_OBJECT_INDEX_ENABLED=False, S3_LISTING_CACHE_ENABLED=False)
+class FolderMoveTests(TestCase):
+    def setUp(self):
+        objects = {'src/': b'', 'dest/': b''}
+        objects.update({key: key.encode() for key in KEYS})
+        self.fake = FakeS3Client(objects)
+        with mock.patch('s3app.s3_service.get_s3_client', return_value=self.fake):
+            self.service = S3Service()
+        self.service.bucket_name = 'bucket'
+        self.user = User.objects.create_superuser('admin', password='x')
+
+    def test_folder_move_uses_server_side_copy(self):
+        result = self.service.move_object(self.user, 'src', 'dest', is_folder=True)
+
+        self.assertTrue(result['success'])
+        self.assertEqual(result['moved_objects_count'], len(KEYS))
+        self.assertEqual(sorted(key for key in self.fake.objects if key.startswith('src')), [])
+        self.assertEqual(self.fake.objects['dest/src/0042.bin'], b'src/0042.bin')
+        # Данные не проходят через приложение
+        self.assertNotIn('get_object', self.fake.calls)
+        self.assertEqual(self.fake.calls.count('copy_object'), len(KEYS))
@@ -0,0 +1,131 @@
+"""Контрольная точка копирования префикса (bulk_ops.copy_prefix) при ошибках отдельных ключей"""
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from s3app import bulk_ops, journal
+
+from .fake_s3 import FakeS3Client
+
+KEYS = [f"src/{index:03d}.txt" for index in range(40)]
+
+
+class CopyPrefixCheckpointTests(SimpleTestCase):
+    def setUp(self):
+        self.client = FakeS3Client({key: key.encode() for key in KEYS}, page_size=7)
+        self.checkpoints = []
+
+    def copy(self, **kwargs):
+        kwargs.setdefault('max_workers', 4)
+        return bulk_ops.copy_prefix(self.client, 'bucket', 'src/', 'dst/',
+                                    checkpoint_callback=lambda key, result: self.checkpoints.append(key),
+                                    **kwargs)
+
+    def assertCheckpointsOrdered(self, below=None):
+        self.assertEqual(self.checkpoints, sorted(set(self.checkpoints)))
+        if below is not None:
+            self.assertTrue(all(key < below for key in self.checkpoints), self.checkpoints)
+
+    def test_checkpoint_reaches_last_key(self):
+        result = self.copy()
+        self.assertEqual(result['errors'], [])
+        self.assertEqual(result['copied_count'], len(KEYS))
+        self.assertCheckpointsOrdered()
+        self.assertEqual(self.checkpoints[-1], KEYS[-1])
+
+    def test_failed_copy_stops_checkpoint_before_key(self):
+        failed_key = KEYS[17]
+        self.client.fail_copy.add(failed_key)
+        result = self.copy()
+
+        self.assertEqual([error['key'] for error in result['errors']], [failed_key])
+        self.assertEqual(result['copied_count'], len(KEYS) - 1)
+        self.assertCheckpointsOrdered(below=failed_key)
+        # Остальные ключи копируются до конца операции
+        self.assertIn('dst/039.txt', self.client.objects)
+
+    def test_failed_delete_on_move_stops_checkpoint_and_keeps_source(self):
+        failed_key = KEYS[5]
+        self.client.fail_delete.add(failed_key)
+        result = self.copy(delete_source=True)
+
+        self.assertEqual([(error['key'], error['operation']) for error in result['errors']],
+                         [(failed_key, 'delete')])
+        self.assertEqual(result['completed_count'], len(KEYS) - 1)
+        self.assertCheckpointsOrdered(below=failed_key)
+        self.assertEqual(sorted(key for key in self.client.objects if key.startswith('src/')), [failed_key])
+
+    def test_resume_after_checkpoint_completes_move(self):
+        self.client.fail_copy.add(KEYS[25])
+        self.copy(delete_source=True)
+        self.assertIn(KEYS[25], self.client.objects)
+        checkpoint = self.checkpoints[-1] if self.checkpoints else None
+
+        # Перенесенные объекты удалены из источника - при продолжении остаются только необработанные
+        remaining = sorted(key for key in self.client.objects if key.startswith('src/') and key > (checkpoint or ''))
+        self.client.fail_copy.clear()
+        self.client.calls = []
+        self.checkpoints = []
+        result = self.copy(delete_source=True, start_after=checkpoint, skip_existing=True)
+
+        self.assertEqual(result['errors'], [])
+        self.assertEqual(sorted(self.client.objects), [key.replace('src/', 'dst/') for key in KEYS])
+        self.assertEqual(self.checkpoints[-1], remaining[-1])
+        self.assertEqual(self.client.calls.count('copy_object'), len(remaining))
+
+
+@override_settings(S3_MULTIPART_COPY_THRESHOLD=10)
+class MultipartResumeTests(SimpleTestCase):
+    """Объекты, скопированные по частям, получают другой ETag и не должны копироваться повторно"""
+
+    def setUp(self):
+        self.client = FakeS3Client({key: key.encode() * 2 for key in KEYS[:5]})
+
+    def test_resume_skips_recorded_multipart_copy(self):
+        failed_key = KEYS[0]
+        self.client.fail_delete.add(failed_key)
+        copies = {}
+        bulk_ops.copy_prefix(self.client, 'bucket', 'src/', 'dst/', delete_source=True,
+                             multipart_callback=lambda obj: copies.__setitem__(obj['Key'], obj['ETag']))
+        destination = self.client._meta(failed_key.replace('src/', 'dst/'))
+        self.assertNotEqual(destination['ETag'], self.client._meta(failed_key)['ETag'])
+        self.assertEqual(sorted(copies), KEYS[:5])
+
+        self.client.fail_delete.clear()
+        self.client.calls = []
+        result = bulk_ops.copy_prefix(self.client, 'bucket', 'src/', 'dst/', delete_source=True,
+                                      skip_existing=True, known_copies=copies)
+
+        self.assertEqual(result['errors'], [])
+        self.assertEqual(result['skipped_count'], 1)
+        self.assertNotIn('upload_part_copy', self.client.calls)
+        self.assertNotIn(failed_key, self.client.objects)
+
+    def test_changed_source_is_copied_again(self):
+        self.client.fail_delete.add(KEYS[0])
+        copies = {}
+        bulk_ops.copy_prefix(self.client, 'bucket', 'src/', 'dst/', delete_source=True,
+                             multipart_callback=lambda obj: copies.__setitem__(obj['Key'], obj['ETag']))
+        # Тот же размер, другое содержимое
+        self.client.objects[KEYS[0]] = KEYS[0].upper().encode() * 2
+        self.client.fail_delete.clear()
+        self.client.calls = []
+        result = bulk_ops.copy_prefix(self.client, 'bucket', 'src/', 'dst/', delete_source=True,
+                                      skip_existing=True, known_copies=copies)
+
+        self.assertEqual(result['skipped_count'], 0)
+        self.assertIn('upload_part_copy', self.client.calls)
+        self.assertEqual(self.client.objects[KEYS[0].replace('src/', 'dst/')], KEYS[0].upper().encode() * 2)
+
+
+class CheckpointerMultipartTests(TestCase):
+    def test_multipart_copy_saved_at_once_and_pruned_by_checkpoint(self):
+        entry, _ = journal.start('move_folder', None, 'src/', 'dst/')
+        checkpointer = journal.Checkpointer(entry)
+        checkpointer.record_multipart_copy({'Key': KEYS[3], 'ETag': '"a"'})
+        checkpointer.record_multipart_copy({'Key': KEYS[7], 'ETag': '"b"'})
+        entry.refresh_from_db()
+        self.assertEqual(entry.multipart_copies, {KEYS[3]: '"a"', KEYS[7]: '"b"'})
+
+        checkpointer._last_saved = 0
+        checkpointer(KEYS[5], {'completed_count': 6, 'completed_bytes': 60})
+        entry.refresh_from_db()
+        self.assertEqual(entry.multipart_copies, {KEYS[7]: '"b"'})
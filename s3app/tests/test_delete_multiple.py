@@ -0,0 +1,72 @@
+"""Перенос нескольких файлов и папок в корзину одной операцией (S3Service.delete_multiple)"""
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+
+from s3app.models import TrashItem, UserPermission
+from s3app.s3_service import S3Service
+
+from .fake_s3 import FakeS3Client
+
+OBJECTS = {
+    'docs/': b'', 'docs/a.txt': b'aa', 'docs/b.txt': b'b', 'docs/sub/': b'', 'docs/sub/c.txt': b'ccc',
+    'pics/': b'', 'pics/p.jpg': b'pp', 'keep/': b'', 'keep/k.txt': b'k',
+}
+
+
+@override_settings(S3_OBJECT_INDEX_ENABLED=False, S3_LISTING_CACHE_ENABLED=False, S3_TRASH_BACKEND='copy')
+class DeleteMultipleTests(TestCase):
+    def setUp(self):
+        self.fake = FakeS3Client(OBJECTS)
+        with mock.patch('s3app.s3_service.get_s3_client', return_value=self.fake):
+            self.service = S3Service()
+        self.service.bucket_name = 'bucket'
+        self.admin = User.objects.create_superuser('admin', password='x')
+
+    def test_items_share_one_trash_folder(self):
+        self.fake.calls = []
+        # docs/sub/c.txt внутри выбранной папки docs/sub и переносится вместе с ней
+        result = self.service.delete_multiple(self.admin, ['docs/a.txt', 'docs/sub/c.txt', 'pics/p.jpg'], ['docs/sub'])
+
+        self.assertEqual((result['deleted_files'], result['deleted_folders'], result['errors']), (2, 1, []))
+        items = {item.original_path: item for item in TrashItem.objects.all()}
+        self.assertEqual(sorted(items), ['docs/a.txt', 'docs/sub', 'pics/p.jpg'])
+        trash_root = items['docs/a.txt'].trash_path[:-len('docs/a.txt')]
+        self.assertEqual(items['docs/sub'].trash_path, f"{trash_root}docs/sub/")
+        self.assertEqual((items['docs/sub'].object_count, items['docs/sub'].original_size), (2, 3))
+        self.assertEqual(sorted(key for key in self.fake.objects if key.startswith('__trash/')),
+                         sorted(trash_root + key for key in ('docs/a.txt', 'docs/sub/', 'docs/sub/c.txt', 'pics/p.jpg')))
+        # Оригиналы всех элементов удалены одной пачкой DeleteObjects
+        self.assertEqual(self.fake.calls.count('delete_objects'), 1)
+        self.assertNotIn('docs/a.txt', self.fake.objects)
+
+    def test_items_restore_individually(self):
+        self.service.delete_multiple(self.admin, ['docs/a.txt'], ['docs/sub'])
+        for item in TrashItem.objects.order_by('original_path'):
+            with self.subTest(path=item.original_path):
+                self.assertTrue(self.service.restore_from_trash(self.admin, item.id)['success'])
+
+        self.assertEqual(sorted(self.fake.objects), sorted(OBJECTS))
+        self.assertFalse(TrashItem.objects.exists())
+
+    def test_denied_items_are_skipped(self):
+        user = User.objects.create_user('bob', password='x')
+        UserPermission.objects.create(user=user, folder_path='docs', can_read=True, can_delete=True)
+
+        result = self.service.delete_multiple(user, ['docs/b.txt', 'keep/k.txt'], ['pics'])
+
+        self.assertEqual(result['deleted_files'], 1)
+        self.assertEqual(result['errors'], ["Нет прав для удаления keep/k.txt", "Нет прав для удаления pics"])
+        self.assertIn('keep/k.txt', self.fake.objects)
+        self.assertIn('pics/p.jpg', self.fake.objects)
+        self.assertNotIn('docs/b.txt', self.fake.objects)
+
+    def test_failed_copy_keeps_file(self):
+        self.fake.fail_copy.add('docs/b.txt')
+        result = self.service.delete_multiple(self.admin, ['docs/a.txt', 'docs/b.txt'], [])
+
+        self.assertEqual(result['deleted_files'], 1)
+        self.assertEqual(len(result['errors']), 1)
+        self.assertIn('docs/b.txt', self.fake.objects)
+        self.assertEqual(list(TrashItem.objects.values_list('original_path', flat=True)), ['docs/a.txt'])
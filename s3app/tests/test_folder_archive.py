@@ -0,0 +1,69 @@
+"""Скачивание папки со всеми вложенными папками потоковым архивом (download_folder)"""
+import io
+import zipfile
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from s3app.models import S3ActionLog, UserPermission
+
+from .fake_s3 import FakeS3Client
+
+OBJECTS = {
+    'proj/': b'', 'proj/readme.txt': b'readme', 'proj/src/': b'', 'proj/src/main.py': b'print(1)',
+    'proj/src/lib/util.py': b'pass', 'proj/secret/key.pem': b'key', 'proj/__trash/old.txt': b'old',
+    'project-other/x.txt': b'x',
+}
+
+
+@override_settings(S3_OBJECT_INDEX_ENABLED=False, S3_ARCHIVE_CACHE_ENABLED=False, S3_ARCHIVE_CHUNK_SIZE=4096)
+class FolderArchiveTests(TestCase):
+    def setUp(self):
+        self.fake = FakeS3Client(OBJECTS, page_size=2)
+        mock.patch('s3app.s3_service.get_s3_client', return_value=self.fake).start()
+        mock.patch('s3app.s3_service.AWS_STORAGE_BUCKET_NAME', 'bucket').start()
+        self.addCleanup(mock.patch.stopall)
+        self.client.cookies[settings.BROWSER_CHALLENGE_COOKIE_NAME] = settings.BROWSER_CHALLENGE_COOKIE_VALUE
+
+    def download(self, user, path='proj'):
+        self.client.force_login(user)
+        return self.client.get(reverse('s3app:download_folder', args=[path]))
+
+    def read(self, response):
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        self.assertIn('proj.zip', response['Content-Disposition'])
+        return zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+
+    def test_whole_tree_streamed(self):
+        archive = self.read(self.download(User.objects.create_superuser('admin', password='x')))
+
+        self.assertEqual(sorted(archive.namelist()), [
+            'proj/__trash/old.txt', 'proj/readme.txt', 'proj/secret/key.pem',
+            'proj/src/lib/util.py', 'proj/src/main.py',
+        ])
+        self.assertEqual(archive.read('proj/src/lib/util.py'), b'pass')
+        self.assertEqual(S3ActionLog.objects.filter(action='download', path='proj/').count(), 1)
+
+    def test_only_readable_subtrees_for_user(self):
+        user = User.objects.create_user('bob', password='x')
+        UserPermission.objects.create(user=user, folder_path='proj/src', can_read=True)
+        archive = self.read(self.download(user))
+
+        self.assertEqual(sorted(archive.namelist()), ['proj/src/lib/util.py', 'proj/src/main.py'])
+
+    def test_service_folders_hidden_from_users(self):
+        user = User.objects.create_user('bob', password='x')
+        UserPermission.objects.create(user=user, folder_path='proj', can_read=True)
+        archive = self.read(self.download(user))
+
+        self.assertNotIn('proj/__trash/old.txt', archive.namelist())
+        self.assertIn('proj/secret/key.pem', archive.namelist())
+
+    def test_no_access_redirects(self):
+        response = self.download(User.objects.create_user('eve', password='x'))
+
+        self.assertEqual(response.status_code, 302)
+        self.assertNotIn('get_object', self.fake.calls)
@@ -0,0 +1,42 @@
+"""Параллельный обход папок в ширину (folder_discovery.discover_folders)"""
+from botocore.exceptions import ClientError
+from django.test import SimpleTestCase
+
+from s3app.folder_discovery import discover_folders
+
+from .fake_s3 import FakeS3Client, client_error
+
+OBJECTS = {
+    'a/': b'', 'a/file.txt': b'1', 'a/b/c/deep.txt': b'2', 'a/d/': b'', 'e/f.txt': b'3',
+    'root.txt': b'4', 'g//h.txt': b'5',
+}
+
+
+class FolderDiscoveryTests(SimpleTestCase):
+    def setUp(self):
+        self.client = FakeS3Client(OBJECTS, page_size=1)
+
+    def test_finds_all_folders_including_implicit(self):
+        folders = list(discover_folders(self.client, 'bucket', max_workers=3))
+        self.assertEqual(sorted(folders), ['a', 'a/b', 'a/b/c', 'a/d', 'e', 'g'])
+
+    def test_breadth_first_order(self):
+        folders = list(discover_folders(self.client, 'bucket', max_workers=1))
+        depths = [folder.count('/') for folder in folders]
+        self.assertEqual(depths, sorted(depths))
+
+    def test_root_and_max_depth(self):
+        self.assertEqual(sorted(discover_folders(self.client, 'bucket', root='/a/', max_depth=1)), ['a/b', 'a/d'])
+        self.assertEqual(list(discover_folders(self.client, 'bucket', max_depth=0)), [])
+
+    def test_listing_error_stops_discovery(self):
+        original = self.client.list_objects_v2
+
+        def list_objects_v2(**params):
+            if params.get('Prefix') == 'a/b/':
+                raise client_error('AccessDenied', 'ListObjectsV2')
+            return original(**params)
+
+        self.client.list_objects_v2 = list_objects_v2
+        with self.assertRaises(ClientError):
+            list(discover_folders(self.client, 'bucket', max_workers=2))
@@ -0,0 +1,67 @@
+"""Дерево папок для автозаполнения (s3app.folder_tree)"""
+import threading
+
+from django.core.cache import cache
+from django.test import SimpleTestCase
+
+from s3app import folder_tree
+
+
+class FolderTreeSearchTests(SimpleTestCase):
+    FOLDERS = ['Reports', 'Reports/2024', 'archive', 'archive/old reports', 'docs', 'docs/Отчеты',
+               'docs/Отчеты/Квартал', 'misc/preport', 'x/reports-y']
+
+    def setUp(self):
+        self.tree = folder_tree.FolderTree(self.FOLDERS)
+
+    def test_matches_substring_search(self):
+        for term in ('rep', 'REPORTS', 'port', 'отч', 'ОТЧЕТЫ/кв', 's/2', 'docs/', 'nothing'):
+            with self.subTest(term=term):
+                expected = {folder for folder in self.FOLDERS if term.lower() in folder.lower()}
+                self.assertEqual(set(self.tree.search(term, limit=100)), expected)
+
+    def test_prefix_matches_come_first(self):
+        result = self.tree.search('rep', limit=3)
+        self.assertEqual(len(result), 3)
+        self.assertNotIn('misc/preport', result)
+        self.assertEqual(self.tree.search('rep', limit=100)[-1], 'misc/preport')
+
+    def test_search_sees_updates(self):
+        self.tree.search('new')
+        self.tree.add('a/b/New Folder')
+        self.assertEqual(self.tree.search('new'), ['a/b/New Folder'])
+        self.tree.move('a', 'z')
+        self.assertEqual(self.tree.search('new'), ['z/b/New Folder'])
+        self.tree.remove('z')
+        self.assertEqual(self.tree.search('new'), [])
+
+
+class FolderTreeBuildTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        folder_tree.invalidate()
+        self.addCleanup(folder_tree.invalidate)
+
+    def test_updates_do_not_wait_for_build(self):
+        listing_started = threading.Event()
+        release_listing = threading.Event()
+
+        def slow_loader():
+            listing_started.set()
+            release_listing.wait(5)
+            return ['old']
+
+        builder = threading.Thread(target=folder_tree.get_tree, args=(slow_loader,))
+        builder.start()
+        self.assertTrue(listing_started.wait(5))
+
+        updater = threading.Thread(target=folder_tree.add_folder, args=('new/child',))
+        updater.start()
+        updater.join(2)
+        # Изменение не ждет окончания листинга
+        self.assertFalse(updater.is_alive())
+
+        release_listing.set()
+        builder.join(5)
+        tree = folder_tree.get_tree(lambda: self.fail('дерево должно быть построено'))
+        self.assertEqual(tree.folders, ['', 'new', 'new/child', 'old'])
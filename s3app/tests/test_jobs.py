@@ -0,0 +1,109 @@
+"""Очередь фоновых задач: захват задач воркерами и возврат задач прерванных воркеров"""
+import datetime
+import os
+import socket
+import subprocess
+import sys
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from s3app import jobs
+from s3app.models import BackgroundJob
+
+
+@override_settings(S3_JOB_STALE_TIMEOUT=600)
+class JobQueueTests(TestCase):
+    def create_job(self, **fields):
+        return BackgroundJob.objects.create(job_type='delete_folder', params={'path': 'a'}, **fields)
+
+    def running_job(self, worker, heartbeat_age=0):
+        heartbeat_at = timezone.now() - datetime.timedelta(seconds=heartbeat_age)
+        return self.create_job(status='running', worker=worker, started_at=heartbeat_at, heartbeat_at=heartbeat_at)
+
+    def dead_pid(self):
+        process = subprocess.Popen([sys.executable, '-c', 'pass'])
+        process.wait()
+        return process.pid
+
+    def test_claim_takes_oldest_pending_job(self):
+        first = self.create_job()
+        second = self.create_job()
+        self.create_job(status='running', worker='other:1:x:1')
+
+        claimed = jobs.claim_next_job()
+        self.assertEqual(claimed.id, first.id)
+        self.assertEqual(claimed.status, 'running')
+        self.assertEqual(claimed.worker, jobs.worker_id())
+        self.assertIsNotNone(claimed.heartbeat_at)
+
+        self.assertEqual(jobs.claim_next_job().id, second.id)
+        self.assertIsNone(jobs.claim_next_job())
+
+    def test_claim_skips_job_taken_by_another_worker(self):
+        job = self.create_job()
+        now = timezone.now()
+
+        def taken_meanwhile():
+            # Другой воркер захватывает задачу между выборкой и условным обновлением
+            BackgroundJob.objects.filter(id=job.id).update(status='running', worker='other-host:1:x:1')
+            return now
+
+        with mock.patch('s3app.jobs.timezone.now', side_effect=taken_meanwhile):
+            self.assertIsNone(jobs.claim_next_job())
+        self.assertEqual(BackgroundJob.objects.get(id=job.id).worker, 'other-host:1:x:1')
+
+    def test_requeue_stale_heartbeat(self):
+        stale = self.running_job('other-host:1:x:1', heartbeat_age=3600)
+        fresh = self.running_job('other-host:1:x:1', heartbeat_age=10)
+
+        self.assertEqual(jobs.requeue_stale_jobs(), 1)
+        stale.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual((stale.status, stale.worker), ('pending', ''))
+        self.assertEqual(fresh.status, 'running')
+
+    def test_requeue_jobs_of_dead_local_worker(self):
+        host = socket.gethostname()
+        dead = self.running_job(f"{host}:{self.dead_pid()}:x:1")
+        restarted = self.running_job(f"{host}:{os.getpid()}:previous:1")
+        own = self.running_job(jobs.worker_id())
+
+        self.assertEqual(jobs.requeue_stale_jobs(), 2)
+        self.assertEqual(BackgroundJob.objects.get(id=dead.id).status, 'pending')
+        self.assertEqual(BackgroundJob.objects.get(id=restarted.id).status, 'pending')
+        self.assertEqual(BackgroundJob.objects.get(id=own.id).status, 'running')
+
+    def test_requeue_keeps_job_claimed_meanwhile(self):
+        job = self.running_job(f"{socket.gethostname()}:{self.dead_pid()}:x:1")
+
+        def claimed_meanwhile(worker):
+            # Задачу успели вернуть в очередь и захватить другим воркером
+            BackgroundJob.objects.filter(id=job.id).update(worker=jobs.worker_id(), heartbeat_at=timezone.now())
+            return True
+
+        with mock.patch('s3app.jobs._worker_process_dead', side_effect=claimed_meanwhile):
+            self.assertEqual(jobs.requeue_stale_jobs(), 0)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker), ('running', jobs.worker_id()))
+
+
+@override_settings(S3_JOB_PROGRESS_INTERVAL=0)
+class ProgressReporterTests(TestCase):
+    def test_progress_written_only_by_owning_worker(self):
+        job = BackgroundJob.objects.create(job_type='delete_folder', params={'path': 'a'}, status='running',
+                                           worker=jobs.worker_id(), started_at=timezone.now())
+        reporter = jobs.ProgressReporter(job)
+        reporter.update({'processed': 1})
+        job.refresh_from_db()
+        self.assertEqual(job.progress['processed'], 1)
+
+        # Задачу вернули в очередь и захватил другой воркер
+        BackgroundJob.objects.filter(id=job.id).update(worker='other:1:x:1', progress={})
+        reporter.update({'processed': 2})
+        reporter.update({'processed': 3})
+
+        job.refresh_from_db()
+        self.assertEqual(job.progress, {})
+        self.assertTrue(reporter.lost)
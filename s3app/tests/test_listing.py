@@ -0,0 +1,80 @@
+"""Постраничный листинг директории по курсору (S3Service.list_objects_page)"""
+import itertools
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.exceptions import PermissionDenied
+from django.test import TestCase, override_settings
+
+from s3app.models import S3ActionLog
+from s3app.s3_service import S3Service
+
+from .fake_s3 import FakeS3Client
+
+
+@override_settings(S3_OBJECT_INDEX_ENABLED=False, S3_LISTING_CACHE_ENABLED=False)
+class ListingCursorTests(TestCase):
+    def setUp(self):
+        self.fake = FakeS3Client()
+        with mock.patch('s3app.s3_service.get_s3_client', return_value=self.fake):
+            self.service = S3Service()
+        self.service.bucket_name = 'bucket'
+        self.user = User.objects.create_superuser('admin', password='x')
+
+    def fill(self, file_count, folders=()):
+        for index in range(file_count):
+            self.fake.objects[f"big/file{index:05d}.txt"] = b'x'
+        for folder in folders:
+            for index in range(30):
+                self.fake.objects[f"big/{folder}/nested{index:02d}.txt"] = b'y'
+        self.fake.objects['big/'] = b''
+
+    def pages(self, page_size=50):
+        cursor = None
+        while True:
+            page = self.service.list_objects_page(self.user, 'big', cursor=cursor, page_size=page_size)
+            yield page
+            cursor = page['next_cursor']
+            if cursor is None:
+                return
+
+    def test_first_page_is_one_bounded_request(self):
+        for folders in ([], ['m'], ['a', 'zz']):
+            with self.subTest(folders=folders):
+                self.fake.objects.clear()
+                self.fill(5000, folders)
+                self.fake.calls = []
+                pages = list(itertools.islice(self.pages(), 3))
+                self.assertEqual(self.fake.calls.count('list_objects_v2'), 3)
+                self.assertTrue(all(len(page['directories']) + len(page['files']) == 50 for page in pages))
+
+    def test_pages_cover_folder_once(self):
+        self.fill(237, ['a', 'file00100.txt.d', 'zz'])
+        seen = []
+        for page in self.pages(page_size=20):
+            names = [d['name'] + '/' for d in page['directories']] + [f['name'] for f in page['files']]
+            # Внутри страницы папки идут первыми
+            self.assertEqual(names[:len(page['directories'])], [d['name'] + '/' for d in page['directories']])
+            seen.extend(names)
+
+        expected = [f"file{index:05d}.txt" for index in range(237)] + ['a/', 'file00100.txt.d/', 'zz/']
+        self.assertEqual(sorted(seen), sorted(expected))
+        self.assertEqual(len(seen), len(expected))
+        self.assertEqual(self.fake.calls.count('list_objects_v2'), -(-len(expected) // 20))
+
+    def test_full_listing_puts_folders_first(self):
+        self.fill(3, ['b'])
+        listing = self.service.list_objects(self.user, 'big')
+        self.assertEqual([d['name'] for d in listing['directories']], ['b'])
+        self.assertEqual(len(listing['files']), 3)
+
+    def test_denied_listing_is_audited(self):
+        bob = User.objects.create_user('bob', password='x')
+        for list_folder in (self.service.list_objects, self.service.list_objects_page):
+            with self.subTest(method=list_folder.__name__):
+                S3ActionLog.objects.all().delete()
+                with self.assertRaises(PermissionDenied):
+                    list_folder(bob, 'big')
+                log = S3ActionLog.objects.get()
+                self.assertEqual((log.user, log.action, log.path, log.success), (bob, 'read', 'big/', False))
+        self.assertNotIn('list_objects_v2', self.fake.calls)
@@ -0,0 +1,64 @@
+"""Кэш листингов директорий (listing_cache): сброс по поколениям папки и поддерева"""
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from s3app import listing_cache
+from s3app.s3_service import S3Service
+
+from .fake_s3 import FakeS3Client
+
+
+@override_settings(S3_OBJECT_INDEX_ENABLED=False, S3_LISTING_CACHE_ENABLED=True)
+@mock.patch('s3app.listing_cache.shared_cache.is_shared', return_value=True)
+class ListingCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.fake = FakeS3Client({
+            'a/': b'', 'a/one.txt': b'1', 'a/b/': b'', 'a/b/two.txt': b'2', 'a/b/c/three.txt': b'3',
+        })
+        with mock.patch('s3app.s3_service.get_s3_client', return_value=self.fake):
+            self.service = S3Service()
+        self.service.bucket_name = 'bucket'
+        self.user = User.objects.create_superuser('admin', password='x')
+
+    def names(self, prefix):
+        listing = self.service.list_objects(self.user, prefix)
+        return ([directory['name'] for directory in listing['directories']],
+                [file['name'] for file in listing['files']])
+
+    def list_calls(self):
+        return self.fake.calls.count('list_objects_v2')
+
+    def test_repeated_listing_served_from_cache(self, _is_shared):
+        self.names('a')
+        calls = self.list_calls()
+        self.assertEqual(self.names('a'), (['b'], ['one.txt']))
+        self.assertEqual(self.list_calls(), calls)
+
+    def test_write_invalidates_folder_listing(self, _is_shared):
+        self.names('a')
+        self.service.create_folder(self.user, 'a/new')
+        self.assertEqual(self.names('a'), (['b', 'new'], ['one.txt']))
+
+    def test_own_invalidation_keeps_nested_listings(self, _is_shared):
+        self.names('a/b/c')
+        calls = self.list_calls()
+        listing_cache.invalidate_path('a/b')
+        self.names('a/b/c')
+        self.assertEqual(self.list_calls(), calls)
+
+    def test_recursive_invalidation_drops_nested_listings(self, _is_shared):
+        self.names('a/b/c')
+        self.fake.objects['a/b/c/four.txt'] = b'4'
+        listing_cache.invalidate_path('a', recursive=True)
+        self.assertEqual(self.names('a/b/c'), ([], ['four.txt', 'three.txt']))
+
+    def test_disabled_without_shared_backend(self, is_shared):
+        is_shared.return_value = False
+        self.names('a')
+        calls = self.list_calls()
+        self.names('a')
+        self.assertEqual(self.list_calls(), calls + 1)
@@ -0,0 +1,52 @@
+"""Копирование больших объектов по частям (bulk_ops.copy_object, UploadPartCopy)"""
+from unittest import mock
+
+from botocore.exceptions import ClientError
+
+from django.test import SimpleTestCase, override_settings
+
+from s3app import bulk_ops
+
+from .fake_s3 import FakeS3Client
+
+MB = 1024 ** 2
+BODY = bytes(range(256)) * (12 * MB // 256)
+
+
+@override_settings(S3_MULTIPART_COPY_THRESHOLD=8 * MB, S3_MULTIPART_COPY_PART_SIZE=MB)
+class MultipartCopyTests(SimpleTestCase):
+    def setUp(self):
+        self.client = FakeS3Client({'big.bin': BODY, 'small.bin': b'x' * MB})
+        self.client.calls = []
+
+    def test_large_object_copied_in_parts(self):
+        size = bulk_ops.copy_object(self.client, 'bucket', 'big.bin', 'copy.bin')
+
+        self.assertEqual(size, len(BODY))
+        self.assertEqual(self.client.objects['copy.bin'], BODY)
+        # Часть не меньше минимальных 5 МБ: 12 МБ -> 3 части
+        self.assertEqual(self.client.calls.count('upload_part_copy'), 3)
+        self.assertTrue(self.client._meta('copy.bin')['ETag'].endswith('-3"'))
+        self.assertNotIn('copy_object', self.client.calls)
+
+    def test_small_object_copied_at_once(self):
+        bulk_ops.copy_object(self.client, 'bucket', 'small.bin', 'copy.bin', size=MB)
+        self.assertEqual(self.client.calls, ['copy_object'])
+
+    def test_content_type_carried_over(self):
+        head = dict(self.client.head_object(Bucket='bucket', Key='big.bin'), ContentType='video/mp4',
+                    Metadata={'owner': 'bob'})
+        with mock.patch.object(self.client, 'create_multipart_upload',
+                               wraps=self.client.create_multipart_upload) as create:
+            bulk_ops.copy_object(self.client, 'bucket', 'big.bin', 'copy.bin', head=head)
+        self.assertEqual(create.call_args.kwargs['ContentType'], 'video/mp4')
+        self.assertEqual(create.call_args.kwargs['Metadata'], {'owner': 'bob'})
+
+    def test_failed_part_aborts_upload(self):
+        self.client.fail_copy.add('big.bin')
+        with self.assertRaises(ClientError):
+            bulk_ops.copy_object(self.client, 'bucket', 'big.bin', 'copy.bin')
+
+        self.assertIn('abort_multipart_upload', self.client.calls)
+        self.assertEqual(self.client.uploads, {})
+        self.assertNotIn('copy.bin', self.client.objects)
@@ -0,0 +1,71 @@
+"""Локальный индекс метаданных объектов (object_index): построение и обновление операциями"""
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+
+from s3app import object_index
+from s3app.models import S3ObjectIndex
+from s3app.s3_service import S3Service
+
+from .fake_s3 import FakeS3Client
+
+OBJECTS = {
+    'docs/': b'', 'docs/a.txt': b'aaa', 'docs/B.txt': b'b', 'docs/sub/c.pdf': b'cc',
+    'implicit/deep/d.txt': b'd', 'root.txt': b'r',
+}
+
+
+@override_settings(S3_OBJECT_INDEX_ENABLED=True, S3_LISTING_CACHE_ENABLED=False)
+class ObjectIndexTests(TestCase):
+    def setUp(self):
+        self.fake = FakeS3Client(OBJECTS, page_size=2)
+        with mock.patch('s3app.s3_service.get_s3_client', return_value=self.fake):
+            self.service = S3Service()
+        self.service.bucket_name = 'bucket'
+        self.user = User.objects.create_superuser('admin', password='x')
+        object_index.rebuild_index(self.fake, 'bucket')
+
+    def names(self, path):
+        return [(row['name'], row['is_folder']) for row in object_index.list_folder(path)]
+
+    def test_rebuild_adds_implicit_folders(self):
+        self.assertEqual(self.names(''), [('docs', True), ('implicit', True), ('root.txt', False)])
+        self.assertEqual(self.names('implicit'), [('deep', True)])
+        self.assertEqual(S3ObjectIndex.objects.get(key='docs/a.txt').size, 3)
+
+    def test_listing_matches_s3(self):
+        for path in ('', 'docs', 'implicit/deep'):
+            with self.subTest(path=path):
+                indexed = self.service.list_objects(self.user, path)
+                with override_settings(S3_OBJECT_INDEX_ENABLED=False):
+                    listed = self.service.list_objects(self.user, path)
+                for kind in ('directories', 'files'):
+                    self.assertEqual([item['name'] for item in indexed[kind]],
+                                     [item['name'] for item in listed[kind]])
+
+    def test_move_prefix_keeps_metadata(self):
+        object_index.move_prefix('docs', 'archive/docs')
+        self.assertFalse(S3ObjectIndex.objects.filter(key__startswith='docs/').exists())
+        moved = S3ObjectIndex.objects.get(key='archive/docs/sub/c.pdf')
+        self.assertEqual((moved.size, moved.content_type), (2, 'application/pdf'))
+        self.assertEqual(self.names('archive'), [('docs', True)])
+
+    def test_remove_prefix_is_case_sensitive(self):
+        object_index.upsert_object('Docs/x.txt', size=1)
+        object_index.remove_prefix('docs')
+        self.assertEqual(list(S3ObjectIndex.objects.filter(key__startswith='Docs/').values_list('key', flat=True)),
+                         ['Docs/', 'Docs/x.txt'])
+
+    def test_service_writes_update_index(self):
+        self.service.create_folder(self.user, 'docs/new')
+        self.assertIn(('new', True), self.names('docs'))
+
+        self.service.move_object(self.user, 'docs/a.txt', 'implicit')
+        self.assertNotIn(('a.txt', False), self.names('docs'))
+        self.assertIn(('a.txt', False), self.names('implicit'))
+
+    @override_settings(S3_OBJECT_INDEX_ENABLED=False)
+    def test_disabled_index_is_not_updated(self):
+        object_index.upsert_object('other.txt', size=1)
+        self.assertFalse(S3ObjectIndex.objects.filter(key='other.txt').exists())
@@ -0,0 +1,90 @@
+"""Проверка прав по префиксному дереву (s3app.permissions) против прежнего обхода родительских папок"""
+import itertools
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+
+from s3app import permissions
+from s3app.models import UserPermission
+
+
+def baseline_check_permission(user, path, required_permission):
+    """Прежняя проверка S3Service.check_permission: запрос прав для пути и каждой родительской папки"""
+    if user.is_superuser:
+        return True
+    user_permissions = UserPermission.objects.filter(user=user)
+    check_path = path
+    while True:
+        perm_for_path = user_permissions.filter(folder_path=check_path).first()
+        if perm_for_path and getattr(perm_for_path, permissions.PERMISSION_FIELDS[required_permission]):
+            return True
+        if check_path == '':
+            return False
+        check_path = '/'.join(check_path.split('/')[:-1])
+
+
+class PermissionTrieTests(TestCase):
+    PATHS = ['', 'a', 'a/b', 'a/b/c', 'a/bc', 'a/b/c/d', 'ab', 'x', 'x/y', 'x/y/z', 'docs/отчеты/2024']
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('bob', password='x')
+        rows = [
+            ('a', True, False, False, False),
+            ('a/b/c', True, True, True, False),
+            ('x/y', False, False, False, True),
+            ('docs/отчеты', True, True, False, False),
+        ]
+        for folder_path, can_read, can_write, can_delete, can_move in rows:
+            UserPermission.objects.create(user=self.user, folder_path=folder_path, can_read=can_read,
+                                          can_write=can_write, can_delete=can_delete, can_move=can_move)
+
+    def fresh_user(self):
+        # Дерево прав хранится на объекте пользователя - берем новый объект
+        return User.objects.get(pk=self.user.pk)
+
+    def test_has_permission_matches_baseline(self):
+        user = self.fresh_user()
+        for path, permission in itertools.product(self.PATHS, permissions.PERMISSION_FIELDS):
+            with self.subTest(path=path, permission=permission):
+                self.assertEqual(permissions.has_permission(user, path, permission),
+                                 baseline_check_permission(user, path, permission))
+
+    def test_check_permissions_matches_baseline(self):
+        user = self.fresh_user()
+        for permission in permissions.PERMISSION_FIELDS:
+            expected = {path: baseline_check_permission(user, path, permission) for path in self.PATHS}
+            with self.subTest(permission=permission):
+                self.assertEqual(permissions.check_permissions(user, self.PATHS, permission), expected)
+
+    def test_root_permission_covers_everything(self):
+        UserPermission.objects.create(user=self.user, folder_path='', can_read=True)
+        user = self.fresh_user()
+        for path in self.PATHS:
+            with self.subTest(path=path):
+                self.assertTrue(permissions.has_permission(user, path, 'read'))
+                self.assertEqual(permissions.has_permission(user, path, 'write'),
+                                 baseline_check_permission(user, path, 'write'))
+
+    def test_superuser_has_every_permission(self):
+        admin = User.objects.create_superuser('admin', password='x')
+        self.assertTrue(permissions.has_permission(admin, 'q/w', 'delete'))
+        self.assertEqual(permissions.check_permissions(admin, ['q', ''], 'move'), {'q': True, '': True})
+
+    def test_permission_change_invalidates_cache(self):
+        self.assertFalse(permissions.has_permission(self.fresh_user(), 'q', 'read'))
+        UserPermission.objects.create(user=self.user, folder_path='q', can_read=True)
+        self.assertTrue(permissions.has_permission(self.fresh_user(), 'q', 'read'))
+
+    def test_process_local_cache_is_not_used(self):
+        # Запись, оставшаяся в кэше процесса, который не видел отзыва прав
+        cache.set(permissions._cache_key(self.user.pk), [('q', True, True, True, True)])
+        self.assertFalse(permissions.has_permission(self.fresh_user(), 'q', 'read'))
+
+    def test_shared_cache_is_used(self):
+        with mock.patch('s3app.permissions.shared_cache.is_shared', return_value=True):
+            cache.set(permissions._cache_key(self.user.pk), [('q', True, False, False, False)])
+            with self.assertNumQueries(0):
+                self.assertTrue(permissions.has_permission(User(pk=self.user.pk), 'q', 'read'))
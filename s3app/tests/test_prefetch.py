@@ -0,0 +1,77 @@
+"""Упреждающая загрузка элементов архива (prefetch.iter_prefetched)"""
+import threading
+import time
+
+from django.test import SimpleTestCase
+
+from s3app.prefetch import iter_prefetched
+
+
+class PrefetchTests(SimpleTestCase):
+    def setUp(self):
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+        self.started = []
+
+    def fetch(self, item):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            self.started.append(item)
+        # Ранние элементы загружаются дольше поздних - завершаются не по порядку
+        time.sleep(0.002 * (10 - item % 10))
+        with self.lock:
+            self.active -= 1
+        if item == 7:
+            raise ValueError('ошибка загрузки')
+        return item * 10
+
+    def test_results_in_source_order(self):
+        results = list(iter_prefetched(range(20), self.fetch, max_workers=4))
+
+        self.assertEqual([item for item, _, _ in results], list(range(20)))
+        self.assertEqual([result for item, result, _ in results if item != 7], [item * 10 for item in range(20) if item != 7])
+        # Ошибка элемента отдается на его месте и не прерывает загрузку остальных
+        item, result, error = results[7]
+        self.assertIsNone(result)
+        self.assertIsInstance(error, ValueError)
+
+    def test_concurrency_bounded(self):
+        list(iter_prefetched(range(20), self.fetch, max_workers=3))
+        self.assertEqual(self.max_active, 3)
+
+    def test_items_read_only_ahead_of_consumer(self):
+        consumed = []
+
+        def items():
+            for item in range(100):
+                consumed.append(item)
+                yield item
+
+        prefetched = iter_prefetched(items(), self.fetch, max_workers=4)
+        next(prefetched)
+        # Загружены первый элемент и не больше max_workers следующих
+        self.assertLessEqual(len(consumed), 5)
+        prefetched.close()
+
+    def test_unconsumed_results_discarded_on_close(self):
+        discarded = []
+        done = threading.Event()
+
+        def discard(result):
+            discarded.append(result)
+            if len(discarded) == 2:
+                done.set()
+
+        prefetched = iter_prefetched(range(10), self.fetch, max_workers=2, discard=discard)
+        self.assertEqual(next(prefetched)[1], 0)
+        # Потребитель получил первый элемент; дожидаемся, пока начнется загрузка двух следующих
+        deadline = time.monotonic() + 5
+        while len(self.started) < 3 and time.monotonic() < deadline:
+            time.sleep(0.001)
+        prefetched.close()
+
+        self.assertTrue(done.wait(5))
+        self.assertEqual(sorted(discarded), [10, 20])
+        self.assertEqual(sorted(self.started), [0, 1, 2])
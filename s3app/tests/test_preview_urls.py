@@ -0,0 +1,45 @@
+"""Ссылки предпросмотра изображений подписываются только для строк текущей страницы"""
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from .fake_s3 import FakeS3Client
+
+
+@override_settings(S3_OBJECT_INDEX_ENABLED=False, S3_LISTING_CACHE_ENABLED=False)
+class PreviewUrlTests(TestCase):
+    def setUp(self):
+        objects = {'photos/': b''}
+        objects.update({f"photos/img{index:02d}.jpg": b'jpg' for index in range(25)})
+        objects['photos/notes.txt'] = b'txt'
+        self.fake = FakeS3Client(objects)
+        # Представление создает S3Service на каждый запрос
+        mock.patch('s3app.s3_service.get_s3_client', return_value=self.fake).start()
+        mock.patch('s3app.s3_service.AWS_STORAGE_BUCKET_NAME', 'bucket').start()
+        self.addCleanup(mock.patch.stopall)
+
+        self.client.force_login(User.objects.create_superuser('admin', password='x'))
+        self.client.cookies[settings.BROWSER_CHALLENGE_COOKIE_NAME] = settings.BROWSER_CHALLENGE_COOKIE_VALUE
+
+    def browse(self, **params):
+        self.fake.calls = []
+        response = self.client.get(reverse('s3app:browser', args=['photos']), {'per_page': 10, **params})
+        self.assertEqual(response.status_code, 200)
+        return list(response.context['page_obj'])
+
+    def assertSignedRows(self, rows):
+        self.assertEqual(self.fake.calls.count('generate_presigned_url'), 10)
+        self.assertTrue(all(row.get('preview_url') for row in rows if row['is_image']))
+
+    @override_settings(S3_BROWSER_PAGINATION='cursor')
+    def test_cursor_page_signs_only_its_rows(self):
+        self.assertSignedRows(self.browse())
+
+    @override_settings(S3_BROWSER_PAGINATION='full')
+    def test_full_listing_signs_only_current_page(self):
+        rows = self.browse(page=2)
+        self.assertEqual(rows[0]['name'], 'img10.jpg')
+        self.assertSignedRows(rows)
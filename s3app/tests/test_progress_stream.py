@@ -0,0 +1,99 @@
+"""Поток прогресса массовых операций в формате NDJSON (progress.stream_operation, progress.stream_job)"""
+import json
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from s3app import progress
+from s3app.models import BackgroundJob
+
+from .fake_s3 import FakeS3Client
+
+
+def parse(lines):
+    return [json.loads(line) for line in lines]
+
+
+@override_settings(S3_PROGRESS_STREAM_INTERVAL=0.01)
+class StreamOperationTests(SimpleTestCase):
+    def test_progress_errors_and_result(self):
+        def operation(callback):
+            tracker = progress.BulkProgress(2, on_update=callback)
+            tracker({'copied_count': 3, 'copied_bytes': 30, 'errors': []})
+            tracker.item_done()
+            tracker.add_error("Нет прав для перемещения b")
+            tracker.item_done()
+            return {'success': True, 'message': 'готово'}
+
+        events = parse(progress.stream_operation(operation))
+
+        self.assertEqual(events[-1], {'event': 'done', 'result': {'success': True, 'message': 'готово'}})
+        self.assertEqual([event['message'] for event in events if event['event'] == 'error'],
+                         ["Нет прав для перемещения b"])
+        last_progress = [event for event in events if event['event'] == 'progress'][-1]
+        self.assertEqual((last_progress['items_done'], last_progress['items_total']), (2, 2))
+        self.assertEqual((last_progress['objects'], last_progress['bytes']), (3, 30))
+        self.assertNotIn('error_messages', last_progress)
+
+    def test_failure_ends_stream(self):
+        def operation(callback):
+            raise RuntimeError('S3 недоступен')
+
+        self.assertEqual(parse(progress.stream_operation(operation)), [{'event': 'failed', 'error': 'S3 недоступен'}])
+
+
+@override_settings(S3_PROGRESS_STREAM_INTERVAL=0.01, S3_PROGRESS_STREAM_MAX_DURATION=0.05)
+class StreamJobTests(TestCase):
+    def test_finished_job(self):
+        job = BackgroundJob.objects.create(job_type='delete_folder', params={}, status='succeeded',
+                                           progress={'objects': 5, 'error_messages': ['ошибка']},
+                                           result={'success': True})
+        events = parse(progress.stream_job(job))
+
+        self.assertEqual([event['event'] for event in events], ['job', 'error', 'progress', 'done'])
+        self.assertEqual(events[-1]['result'], {'success': True})
+
+    def test_long_job_switches_to_polling(self):
+        job = BackgroundJob.objects.create(job_type='delete_folder', params={}, status='running')
+        events = parse(progress.stream_job(job, status_url='/jobs/1/'))
+
+        self.assertEqual(events[-1], {'event': 'poll', 'status': 'running', 'status_url': '/jobs/1/'})
+
+
+@override_settings(S3_OBJECT_INDEX_ENABLED=False, S3_LISTING_CACHE_ENABLED=False,
+                   S3_BACKGROUND_JOBS_ENABLED=False, S3_PROGRESS_STREAM_INTERVAL=0.01)
+class MoveMultipleStreamTests(TransactionTestCase):
+    """Операция выполняется в отдельном потоке, поэтому данные теста должны быть зафиксированы в базе"""
+
+    def setUp(self):
+        self.fake = FakeS3Client({'a.txt': b'a', 'folder/': b'', 'folder/b.txt': b'b', 'dest/': b''})
+        mock.patch('s3app.s3_service.get_s3_client', return_value=self.fake).start()
+        mock.patch('s3app.s3_service.AWS_STORAGE_BUCKET_NAME', 'bucket').start()
+        self.addCleanup(mock.patch.stopall)
+        self.client.force_login(User.objects.create_superuser('admin', password='x'))
+        self.client.cookies[settings.BROWSER_CHALLENGE_COOKIE_NAME] = settings.BROWSER_CHALLENGE_COOKIE_VALUE
+
+    def post(self, **headers):
+        return self.client.post(reverse('s3app:move_multiple'),
+                                {'files[]': ['a.txt'], 'folders[]': ['folder'], 'destination_folder': 'dest'},
+                                **headers)
+
+    def test_ndjson_stream(self):
+        response = self.post(HTTP_ACCEPT='application/x-ndjson')
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        events = parse(b''.join(response.streaming_content).decode().splitlines())
+        self.assertEqual(events[-1]['event'], 'done')
+        self.assertEqual((events[-1]['result']['moved_files'], events[-1]['result']['moved_folders']), (1, 1))
+        self.assertEqual([event['items_done'] for event in events if event['event'] == 'progress'][-1], 2)
+        self.assertIn('dest/folder/b.txt', self.fake.objects)
+
+    def test_plain_json_without_accept_header(self):
+        response = self.post()
+
+        self.assertFalse(response.streaming)
+        self.assertEqual(response.json()['moved_files'], 1)
@@ -0,0 +1,41 @@
+"""Общий для процесса клиент S3 (s3_client.get_s3_client) и сведения о пулах соединений"""
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from s3app import s3_client
+from s3app.s3_service import S3Service
+
+ENDPOINT = 'http://s3.example:9000'
+
+
+@mock.patch.dict(s3_client._clients, clear=True)
+class SharedClientTests(SimpleTestCase):
+    def get_client(self, **kwargs):
+        params = dict(endpoint_url=ENDPOINT, access_key='key', secret_key='secret', region_name='us-east-1')
+        params.update(kwargs)
+        return s3_client.get_s3_client(**params)
+
+    def test_same_parameters_share_client(self):
+        self.assertIs(self.get_client(), self.get_client())
+
+    def test_other_parameters_get_own_client(self):
+        self.assertIsNot(self.get_client(), self.get_client(endpoint_url='http://other.example:9000'))
+
+    def test_services_share_client(self):
+        self.assertIs(S3Service().s3_client, S3Service().s3_client)
+
+    @override_settings(S3_MAX_POOL_CONNECTIONS=7)
+    def test_pool_size_from_settings(self):
+        self.assertEqual(self.get_client().meta.config.max_pool_connections, 7)
+
+    @override_settings(S3_MAX_POOL_CONNECTIONS=7)
+    def test_pool_stats_before_first_request(self):
+        self.get_client()
+        stats = s3_client.get_pool_stats()
+
+        self.assertEqual(len(stats), 1)
+        self.assertEqual(stats[0]['endpoint_url'], ENDPOINT)
+        self.assertEqual(stats[0]['max_pool_connections'], 7)
+        # Соединения еще не открывались: загрузка нулевая или недоступна, но не ошибка
+        self.assertIn(stats[0]['in_use'], (0, None))
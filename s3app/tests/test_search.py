@@ -0,0 +1,65 @@
+"""Поиск объектов по подстроке (S3Service.search_objects): индекс, FTS5 и просмотр листинга"""
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+
+from s3app import object_index, object_search
+from s3app.models import UserPermission
+from s3app.s3_service import S3Service
+
+from .fake_s3 import FakeS3Client
+
+OBJECTS = {
+    'reports/': b'', 'reports/Отчет 2024.pdf': b'1', 'reports/отчеты/q1.xlsx': b'2',
+    'reports/old/report.txt': b'3', 'reports/report': b'4', 'private/report-secret.txt': b'5',
+    '__trash/report.txt': b'6', 'misc/notes.txt': b'7', 'misc/deep/reporting/x.txt': b'8',
+}
+
+
+@override_settings(S3_LISTING_CACHE_ENABLED=False)
+@mock.patch.object(object_search, '_fts_ready', False)
+class SearchTests(TestCase):
+    def setUp(self):
+        self.fake = FakeS3Client(OBJECTS, page_size=3)
+        with mock.patch('s3app.s3_service.get_s3_client', return_value=self.fake):
+            self.service = S3Service()
+        self.service.bucket_name = 'bucket'
+        self.admin = User.objects.create_superuser('admin', password='x')
+        self.user = User.objects.create_user('bob', password='x')
+        for folder_path in ('reports', 'misc/deep'):
+            UserPermission.objects.create(user=self.user, folder_path=folder_path, can_read=True)
+        with override_settings(S3_OBJECT_INDEX_ENABLED=True):
+            object_index.rebuild_index(self.fake, 'bucket')
+
+    def search(self, user, query, prefix='', index=True):
+        with override_settings(S3_OBJECT_INDEX_ENABLED=index):
+            return [item['path'] for item in self.service.search_objects(user, prefix=prefix, query=query)]
+
+    def assertSameResults(self, user, query, prefix=''):
+        scanned = self.search(user, query, prefix, index=False)
+        self.assertEqual(self.search(user, query, prefix), scanned)
+        return scanned
+
+    def test_index_matches_scan(self):
+        for user in (self.admin, self.user):
+            for query in ('rep', 'REPORT', 'отч', 'ОТЧЕТ', 'x', 'txt'):
+                with self.subTest(user=user.username, query=query):
+                    self.assertSameResults(user, query)
+
+    def test_trigram_index_matches_scan(self):
+        self.assertTrue(object_search.create_search_index())
+        for query in ('report', 'отчет', 'eport', 'xlsx'):
+            with self.subTest(query=query):
+                self.assertSameResults(self.user, query)
+
+    def test_ranking_exact_then_prefix_then_shorter(self):
+        results = self.assertSameResults(self.admin, 'report', prefix='reports')
+        self.assertEqual(results, ['reports/report', 'reports/old/report.txt'])
+
+    def test_permissions_and_service_folders(self):
+        results = self.assertSameResults(self.user, 'report')
+        self.assertIn('misc/deep/reporting/', results)
+        self.assertNotIn('private/report-secret.txt', results)
+        self.assertNotIn('__trash/report.txt', results)
+        self.assertEqual(self.search(User.objects.create_user('eve', password='x'), 'report'), [])
@@ -0,0 +1,88 @@
+"""Манифест папки в корзине (trash_manifest): восстановление и удаление без листинга корзины"""
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from s3app import trash_manifest
+from s3app.models import TrashItem
+from s3app.s3_service import S3Service
+
+from .fake_s3 import FakeS3Client
+
+
+class PrefixRecordingClient(FakeS3Client):
+    """Запоминает префиксы листингов"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.listed_prefixes = []
+
+    def list_objects_v2(self, Bucket, Prefix='', **kwargs):
+        self.listed_prefixes.append(Prefix)
+        return super().list_objects_v2(Bucket=Bucket, Prefix=Prefix, **kwargs)
+
+
+class ManifestEncodingTests(SimpleTestCase):
+    def test_round_trip(self):
+        objects = [{'Key': 'p/a.txt', 'Size': 1, 'ETag': '"x"'}, {'Key': 'p/отчеты/b.txt', 'Size': 2, 'ETag': '"y"'}]
+        data = trash_manifest.encode(objects, 'p/')
+        self.assertEqual(list(trash_manifest.iter_objects(data, '__trash/1/p/')),
+                         [{'Key': '__trash/1/p/a.txt', 'Size': 1, 'ETag': '"x"'},
+                          {'Key': '__trash/1/p/отчеты/b.txt', 'Size': 2, 'ETag': '"y"'}])
+
+
+@override_settings(S3_OBJECT_INDEX_ENABLED=False, S3_LISTING_CACHE_ENABLED=False, S3_TRASH_BACKEND='copy')
+class ManifestTrashTests(TestCase):
+    def setUp(self):
+        objects = {'docs/': b''}
+        objects.update({f"docs/{index:03d}.txt": b'x' * index for index in range(50)})
+        self.fake = PrefixRecordingClient(objects, page_size=10)
+        with mock.patch('s3app.s3_service.get_s3_client', return_value=self.fake):
+            self.service = S3Service()
+        self.service.bucket_name = 'bucket'
+        self.admin = User.objects.create_superuser('admin', password='x')
+        self.assertTrue(self.service.delete_folder(self.admin, 'docs')['success'])
+        self.item = TrashItem.objects.get(original_path='docs')
+
+    def trash_listings(self):
+        return [prefix for prefix in self.fake.listed_prefixes if prefix.startswith('__trash')]
+
+    def test_manifest_saved_on_delete(self):
+        entries = {key: (size, etag) for key, size, etag in trash_manifest.decode(self.item.manifest)}
+        self.assertEqual(len(entries), self.item.object_count)
+        self.assertEqual(entries['003.txt'], (3, self.fake._meta(self.item.trash_path + '003.txt')['ETag']))
+
+    def test_restore_does_not_list_trash(self):
+        self.fake.listed_prefixes = []
+        result = self.service.restore_from_trash(self.admin, self.item.id)
+
+        self.assertTrue(result['success'])
+        self.assertEqual(self.trash_listings(), [])
+        self.assertEqual(self.fake.objects['docs/049.txt'], b'x' * 49)
+        self.assertFalse(any(key.startswith('__trash/') for key in self.fake.objects))
+
+    def test_purge_does_not_list_trash(self):
+        self.fake.listed_prefixes = []
+        self.assertTrue(self.service.delete_from_trash(self.item.id)['success'])
+
+        self.assertEqual(self.trash_listings(), [])
+        self.assertFalse(any(key.startswith('__trash/') for key in self.fake.objects))
+
+    def test_partial_restore_shrinks_manifest(self):
+        failed_key = self.item.trash_path + '010.txt'
+        self.fake.fail_copy.add(failed_key)
+        self.assertFalse(self.service.restore_from_trash(self.admin, self.item.id)['success'])
+
+        self.item.refresh_from_db()
+        self.assertEqual([obj['Key'] for obj in trash_manifest.iter_objects(self.item.manifest, self.item.trash_path)],
+                         [failed_key])
+        self.assertEqual(self.item.object_count, 1)
+
+    def test_item_without_manifest_falls_back_to_listing(self):
+        TrashItem.objects.filter(id=self.item.id).update(manifest=None)
+        self.fake.listed_prefixes = []
+        self.assertTrue(self.service.delete_from_trash(self.item.id)['success'])
+
+        self.assertEqual(set(self.trash_listings()), {self.item.trash_path})
+        self.assertFalse(any(key.startswith('__trash/') for key in self.fake.objects))
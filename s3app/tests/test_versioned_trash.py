@@ -0,0 +1,93 @@
+"""Корзина на версиях объектов (S3_TRASH_BACKEND = 'versioning')"""
+import datetime
+from unittest import mock
+
+from botocore.exceptions import ClientError
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from s3app import versioned_trash
+from s3app.models import TrashItem
+from s3app.s3_service import S3Service
+
+from .fake_s3 import FakeS3Client
+
+
+@override_settings(S3_TRASH_BACKEND='versioning', S3_OBJECT_INDEX_ENABLED=False, S3_ARCHIVE_CACHE_ENABLED=False)
+class VersionedTrashTests(TestCase):
+    def setUp(self):
+        self.fake = FakeS3Client()
+        self.fake.versioning = 'Enabled'
+        for key in ('docs/a.txt', 'docs/sub/b.txt', 'docs/sub/c.txt'):
+            self.fake.put_object(Bucket='bucket', Key=key, Body=key.encode())
+        with mock.patch('s3app.s3_service.get_s3_client', return_value=self.fake):
+            self.service = S3Service()
+        self.service.bucket_name = 'bucket'
+        self.user = User.objects.create_superuser('admin', password='x')
+
+    def test_file_round_trip(self):
+        self.service.delete_file(self.user, 'docs/a.txt')
+        item = TrashItem.objects.get()
+        self.assertEqual(item.backend, 'versioning')
+        self.assertNotIn('docs/a.txt', self.fake.objects)
+        self.assertNotIn('copy_object', self.fake.calls)
+
+        result = self.service.restore_from_trash(self.user, item.id)
+        self.assertTrue(result['success'], result)
+        self.assertEqual(self.fake.objects['docs/a.txt'], b'docs/a.txt')
+        self.assertFalse(TrashItem.objects.exists())
+
+    def test_folder_round_trip(self):
+        self.service.delete_folder(self.user, 'docs/sub')
+        item = TrashItem.objects.get()
+        self.assertEqual(sorted(item.versions), ['docs/sub/b.txt', 'docs/sub/c.txt'])
+
+        result = self.service.restore_from_trash(self.user, item.id)
+        self.assertTrue(result['success'], result)
+        self.assertEqual(self.fake.objects['docs/sub/c.txt'], b'docs/sub/c.txt')
+
+    def test_suspended_versioning_falls_back_to_copy(self):
+        self.fake.versioning = 'Suspended'
+        self.service.delete_file(self.user, 'docs/a.txt')
+        item = TrashItem.objects.get()
+        self.assertEqual(item.backend, 'copy')
+        self.assertEqual(self.fake.objects[item.trash_path], b'docs/a.txt')
+
+    def test_missing_marker_is_reported_per_key(self):
+        self.fake.report_markers = False
+        with self.assertRaises(ClientError):
+            self.service.delete_file(self.user, 'docs/a.txt')
+
+        result = self.service.delete_multiple(self.user, [], ['docs/sub'])
+        self.assertTrue(result['errors'])
+        self.assertFalse(TrashItem.objects.exists())
+
+    def test_trash_objects_marks_keys_without_marker(self):
+        self.fake.report_markers = False
+        objects = list(versioned_trash.iter_current_versions(self.fake, 'bucket', 'docs/sub/'))
+        result = versioned_trash.trash_objects(self.fake, 'bucket', objects)
+        self.assertEqual(result['versions'], {})
+        self.assertEqual({(error['key'], error['code']) for error in result['errors']},
+                         {('docs/sub/b.txt', versioned_trash.NO_DELETE_MARKER),
+                          ('docs/sub/c.txt', versioned_trash.NO_DELETE_MARKER)})
+
+    def test_restore_without_saved_versions_fails_cleanly(self):
+        item = TrashItem.objects.create(original_path='docs/gone.txt', trash_path='docs/gone.txt',
+                                        object_type='file', deleted_by=self.user, backend='versioning',
+                                        versions={}, object_count=1,
+                                        expires_at=timezone.now() + datetime.timedelta(days=30))
+        result = self.service.restore_from_trash(self.user, item.id)
+        self.assertFalse(result['success'])
+        self.assertTrue(TrashItem.objects.filter(id=item.id).exists())
+
+    def test_folder_restore_reports_keys_without_marker(self):
+        self.service.delete_folder(self.user, 'docs/sub')
+        item = TrashItem.objects.get()
+        item.versions['docs/sub/c.txt'] = [item.versions['docs/sub/c.txt'][0], None]
+        item.save()
+
+        result = self.service.restore_from_trash(self.user, item.id)
+        self.assertFalse(result['success'])
+        self.assertEqual(self.fake.objects['docs/sub/b.txt'], b'docs/sub/b.txt')
+        self.assertEqual(list(TrashItem.objects.get(id=item.id).versions), ['docs/sub/c.txt'])
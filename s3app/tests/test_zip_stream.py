@@ -0,0 +1,107 @@
+"""Потоковый ZIP-архив (s3app.zip_stream) читается стандартным zipfile"""
+import datetime
+import io
+import os
+import zipfile
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from s3app import zip_stream
+from s3app.models import S3ActionLog
+from s3app.s3_service import S3Service
+
+from .fake_s3 import FakeS3Client
+
+
+def read_archive(parts):
+    return zipfile.ZipFile(io.BytesIO(b''.join(parts)))
+
+
+@override_settings(S3_ARCHIVE_CHUNK_SIZE=4096)
+class StreamZipTests(SimpleTestCase):
+    def member(self, name, data, chunk_size=1000, **fields):
+        member = {'name': name, 'size': len(data),
+                  'chunks': [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]}
+        member.update(fields)
+        return member
+
+    def test_round_trip(self):
+        text = b'line of text\n' * 5000
+        random_data = os.urandom(20000)
+        members = [
+            self.member('docs/readme.txt', text, compression='deflated'),
+            self.member('photo.jpg', random_data, compression='stored'),
+            self.member('blob.bin', random_data),
+            self.member('notes.bin', text),
+            self.member('пустой.txt', b''),
+            self.member('unknown-size.txt', text, size=None),
+            self.member('old.txt', b'old', last_modified=datetime.datetime(1970, 1, 1)),
+        ]
+        archive = read_archive(zip_stream.stream_zip(members, preset='balanced'))
+
+        self.assertIsNone(archive.testzip())
+        self.assertEqual(archive.namelist(), [member['name'] for member in members])
+        self.assertEqual(archive.read('docs/readme.txt'), text)
+        self.assertEqual(archive.read('blob.bin'), random_data)
+        self.assertEqual(archive.read('unknown-size.txt'), text)
+        self.assertEqual(archive.read('пустой.txt'), b'')
+        compression = {info.filename: info.compress_type for info in archive.infolist()}
+        self.assertEqual(compression['photo.jpg'], zipfile.ZIP_STORED)
+        # Для 'auto' случайные данные не сжимаются, текст сжимается
+        self.assertEqual(compression['blob.bin'], zipfile.ZIP_STORED)
+        self.assertEqual(compression['notes.bin'], zipfile.ZIP_DEFLATED)
+        self.assertEqual(archive.getinfo('old.txt').date_time, (1980, 1, 1, 0, 0, 0))
+
+    def test_presets_set_compression_level(self):
+        data = os.urandom(64) * 2000 + b'text ' * 20000
+        sizes = {}
+        for preset in zip_stream.PRESETS:
+            parts = zip_stream.stream_zip([self.member('data.txt', data, compression='deflated')], preset=preset)
+            archive_bytes = b''.join(parts)
+            self.assertEqual(read_archive([archive_bytes]).read('data.txt'), data)
+            sizes[preset] = len(archive_bytes)
+        self.assertGreater(sizes['fast'], sizes['max'])
+
+    def test_members_are_consumed_while_streaming(self):
+        consumed = []
+
+        def members():
+            for index in range(3):
+                consumed.append(index)
+                yield self.member(f"{index}.bin", os.urandom(10000), compression='stored')
+
+        stream = zip_stream.stream_zip(members())
+        next(stream)
+        self.assertEqual(consumed, [0])
+        list(stream)
+        self.assertEqual(consumed, [0, 1, 2])
+
+
+@override_settings(S3_ARCHIVE_CHUNK_SIZE=4096, S3_ARCHIVE_PREFETCH_MAX_OBJECT_SIZE=10000)
+class FileArchiveTests(TestCase):
+    def setUp(self):
+        self.fake = FakeS3Client({
+            'a/report.txt': b'report ' * 1000,
+            'a/big.bin': os.urandom(50000),
+            'b/report.txt': b'other report',
+        })
+        with mock.patch('s3app.s3_service.get_s3_client', return_value=self.fake):
+            self.service = S3Service()
+        self.service.bucket_name = 'bucket'
+        self.user = User.objects.create_superuser('admin', password='x')
+
+    def test_selected_files_round_trip(self):
+        archive = self.service.file_archive(self.user, ['a/report.txt', 'a/big.bin', 'b/report.txt', 'a/missing.txt'])
+        report = {}
+        members = self.service.iter_archive_members(self.user, archive, report=report)
+        result = read_archive(zip_stream.stream_zip(members))
+
+        # Одноименные файлы из разных папок не совпадают; отсутствующий файл пропускается
+        self.assertEqual(sorted(result.namelist()), ['a/big.bin', 'a/report.txt', 'b/report.txt'])
+        for name in result.namelist():
+            self.assertEqual(result.read(name), self.fake.objects[name])
+        self.assertEqual(report, {'archived': 3, 'failed': 1})
+        failed = S3ActionLog.objects.get(success=False)
+        self.assertEqual(failed.path, 'a/missing.txt')
@@ -0,0 +1,28 @@
+"""
+Манифест папки в корзине (TrashItem.manifest).
+
+При удалении папки объекты все равно перебираются листингом, поэтому их список
+сохраняется в записи корзины: ключ относительно папки, размер и ETag, сжатый zlib.
+Восстановление и окончательное удаление берут объекты из манифеста и не
+листают __trash/<id>/ повторно; для записей без манифеста (созданных до его
+появления или после продолжения прерванного удаления) используется листинг.
+"""
+import json
+import zlib
+
+
+def encode(objects, prefix):
+    """Сжимает список объектов листинга ({'Key', 'Size', 'ETag'}) с ключами внутри prefix"""
+    entries = [[obj['Key'][len(prefix):], obj.get('Size', 0), obj.get('ETag', '')] for obj in objects]
+    return zlib.compress(json.dumps(entries, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+
+def decode(data):
+    """Список записей манифеста [относительный ключ, размер, ETag]"""
+    return json.loads(zlib.decompress(bytes(data)).decode('utf-8'))
+
+
+def iter_objects(data, prefix):
+    """Объекты манифеста в формате листинга с ключами внутри prefix (в порядке листинга)"""
+    for key, size, etag in decode(data):
+        yield {'Key': prefix + key, 'Size': size, 'ETag': etag}
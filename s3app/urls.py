@@ -28,6 +28,7 @@ urlpatterns = [
     path('upload-file/<path:path>/', views.upload_file, name='upload_file_path'),
     path('delete-file/<path:path>/', views.delete_file, name='delete_file'),
     path('download-file/<path:path>/', views.download_file, name='download_file'),
+    path('download-folder/<path:path>/', views.download_folder, name='download_folder'),
 
     # Маршруты для перемещения файлов и папок
     path('move-file/<path:path>/', views.move_file, name='move_file'),
@@ -66,6 +67,13 @@ urlpatterns = [
     # Новый маршрут для автозаполнения папок
     path('folders-autocomplete/', views.folders_autocomplete, name='folders_autocomplete'),
 
+    # Состояние фоновой задачи
+    path('jobs/<int:job_id>/', views.job_status, name='job_status'),
+    path('jobs/<int:job_id>/stream/', views.job_progress_stream, name='job_progress_stream'),
+
+    # Состояние пула соединений S3 (только для администраторов)
+    path('s3-pool-status/', views.s3_pool_status, name='s3_pool_status'),
+
     # Корзина (только для администраторов)
     path('trash/', views.trash_view, name='trash'),
     path('trash/restore/<int:item_id>/', views.restore_from_trash, name='restore_from_trash'),
@@ -0,0 +1,159 @@
+"""
+Корзина на основе версий объектов (S3_TRASH_BACKEND = 'versioning').
+
+На бакете с включенным версионированием удаление объекта не стирает данные:
+создается маркер удаления, а прежняя версия остается в бакете. Поэтому
+перенос в корзину - это одно удаление (маркер) на ключ без копирования данных,
+восстановление - удаление маркера (текущей снова становится прежняя версия),
+окончательное удаление - удаление самой версии объекта и маркера.
+
+Для каждого ключа элемента корзины хранится пара [версия объекта, версия маркера]
+(TrashItem.versions). Версионирование бакета проверяется (get_bucket_versioning)
+в начале каждой операции переноса в корзину: если оно не включено или
+приостановлено, используется корзина с копированием в __trash. Если хранилище
+все же не вернуло версию маркера удаления, ключ считается ошибкой переноса.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+from django.conf import settings
+
+from . import bulk_ops
+
+# Последнее проверенное в этом процессе состояние версионирования: имя бакета -> включено ли
+_versioning_enabled = {}
+
+# Код ошибки ключа, удаленного без маркера удаления (восстановить его из корзины нельзя)
+NO_DELETE_MARKER = 'NoDeleteMarker'
+
+
+def _backend():
+    return getattr(settings, 'S3_TRASH_BACKEND', 'copy')
+
+
+def is_enabled(s3_client, bucket_name):
+    """Используется ли корзина на версиях: выбрана в настройках и версионирование бакета включено.
+
+    Вызывается перед каждым переносом в корзину: один запрос на операцию, а не на ключ.
+    """
+    if _backend() != 'versioning':
+        return False
+
+    try:
+        status = s3_client.get_bucket_versioning(Bucket=bucket_name).get('Status')
+    except ClientError as e:
+        print(f"Error checking versioning of bucket {bucket_name}: {str(e)}")
+        status = None
+    enabled = status == 'Enabled'
+    if not enabled and _versioning_enabled.get(bucket_name, True):
+        print(f"S3_TRASH_BACKEND='versioning', но версионирование бакета {bucket_name} не включено: "
+              f"используется корзина с копированием")
+    _versioning_enabled[bucket_name] = enabled
+    return enabled
+
+
+def iter_current_versions(s3_client, bucket_name, prefix):
+    """Отдает текущие версии объектов префикса ({'Key', 'VersionId', 'Size', ...}) по мере листинга"""
+    paginator = s3_client.get_paginator('list_object_versions')
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+        for version in page.get('Versions', []):
+            if version.get('IsLatest') and version['Key'].startswith(prefix):
+                yield version
+
+
+def _head_version(s3_client, bucket_name, key):
+    try:
+        head = s3_client.head_object(Bucket=bucket_name, Key=key)
+    except ClientError as e:
+        code, message = bulk_ops.client_error_details(e)
+        return None, {'key': key, 'operation': 'head', 'code': code, 'message': message}
+    return {'Key': key, 'VersionId': head.get('VersionId'), 'Size': head.get('ContentLength', 0)}, None
+
+
+def head_versions(s3_client, bucket_name, keys, max_workers=None):
+    """Текущие версии отдельных объектов (параллельные запросы head_object).
+
+    Returns:
+        tuple: (список {'Key', 'VersionId', 'Size'}, список ошибок {'key', 'operation', 'code', 'message'})
+    """
+    objects = []
+    errors = []
+    max_workers = max(1, max_workers or bulk_ops.copy_concurrency())
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='s3-head') as executor:
+        for obj, error in executor.map(lambda key: _head_version(s3_client, bucket_name, key), keys):
+            if error:
+                errors.append(error)
+            else:
+                objects.append(obj)
+    return objects, errors
+
+
+def trash_objects(s3_client, bucket_name, objects, progress_callback=None):
+    """Переносит объекты в корзину, создавая маркеры удаления пачками DeleteObjects.
+
+    Args:
+        objects: итерируемый набор текущих версий {'Key', 'VersionId', 'Size'}
+
+    Returns:
+        dict: результат bulk_ops.bulk_delete, дополненный
+              'versions': ключ -> [версия объекта, версия маркера] и
+              'deleted_bytes': размер перенесенных объектов. Ключи, удаленные
+              без маркера удаления, попадают в 'errors' с операцией 'marker'
+    """
+    listed = {}
+
+    def iter_keys():
+        for obj in objects:
+            listed[obj['Key']] = obj
+            yield obj['Key']
+
+    result = bulk_ops.bulk_delete(
+        s3_client, bucket_name, iter_keys(), progress_callback=progress_callback, collect_markers=True
+    )
+    markers = result.pop('markers')
+    result['versions'] = {
+        key: [listed[key].get('VersionId'), marker_version]
+        for key, marker_version in markers.items()
+    }
+    failed_keys = {error['key'] for error in result['errors']}
+    for key in listed:
+        if key not in markers and key not in failed_keys:
+            # Хранилище не вернуло версию маркера (например, версионирование приостановлено)
+            result['errors'].append({
+                'key': key, 'operation': 'marker', 'code': NO_DELETE_MARKER,
+                'message': "Объект удален без маркера удаления и не может быть восстановлен из корзины"
+            })
+    result['deleted_bytes'] = sum(listed[key].get('Size', 0) for key in result['versions'])
+    return result
+
+
+def restore_objects(s3_client, bucket_name, versions, progress_callback=None):
+    """Восстанавливает объекты, удаляя их маркеры удаления (см. bulk_ops.bulk_delete).
+
+    Ключи без сохраненной версии маркера не восстанавливаются и попадают в 'errors'.
+    """
+    result = bulk_ops.bulk_delete(
+        s3_client, bucket_name,
+        ((key, key_versions[1]) for key, key_versions in versions.items() if _marker_version(key_versions)),
+        progress_callback=progress_callback
+    )
+    result['errors'].extend(
+        {'key': key, 'operation': 'restore', 'code': NO_DELETE_MARKER,
+         'message': "Версия маркера удаления не сохранена"}
+        for key, key_versions in versions.items() if not _marker_version(key_versions)
+    )
+    return result
+
+
+def _marker_version(key_versions):
+    return key_versions[1] if key_versions and len(key_versions) > 1 else None
+
+
+def iter_purge_versions(versions):
+    """Пары (ключ, версия) для окончательного удаления: версия объекта и маркер удаления"""
+    for key, key_versions in versions.items():
+        object_version = key_versions[0] if key_versions else None
+        if object_version:
+            yield key, object_version
+        if _marker_version(key_versions):
+            yield key, _marker_version(key_versions)
@@ -6,18 +6,20 @@ from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
 from django.contrib.auth.models import User
 from django.core.exceptions import PermissionDenied
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from botocore.exceptions import ClientError
 from django import forms
 from .forms import LoginForm  # ... другие формы ...
 from .captcha import Captcha  # Импортируем класс Captcha
 
-from .models import UserPermission, S3ActionLog, TrashItem, DocumentSignature
+from .models import UserPermission, S3ActionLog, TrashItem, DocumentSignature, BackgroundJob
 from .forms import (
     LoginForm, CreateFolderForm, UploadFileForm,
     UserPermissionForm, UserCreationForm
 )
 from .s3_service import S3Service
+from .s3_client import get_pool_stats
+from . import jobs, progress, zip_stream
 
 from django.conf import settings
 from django.http import HttpResponse, JsonResponse  # Добавляем JsonResponse
@@ -26,7 +28,14 @@ from django.views.decorators.csrf import ensure_csrf_cookie, csrf_protect  # Д
 from django.views.decorators.http import require_http_methods  # Для ограничения методов
 from django.shortcuts import render
 from django.core.paginator import Paginator
+from django.db.models import Count, Sum
+from django.urls import reverse
 from django.utils import timezone
+from django.utils.http import content_disposition_header, urlencode
+
+# Сколько курсоров предыдущих страниц хранится в ссылках курсорной пагинации
+CURSOR_HISTORY_LIMIT = 20
+
 
 def login_view(request):
     """Авторизация пользователя с CAPTCHA"""
@@ -231,10 +240,23 @@ def browser_view(request, path=''):
                 query=search_query,
                 max_results=200  # Limit the number of search results shown
             )
+            s3_service.attach_preview_urls(context['search_results'])
             if not context['search_results']:
                 messages.info(request,
                               f"Файлы, содержащие '{search_query}', не найдены в '{path or 'Корневой директории'}' и подпапках.")
 
+        elif getattr(settings, 'S3_BROWSER_PAGINATION', 'cursor') == 'cursor':
+            # --- BROWSE LOGIC (курсорная пагинация: из S3 читается только текущая страница) ---
+            cursor = request.GET.get('cursor') or None
+            result = s3_service.list_objects_page(request.user, path, cursor=cursor, page_size=items_per_page)
+
+            context['page_obj'] = result['directories'] + result['files']
+            s3_service.attach_preview_urls(context['page_obj'])
+            context['is_cursor_pagination'] = True
+            context['current_cursor'] = cursor
+            context['next_cursor'] = result['next_cursor']
+            context.update(_cursor_page_queries(request, cursor, result['next_cursor'], items_per_page))
+
         else:
             # --- BROWSE LOGIC ---
             result = s3_service.list_objects(request.user, path)  # Standard listing
@@ -247,6 +269,8 @@ def browser_view(request, path=''):
             paginator = Paginator(all_items, items_per_page)  # Используем динамическое количество элементов на странице
             page_number = request.GET.get('page')
             context['page_obj'] = paginator.get_page(page_number)
+            # Ссылки предпросмотра подписываем только для строк текущей страницы
+            s3_service.attach_preview_urls(context['page_obj'].object_list)
 
     except PermissionDenied as e:
         messages.error(request, str(e))
@@ -265,6 +289,32 @@ def browser_view(request, path=''):
     return render(request, 'browser.html', context)
 
 
+def _cursor_page_queries(request, cursor, next_cursor, items_per_page):
+    """Строки запроса для ссылок на предыдущую и следующую страницу при курсорной пагинации.
+
+    Курсоры предыдущих страниц (кроме первой) передаются в параметре back через точку,
+    поэтому переход назад работает и по прямой ссылке. Хранится не больше
+    CURSOR_HISTORY_LIMIT курсоров; с более дальних страниц "назад" ведет на первую.
+    """
+    back = [c for c in request.GET.get('back', '').split('.') if c][-CURSOR_HISTORY_LIMIT:]
+    base = {'per_page': items_per_page} if items_per_page != 10 else {}
+
+    previous_query = None
+    if cursor:
+        previous = dict(base)
+        if back:
+            previous.update(cursor=back[-1], back='.'.join(back[:-1]))
+        previous_query = urlencode({key: value for key, value in previous.items() if value})
+
+    next_query = None
+    if next_cursor:
+        history = (back + [cursor])[-CURSOR_HISTORY_LIMIT:] if cursor else back
+        following = dict(base, cursor=next_cursor, back='.'.join(history))
+        next_query = urlencode({key: value for key, value in following.items() if value})
+
+    return {'previous_page_query': previous_query, 'next_page_query': next_query}
+
+
 @login_required
 def create_folder(request, path=''):
     if path == "root":
@@ -305,6 +355,18 @@ def delete_folder(request, path):
         messages.error(request, 'Невозможно удалить корневую директорию')
         return redirect('s3app:browser')
 
+    # Перенаправляем на родительскую директорию
+    parent_path = '/'.join(path.split('/')[:-1])
+    if parent_path:
+        response = redirect('s3app:browser', path=parent_path)
+    else:
+        response = redirect('s3app:browser')
+
+    if jobs.jobs_enabled():
+        # Удаление большой папки может занять минуты - выполняем в фоне
+        job = jobs.enqueue('delete_folder', request.user, path=path)
+        return _job_enqueued_response(request, job, response)
+
     try:
         # Удаляем папку из S3
         s3_service = S3Service()
@@ -315,12 +377,7 @@ def delete_folder(request, path):
     except ClientError as e:
         messages.error(request, f'Ошибка при удалении папки: {str(e)}')
 
-    # Перенаправляем на родительскую директорию
-    parent_path = '/'.join(path.split('/')[:-1])
-    if parent_path:
-        return redirect('s3app:browser', path=parent_path)
-    else:
-        return redirect('s3app:browser')
+    return response
 
 
 @login_required
@@ -444,6 +501,13 @@ def move_folder(request, path):
         messages.error(request, 'Невозможно переместить корневую директорию')
         return redirect('s3app:browser')
 
+    # Перенаправляем на родительскую директорию
+    parent_path = '/'.join(path.split('/')[:-1])
+    if parent_path:
+        response = redirect('s3app:browser', path=parent_path)
+    else:
+        response = redirect('s3app:browser')
+
     if request.method == 'POST':
         destination_folder = request.POST.get('destination_folder', '').strip()
 
@@ -452,6 +516,11 @@ def move_folder(request, path):
             messages.error(request, 'Невозможно переместить папку внутрь самой себя или в свою подпапку')
             return redirect('s3app:browser', path=path)
 
+        if jobs.jobs_enabled():
+            # Перемещение большой папки может занять минуты - выполняем в фоне
+            job = jobs.enqueue('move_folder', request.user, path=path, destination_folder=destination_folder)
+            return _job_enqueued_response(request, job, response)
+
         try:
             # Перемещаем папку в другую папку
             s3_service = S3Service()
@@ -462,12 +531,7 @@ def move_folder(request, path):
         except ClientError as e:
             messages.error(request, f'Ошибка при перемещении папки: {str(e)}')
 
-    # Перенаправляем на родительскую директорию
-    parent_path = '/'.join(path.split('/')[:-1])
-    if parent_path:
-        return redirect('s3app:browser', path=parent_path)
-    else:
-        return redirect('s3app:browser')
+    return response
 
 
 @login_required
@@ -485,42 +549,25 @@ def move_multiple(request):
     if not destination_folder and destination_folder != '':
         return JsonResponse({'error': 'No destination folder specified'}, status=400)
 
-    s3_service = S3Service()
-
-    # Счетчики успешных операций
-    moved_files = 0
-    moved_folders = 0
-    errors = []
-
-    # Перемещаем файлы
-    for file_path in file_paths:
-        try:
-            s3_service.move_object(request.user, file_path, destination_folder, is_folder=False)
-            moved_files += 1
-        except Exception as e:
-            errors.append(f"Не удалось переместить файл {file_path}: {str(e)}")
-
-    # Перемещаем папки
-    for folder_path in folder_paths:
-        # Проверка, чтобы не перемещать папку в саму себя или свою подпапку
-        if destination_folder.startswith(folder_path) or destination_folder == folder_path:
-            errors.append(f"Невозможно переместить папку {folder_path} внутрь самой себя или в свою подпапку")
-            continue
+    if jobs.jobs_enabled():
+        # Перемещение папок может занять минуты - выполняем в фоне
+        job = jobs.enqueue(
+            'move_multiple', request.user,
+            files=file_paths, folders=folder_paths, destination_folder=destination_folder
+        )
+        return _job_json_response(request, job)
 
-        try:
-            s3_service.move_object(request.user, folder_path, destination_folder, is_folder=True)
-            moved_folders += 1
-        except Exception as e:
-            errors.append(f"Не удалось переместить папку {folder_path}: {str(e)}")
+    s3_service = S3Service()
 
-    response_data = {
-        'success': True,
-        'moved_files': moved_files,
-        'moved_folders': moved_folders,
-        'errors': errors
-    }
+    if _wants_progress_stream(request):
+        # Клиент читает прогресс по мере выполнения, а не ждет окончания операции
+        return _progress_stream_response(progress.stream_operation(
+            lambda callback: s3_service.move_multiple(
+                request.user, file_paths, folder_paths, destination_folder, progress_callback=callback
+            )
+        ))
 
-    return JsonResponse(response_data)
+    return JsonResponse(s3_service.move_multiple(request.user, file_paths, folder_paths, destination_folder))
 
 
 @staff_member_required
@@ -704,10 +751,12 @@ def action_logs(request):
 @login_required
 @require_http_methods(["POST"])
 def download_multiple(request):
-    """Обработчик для скачивания нескольких файлов в виде ZIP-архива"""
-    import zipfile
-    import io
-    import tempfile
+    """Скачивание нескольких файлов одним ZIP-архивом.
+
+    Архив формируется на лету и отдается потоком: объекты читаются из S3 блоками
+    и сразу записываются в архив, без временного файла и без чтения файлов целиком.
+    Параметр compression выбирает пресет сжатия (fast, balanced, max).
+    """
     import time
 
     # Получаем список файлов для скачивания
@@ -716,46 +765,54 @@ def download_multiple(request):
     if not file_paths:
         return JsonResponse({'error': 'No files selected'}, status=400)
 
-    # Создаем временный архив
-    s3_service = S3Service()
+    # Пресет сжатия: fast, balanced или max
+    preset = request.POST.get('compression') or zip_stream.default_preset()
+    if preset not in zip_stream.PRESETS:
+        return JsonResponse({'error': f'Unknown compression preset: {preset}'}, status=400)
 
+    s3_service = S3Service()
     try:
-        # Используем временный файл вместо памяти для больших архивов
-        with tempfile.NamedTemporaryFile(suffix='.zip', delete=False) as temp_file:
-            temp_file_path = temp_file.name
+        archive = s3_service.file_archive(request.user, file_paths)
+    except PermissionDenied as e:
+        return JsonResponse({'error': str(e)}, status=403)
 
-        with zipfile.ZipFile(temp_file_path, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for file_path in file_paths:
-                try:
-                    # Получаем файл из S3
-                    file_content = s3_service.get_object_content(request.user, file_path)
-
-                    # Добавляем файл в архив с только именем файла (без пути)
-                    zip_file.writestr(os.path.basename(file_path), file_content)
-
-                    # Логируем действие
-                    S3ActionLog.objects.create(
-                        user=request.user,
-                        action='download',
-                        path=file_path,
-                        details=f'Downloaded in bulk archive'
-                    )
-                except Exception as e:
-                    # Пропускаем файлы, которые не удалось скачать
-                    continue
+    return _archive_response(request, s3_service, archive, preset, f"files_{int(time.time())}.zip")
 
-        # Открываем архив для отправки
-        with open(temp_file_path, 'rb') as f:
-            response = HttpResponse(f.read(), content_type='application/zip')
-            response['Content-Disposition'] = f'attachment; filename="files_{int(time.time())}.zip"'
 
-        # Удаляем временный файл
-        os.unlink(temp_file_path)
+@login_required
+def download_folder(request, path):
+    """Скачивание папки со всем содержимым одним ZIP-архивом (потоком, см. download_multiple)"""
+    parent_path = '/'.join(path.strip('/').split('/')[:-1])
+    redirect_response = redirect('s3app:browser', path=parent_path) if parent_path else redirect('s3app:browser')
 
-        return response
+    preset = request.GET.get('compression') or zip_stream.default_preset()
+    if preset not in zip_stream.PRESETS:
+        messages.error(request, f'Неизвестный режим сжатия: {preset}')
+        return redirect_response
 
-    except Exception as e:
-        return JsonResponse({'error': str(e)}, status=500)
+    s3_service = S3Service()
+    try:
+        archive = s3_service.folder_archive(request.user, path)
+    except PermissionDenied as e:
+        messages.error(request, str(e))
+        return redirect_response
+
+    folder_name = os.path.basename(path.strip('/')) or 'folder'
+    return _archive_response(request, s3_service, archive, preset, f"{folder_name}.zip")
+
+
+def _archive_response(request, s3_service, archive, preset, filename):
+    """Ответ с ZIP-архивом: ссылка на готовый архив из кэша или архив, формируемый потоком"""
+    cached_url = s3_service.cached_archive_url(request.user, archive, preset, filename)
+    if cached_url:
+        return redirect(cached_url)
+
+    stream = s3_service.archive_stream(request.user, archive, preset)
+    response = StreamingHttpResponse(stream, content_type='application/zip')
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    # Архив отдается по мере формирования - прокси не должен его буферизовать
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 
 @login_required
@@ -769,53 +826,20 @@ def delete_multiple(request):
     if not file_paths and not folder_paths:
         return JsonResponse({'error': 'No items selected'}, status=400)
 
-    s3_service = S3Service()
-
-    # Счетчики успешных операций
-    deleted_files = 0
-    deleted_folders = 0
-    errors = []
+    if jobs.jobs_enabled():
+        job = jobs.enqueue('delete_multiple', request.user, files=file_paths, folders=folder_paths)
+        return _job_json_response(request, job)
 
-    # Удаляем файлы
-    for file_path in file_paths:
-        try:
-            s3_service.delete_object(request.user, file_path)
-            deleted_files += 1
-
-            # Логируем действие
-            S3ActionLog.objects.create(
-                user=request.user,
-                action='delete',
-                path=file_path,
-                details=f'Deleted in bulk operation'
-            )
-        except Exception as e:
-            errors.append(f"Не удалось удалить файл {file_path}: {str(e)}")
+    s3_service = S3Service()
 
-    # Удаляем папки
-    for folder_path in folder_paths:
-        try:
-            s3_service.delete_folder(request.user, folder_path)
-            deleted_folders += 1
-
-            # Логируем действие
-            S3ActionLog.objects.create(
-                user=request.user,
-                action='delete',
-                path=folder_path,
-                details=f'Deleted folder in bulk operation'
+    if _wants_progress_stream(request):
+        return _progress_stream_response(progress.stream_operation(
+            lambda callback: s3_service.delete_multiple(
+                request.user, file_paths, folder_paths, progress_callback=callback
             )
-        except Exception as e:
-            errors.append(f"Не удалось удалить папку {folder_path}: {str(e)}")
+        ))
 
-    response_data = {
-        'success': True,
-        'deleted_files': deleted_files,
-        'deleted_folders': deleted_folders,
-        'errors': errors
-    }
-
-    return JsonResponse(response_data)
+    return JsonResponse(s3_service.delete_multiple(request.user, file_paths, folder_paths))
 
 
 @staff_member_required
@@ -829,15 +853,8 @@ def folders_autocomplete(request):
     s3_service = S3Service()
 
     try:
-        # Получаем все папки
-        all_folders = s3_service.list_all_folders()
-
-        # Фильтруем их по поисковому запросу (регистронезависимо)
-        term_lower = term.lower()
-        matching_folders = [folder for folder in all_folders if term_lower in folder.lower()]
-
-        # Ограничиваем количество результатов
-        matching_folders = matching_folders[:10]
+        # Ищем по закэшированному дереву папок (регистронезависимо)
+        matching_folders = s3_service.search_folders(term, limit=10)
 
         return JsonResponse(matching_folders, safe=False)
 
@@ -847,6 +864,12 @@ def folders_autocomplete(request):
         return JsonResponse([], safe=False)
 
 
+@staff_member_required
+def s3_pool_status(request):
+    """Состояние пула соединений S3 текущего процесса (только для администраторов)"""
+    return JsonResponse({'clients': get_pool_stats()})
+
+
 @staff_member_required
 def trash_view(request):
     """Просмотр корзины (только для администраторов)"""
@@ -860,9 +883,15 @@ def trash_view(request):
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
 
+    # Итоги считаются по записям корзины, без обращений к S3
+    totals = TrashItem.objects.aggregate(
+        count=Count('id'), objects=Sum('object_count'), size=Sum('original_size')
+    )
+
     context = {
         'page_obj': page_obj,
         'trash_items': page_obj,  # Для совместимости с шаблоном
+        'totals': totals,
     }
 
     return render(request, 'trash.html', context)
@@ -870,6 +899,10 @@ def trash_view(request):
 @staff_member_required
 def restore_from_trash(request, item_id):
     """Восстановление элемента из корзины (только для администраторов)"""
+    if jobs.jobs_enabled():
+        job = jobs.enqueue('restore_from_trash', request.user, item_id=item_id)
+        return _job_enqueued_response(request, job, redirect('s3app:trash'))
+
     s3_service = S3Service()
 
     # Восстанавливаем элемент
@@ -885,6 +918,10 @@ def restore_from_trash(request, item_id):
 @staff_member_required
 def delete_from_trash(request, item_id):
     """Окончательное удаление элемента из корзины (только для администраторов)"""
+    if jobs.jobs_enabled():
+        job = jobs.enqueue('delete_from_trash', request.user, item_id=item_id)
+        return _job_enqueued_response(request, job, redirect('s3app:trash'))
+
     s3_service = S3Service()
 
     # Удаляем элемент из корзины
@@ -904,6 +941,10 @@ def empty_trash(request):
         messages.error(request, "Метод не поддерживается")
         return redirect('s3app:trash')
 
+    if jobs.jobs_enabled():
+        job = jobs.enqueue('empty_trash', request.user)
+        return _job_enqueued_response(request, job, redirect('s3app:trash'))
+
     s3_service = S3Service()
 
     # Очищаем корзину
@@ -923,6 +964,10 @@ def cleanup_expired_trash(request):
         messages.error(request, "Метод не поддерживается")
         return redirect('s3app:trash')
 
+    if jobs.jobs_enabled():
+        job = jobs.enqueue('cleanup_expired_trash', request.user)
+        return _job_enqueued_response(request, job, redirect('s3app:trash'))
+
     s3_service = S3Service()
 
     # Очищаем элементы с истекшим сроком хранения
@@ -935,6 +980,76 @@ def cleanup_expired_trash(request):
 
     return redirect('s3app:trash')
 
+def _job_enqueued_response(request, job, response):
+    """Ответ на постановку задачи в очередь: JSON для AJAX-запросов, иначе сообщение и переход"""
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        return JsonResponse({
+            'job_id': job.id,
+            'status_url': reverse('s3app:job_status', args=[job.id]),
+        }, status=202)
+
+    messages.info(request, f'Операция "{job.get_job_type_display()}" поставлена в очередь (задача #{job.id})')
+    return response
+
+
+def _job_json_response(request, job):
+    """Ответ JSON-обработчика на постановку задачи в очередь: поток прогресса задачи или номер задачи"""
+    if _wants_progress_stream(request):
+        return _job_stream_response(job)
+    return JsonResponse({
+        'success': True,
+        'message': f'Операция "{job.get_job_type_display()}" поставлена в очередь (задача #{job.id})',
+        'job_id': job.id,
+        'status_url': reverse('s3app:job_status', args=[job.id]),
+    }, status=202)
+
+
+def _wants_progress_stream(request):
+    """Запрошен ли прогресс операции потоком NDJSON"""
+    return 'application/x-ndjson' in request.headers.get('Accept', '')
+
+
+def _progress_stream_response(events):
+    """Потоковый ответ с событиями прогресса (NDJSON)"""
+    response = StreamingHttpResponse(events, content_type='application/x-ndjson; charset=utf-8')
+    response['Cache-Control'] = 'no-cache'
+    # Отключаем буферизацию ответа в nginx, иначе события придут одним блоком в конце
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _job_stream_response(job):
+    return _progress_stream_response(
+        progress.stream_job(job, status_url=reverse('s3app:job_status', args=[job.id]))
+    )
+
+
+def _get_user_job(request, job_id):
+    """Фоновая задача, доступная автору задачи и администраторам, или None"""
+    job = get_object_or_404(BackgroundJob, id=job_id)
+    if job.user_id != request.user.id and not request.user.is_staff:
+        return None
+    return job
+
+
+@login_required
+def job_status(request, job_id):
+    """Состояние фоновой задачи (доступно автору задачи и администраторам)"""
+    job = _get_user_job(request, job_id)
+    if job is None:
+        return JsonResponse({'error': 'Задача не найдена'}, status=404)
+    return JsonResponse(jobs.job_to_dict(job))
+
+
+@login_required
+def job_progress_stream(request, job_id):
+    """Поток прогресса фоновой задачи (NDJSON); долгую задачу клиент дальше опрашивает через job_status"""
+    job = _get_user_job(request, job_id)
+    if job is None:
+        return JsonResponse({'error': 'Задача не найдена'}, status=404)
+    return _job_stream_response(job)
+
+
 def _get_breadcrumbs(path):
     """Вспомогательная функция для формирования хлебных крошек"""
     if not path:
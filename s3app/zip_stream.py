@@ -0,0 +1,160 @@
+"""
+Потоковая запись ZIP-архива без временного файла.
+
+Архив пишется zipfile в несохраняемый (без seek) буфер, поэтому заголовки
+записей идут с дескрипторами данных (размер и CRC после содержимого), а
+готовые байты отдаются генератором по мере записи - в памяти находится
+не больше одного блока данных. Для записей больше 4 ГБ и архивов больше
+4 ГБ автоматически используется ZIP64.
+
+Элемент архива - словарь:
+    'name': имя внутри архива,
+    'size': размер содержимого (если известен; нужен для выбора ZIP64),
+    'last_modified': datetime изменения (необязательно),
+    'compression': 'stored', 'deflated' или 'auto' (по умолчанию),
+    'chunks': итерируемый набор блоков bytes.
+
+Сжатие выбирается для каждого элемента: уже сжатые форматы сохраняются без
+сжатия ('stored'), для 'auto' по первому блоку оценивается энтропия данных -
+почти случайные данные deflate не уменьшит. Уровень сжатия задает пресет
+(PRESETS): fast, balanced или max.
+"""
+import collections
+import io
+import itertools
+import math
+import time
+import zipfile
+
+from django.conf import settings
+
+# Пресеты сжатия: уровень deflate и проверять ли энтропию элементов 'auto'
+PRESETS = {
+    'fast': {'compresslevel': 1, 'probe': True},
+    'balanced': {'compresslevel': 6, 'probe': True},
+    'max': {'compresslevel': 9, 'probe': False},
+}
+
+# Размер начала элемента, по которому оценивается энтропия
+ENTROPY_SAMPLE_SIZE = 64 * 1024
+
+
+def _chunk_size():
+    return getattr(settings, 'S3_ARCHIVE_CHUNK_SIZE', 1024 * 1024)
+
+
+def _entropy_threshold():
+    return getattr(settings, 'S3_ARCHIVE_ENTROPY_THRESHOLD', 7.5)
+
+
+def default_preset():
+    return getattr(settings, 'S3_ARCHIVE_COMPRESSION_PRESET', 'balanced')
+
+
+def entropy(sample):
+    """Энтропия Шеннона данных в битах на байт (0 - однородные данные, 8 - случайные)"""
+    if not sample:
+        return 0.0
+    total = len(sample)
+    return -sum(count / total * math.log2(count / total) for count in collections.Counter(sample).values())
+
+
+def _select_compression(member, chunks, probe):
+    """Метод сжатия элемента и его блоки (первый блок прочитан для оценки энтропии)"""
+    compression = member.get('compression', 'auto')
+    if compression == 'stored':
+        return zipfile.ZIP_STORED, chunks
+    if compression == 'deflated' or not probe:
+        return zipfile.ZIP_DEFLATED, chunks
+
+    chunks = iter(chunks)
+    first = next(chunks, b'')
+    chunks = itertools.chain([first], chunks)
+    if entropy(first[:ENTROPY_SAMPLE_SIZE]) >= _entropy_threshold():
+        return zipfile.ZIP_STORED, chunks
+    return zipfile.ZIP_DEFLATED, chunks
+
+
+class _StreamSink(io.RawIOBase):
+    """Буфер вывода без seek: zipfile пишет в него, генератор забирает записанное"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._buffered = 0
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._buffered += len(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    @property
+    def buffered(self):
+        return self._buffered
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        self._buffered = 0
+        return data
+
+
+def _set_compress_level(info, level):
+    """Задает уровень сжатия элемента: ZipFile.open не применяет к переданному ZipInfo
+    уровень сжатия архива. С Python 3.13 атрибут называется compress_level,
+    в более ранних версиях - _compresslevel."""
+    if hasattr(info, 'compress_level'):
+        info.compress_level = level
+    else:
+        info._compresslevel = level
+
+
+def _date_time(last_modified):
+    """Время изменения в формате ZipInfo (формат ZIP не поддерживает даты до 1980 года)"""
+    if last_modified is None:
+        return time.localtime()[:6]
+    return max(last_modified.timetuple()[:6], (1980, 1, 1, 0, 0, 0))
+
+
+def stream_zip(members, preset=None):
+    """Пишет элементы в ZIP-архив и отдает его по частям.
+
+    Args:
+        members: итерируемый набор элементов архива (см. описание модуля); может быть генератором
+        preset: пресет сжатия из PRESETS (по умолчанию S3_ARCHIVE_COMPRESSION_PRESET)
+
+    Yields:
+        bytes: очередная часть архива
+    """
+    options = PRESETS[preset or default_preset()]
+    chunk_size = _chunk_size()
+    sink = _StreamSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED,
+                         compresslevel=options['compresslevel']) as archive:
+        for member in members:
+            compression, chunks = _select_compression(member, member['chunks'], options['probe'])
+            info = zipfile.ZipInfo(member['name'], date_time=_date_time(member.get('last_modified')))
+            info.compress_type = compression
+            if compression == zipfile.ZIP_DEFLATED:
+                _set_compress_level(info, options['compresslevel'])
+            info.file_size = member.get('size') or 0
+            # При неизвестном размере заголовок ZIP64 пишется всегда: содержимое может оказаться больше 4 ГБ
+            force_zip64 = member.get('size') is None
+
+            with archive.open(info, 'w', force_zip64=force_zip64) as entry:
+                for chunk in chunks:
+                    entry.write(chunk)
+                    if sink.buffered >= chunk_size:
+                        yield sink.drain()
+            if sink.buffered:
+                yield sink.drain()
+    yield sink.drain()
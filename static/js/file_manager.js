@@ -1,6 +1,172 @@
 /**
  * Скрипт управления множественным выбором файлов
  */
+
+/**
+ * Чтение потока прогресса длительной операции (NDJSON: одно JSON-событие на строку).
+ * onEvent вызывается для каждого события; возвращает Promise с завершающим
+ * событием (done или failed). Обычный JSON-ответ (например, ошибка валидации)
+ * возвращается как событие done/failed. Если сервер закрыл поток событием poll
+ * или вернул номер поставленной в очередь задачи, состояние задачи
+ * запрашивается по status_url до ее завершения.
+ */
+async function readProgressStream(response, onEvent) {
+    const contentType = response.headers.get('Content-Type') || '';
+    if (!contentType.includes('application/x-ndjson')) {
+        const data = await response.json();
+        if (!response.ok || data.error) {
+            return {event: 'failed', error: data.error || 'Ошибка при выполнении операции'};
+        }
+        if (response.status === 202 && data.status_url) {
+            onEvent({event: 'job', job_id: data.job_id, status: 'pending', status_url: data.status_url});
+            return pollJobStatus(data.status_url, onEvent);
+        }
+        return {event: 'done', result: data};
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let lastEvent = null;
+
+    while (true) {
+        const {value, done} = await reader.read();
+        if (value) {
+            buffer += decoder.decode(value, {stream: true});
+        }
+
+        let newline;
+        while ((newline = buffer.indexOf('\n')) >= 0) {
+            const line = buffer.slice(0, newline).trim();
+            buffer = buffer.slice(newline + 1);
+            if (!line) {
+                continue;
+            }
+            const event = JSON.parse(line);
+            onEvent(event);
+            if (event.event === 'done' || event.event === 'failed' || event.event === 'poll') {
+                lastEvent = event;
+            }
+        }
+
+        if (done) {
+            break;
+        }
+    }
+
+    if (!lastEvent) {
+        throw new Error('Соединение прервано до завершения операции');
+    }
+    if (lastEvent.event === 'poll') {
+        return pollJobStatus(lastEvent.status_url, onEvent);
+    }
+    return lastEvent;
+}
+
+/**
+ * Опрос состояния фоновой задачи (JSON job_status) до ее завершения.
+ * Прогресс и новые ошибки передаются в onEvent теми же событиями, что и в потоке.
+ */
+async function pollJobStatus(statusUrl, onEvent, interval = 2000) {
+    let sentErrors = 0;
+    while (true) {
+        const response = await fetch(statusUrl, {credentials: 'same-origin'});
+        if (!response.ok) {
+            throw new Error('Не удалось получить состояние операции');
+        }
+        const job = await response.json();
+
+        const progress = job.progress || {};
+        const errorMessages = progress.error_messages || [];
+        errorMessages.slice(sentErrors).forEach(message => onEvent({event: 'error', message: message}));
+        sentErrors = errorMessages.length;
+        if (Object.keys(progress).length > 0) {
+            onEvent(Object.assign({}, progress, {event: 'progress'}));
+        }
+
+        if (job.status === 'succeeded') {
+            return {event: 'done', result: job.result};
+        }
+        if (job.status === 'failed') {
+            return {event: 'failed', error: job.error, result: job.result};
+        }
+        onEvent({event: 'status', status: job.status});
+        await new Promise(resolve => setTimeout(resolve, interval));
+    }
+}
+
+// Форматирование размера в байтах
+function formatBytes(bytes) {
+    const units = ['Б', 'КБ', 'МБ', 'ГБ', 'ТБ'];
+    let value = bytes || 0;
+    let unit = 0;
+    while (value >= 1024 && unit < units.length - 1) {
+        value /= 1024;
+        unit++;
+    }
+    return `${value.toFixed(unit === 0 ? 0 : 1)} ${units[unit]}`;
+}
+
+/**
+ * Панель прогресса длительной операции (в правом нижнем углу страницы).
+ * Принимает события потока прогресса через update(event).
+ */
+function createProgressPanel(title) {
+    const panel = document.createElement('div');
+    panel.className = 'card shadow position-fixed bottom-0 end-0 m-3';
+    panel.style.width = '360px';
+    panel.style.zIndex = '1080';
+    panel.innerHTML = `
+        <div class="card-body">
+            <h6 class="card-title"></h6>
+            <div class="progress mb-2">
+                <div class="progress-bar progress-bar-striped progress-bar-animated" role="progressbar" style="width: 100%"></div>
+            </div>
+            <div class="small text-muted progress-status">Подготовка...</div>
+            <ul class="small text-danger mb-0 mt-2 ps-3 progress-errors"></ul>
+        </div>`;
+    panel.querySelector('.card-title').textContent = title;
+    document.body.appendChild(panel);
+
+    const bar = panel.querySelector('.progress-bar');
+    const status = panel.querySelector('.progress-status');
+    const errors = panel.querySelector('.progress-errors');
+
+    return {
+        update(event) {
+            if (event.event === 'job' || (event.event === 'status' && event.status === 'pending')) {
+                status.textContent = 'Операция в очереди...';
+            } else if (event.event === 'progress') {
+                if (event.items_total) {
+                    const percent = Math.round(event.items_done * 100 / event.items_total);
+                    bar.classList.remove('progress-bar-animated', 'progress-bar-striped');
+                    bar.style.width = `${Math.max(percent, 2)}%`;
+                }
+                let text = `Элементов: ${event.items_done || 0} из ${event.items_total || '?'}, объектов: ${event.objects || 0}`;
+                if (event.bytes) {
+                    text += `, ${formatBytes(event.bytes)}`;
+                }
+                if (event.bytes_per_second) {
+                    text += ` (${formatBytes(event.bytes_per_second)}/с)`;
+                } else if (event.objects_per_second) {
+                    text += ` (${event.objects_per_second} объектов/с)`;
+                }
+                if (event.errors) {
+                    text += `, ошибок: ${event.errors}`;
+                }
+                status.textContent = text;
+            } else if (event.event === 'error') {
+                const item = document.createElement('li');
+                item.textContent = event.message;
+                errors.appendChild(item);
+            }
+        },
+        close() {
+            panel.remove();
+        }
+    };
+}
+
 document.addEventListener('DOMContentLoaded', function() {
     const multiActionPanel = document.getElementById('multiActionPanel');
     const selectedCountEl = document.getElementById('selectedCount');
@@ -118,40 +284,30 @@ document.addEventListener('DOMContentLoaded', function() {
                 return;
             }
 
-            // Для множественного выбора - запрос на создание архива
-            const formData = new FormData();
+            // Для множественного выбора - архив формируется сервером потоком,
+            // поэтому отправляем обычную форму: браузер сохраняет ответ сразу на диск
+            const form = document.createElement('form');
+            form.method = 'POST';
+            form.action = '/download-multiple/';
+            form.style.display = 'none';
+
+            const csrfInput = document.createElement('input');
+            csrfInput.type = 'hidden';
+            csrfInput.name = 'csrfmiddlewaretoken';
+            csrfInput.value = getCsrfToken();
+            form.appendChild(csrfInput);
+
             fileItems.forEach(path => {
-                formData.append('files[]', path);
+                const input = document.createElement('input');
+                input.type = 'hidden';
+                input.name = 'files[]';
+                input.value = path;
+                form.appendChild(input);
             });
 
-            // Здесь должен быть запрос к серверу для создания ZIP-архива
-            fetch('/download-multiple/', {
-                method: 'POST',
-                body: formData,
-                headers: {
-                    'X-CSRFToken': getCsrfToken()
-                }
-            })
-            .then(response => {
-                if (response.ok) {
-                    return response.blob();
-                }
-                throw new Error('Ошибка при создании архива');
-            })
-            .then(blob => {
-                // Создание ссылки для скачивания архива
-                const url = window.URL.createObjectURL(blob);
-                const a = document.createElement('a');
-                a.style.display = 'none';
-                a.href = url;
-                a.download = 'files.zip';
-                document.body.appendChild(a);
-                a.click();
-                window.URL.revokeObjectURL(url);
-            })
-            .catch(error => {
-                alert(error.message);
-            });
+            document.body.appendChild(form);
+            form.submit();
+            document.body.removeChild(form);
         } else {
             alert('Выберите хотя бы один файл для скачивания');
         }
@@ -183,23 +339,34 @@ document.addEventListener('DOMContentLoaded', function() {
                 formData.append(`${type}s[]`, path);
             });
 
-            // Здесь должен быть запрос к серверу для удаления выбранных элементов
+            const progressPanel = createProgressPanel('Удаление выбранных элементов');
+            deleteSelectedBtn.disabled = true;
+
+            // Сервер отдает прогресс потоком, пока элементы перемещаются в корзину
             fetch('/delete-multiple/', {
                 method: 'POST',
                 body: formData,
                 headers: {
-                    'X-CSRFToken': getCsrfToken()
+                    'X-CSRFToken': getCsrfToken(),
+                    'Accept': 'application/x-ndjson'
                 }
             })
-            .then(response => {
-                if (response.ok) {
-                    // Перезагрузка страницы после успешного удаления
-                    window.location.reload();
-                } else {
-                    throw new Error('Ошибка при удалении элементов');
+            .then(response => readProgressStream(response, event => progressPanel.update(event)))
+            .then(finalEvent => {
+                if (finalEvent.event === 'failed') {
+                    throw new Error(finalEvent.error || 'Ошибка при удалении элементов');
+                }
+
+                const result = finalEvent.result;
+                if (result.errors && result.errors.length > 0) {
+                    alert('Не удалось удалить некоторые элементы:\n- ' + result.errors.join('\n- '));
                 }
+                // Перезагрузка страницы после удаления
+                window.location.reload();
             })
             .catch(error => {
+                progressPanel.close();
+                deleteSelectedBtn.disabled = false;
                 alert(error.message);
             });
         }